@@ -1,11 +1,30 @@
 from fastapi import FastAPI, Form, HTTPException
-from fastapi import FastAPI, HTTPException, Request, Form
+from fastapi import FastAPI, HTTPException, Request, Form, UploadFile, File, Depends, Header
 import uvicorn
 import stripe
 import os
-from typing import Optional
-from utils.email_sender import LicenseEmailSender
-from utils.db_utils import get_license_repository, LicenseRepository
+import io
+import csv
+import json
+import math
+import hmac
+from typing import Optional, List
+from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from utils.email_outbox import get_email_outbox_worker
+from utils.stripe_events import get_stripe_event_processor
+from utils.stripe_gateway import get_stripe_gateway, StripeUnavailableError
+from utils.payment_sessions import get_payment_session_store
+from utils.cache import MISSING
+from utils.bulk_import import BulkUserImporter
+from utils.admin_stats import get_admin_stats
+from utils.user_search import get_user_search, UserSearchUnavailableError
+from utils.metrics import get_metrics, MetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from utils.query_profiler import QueryProfilerSettings, QueryProfilerMiddleware
+from utils.rate_limiter import get_rate_limiter, RateLimitMiddleware
+from utils.admission_control import get_admission_controller, AdmissionControlMiddleware
+from utils.db_utils import get_license_repository, get_async_license_repository, LicenseRepository, SQLITE_MAX_PARAMETERS
 from datetime import datetime
 import logging
 from fastapi.middleware.cors import CORSMiddleware
@@ -19,6 +38,12 @@ app = FastAPI(title="VisionPay License Server", version="1.0.0")
 origins = [
     "http://localhost:3000",  # Frontend dev server
 ]
+admission_controller = get_admission_controller()
+rate_limiter = get_rate_limiter()
+# Added before CORS so they run inside it and 429/503 responses still carry CORS headers.
+# Rate limiting runs first, so limited clients never take an admission slot.
+app.add_middleware(AdmissionControlMiddleware, controller=admission_controller)
+app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,  # Frontend URL
@@ -26,10 +51,26 @@ app.add_middleware(
     allow_methods=["*"],  # or specify ["POST", "GET", ...]
     allow_headers=["*"],  # or specify custom headers if needed
 )
+query_profiler_settings = QueryProfilerSettings()
+if query_profiler_settings.enabled:
+    # Debug only: adds X-DB-Queries / X-DB-Time headers and logs redundant or slow queries
+    app.add_middleware(QueryProfilerMiddleware, settings=query_profiler_settings)
+metrics = get_metrics()
+if metrics.enabled:
+    # Added last so it wraps CORS as well and times the whole request
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
 # Configure Stripe
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
 MISTRAL_API_KEY = os.getenv('MISTRAL_API_KEY')
+# Required in the X-Admin-API-Key header by /admin/* and the license listing and export
+ADMIN_API_KEY = os.getenv('ADMIN_API_KEY')
+CHECK_LICENSES_MAX_CODES = int(os.getenv('CHECK_LICENSES_MAX_CODES', '10000'))
+CHECK_LICENSES_STREAM_THRESHOLD = int(os.getenv('CHECK_LICENSES_STREAM_THRESHOLD', '1000'))
+LICENSES_PAGE_MAX_LIMIT = int(os.getenv('LICENSES_PAGE_MAX_LIMIT', '1000'))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+LICENSE_EXPORT_FIELDS = ['id', 'first_name', 'last_name', 'company_name', 'email', 'license_code',
+                         'license_issued_at', 'created_at', 'updated_at']
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,6 +78,37 @@ logger = logging.getLogger(__name__)
 
 # Initialize database repository
 license_repo = get_license_repository()
+async_license_repo = get_async_license_repository(license_repo)
+email_outbox = get_email_outbox_worker()
+stripe_events = get_stripe_event_processor()
+stripe_events.on_license_email = email_outbox.notify
+stripe_gateway = get_stripe_gateway()
+payment_sessions = get_payment_session_store()
+admin_stats = get_admin_stats()
+user_search = get_user_search()
+
+
+def require_admin(x_admin_api_key: Optional[str] = Header(None)):
+    """Reject the request unless it carries the admin API key."""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=503, detail="Admin endpoints are not configured")
+    if not x_admin_api_key or not hmac.compare_digest(x_admin_api_key.encode('utf-8'),
+                                                      ADMIN_API_KEY.encode('utf-8')):
+        raise HTTPException(status_code=401, detail="Invalid admin API key")
+
+
+@app.on_event("startup")
+async def start_background_workers():
+    license_repo.code_allocator.start()
+    email_outbox.start()
+    stripe_events.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    stripe_events.stop()
+    email_outbox.stop()
+    license_repo.code_allocator.stop()
 
 
 @app.get("/")
@@ -44,12 +116,121 @@ async def root():
     return {"message": "VisionPay License Server is running"}
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Request, database, SMTP and Stripe metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Get counters for the license lookup cache, code guard, license snapshot, license index and payment session cache."""
+    return {
+        "license_cache": license_repo.cache.stats(),
+        "license_code_guard": license_repo.code_guard.stats(),
+        "license_snapshot": license_repo.snapshot.stats(),
+        "license_index": license_repo.code_index.stats(),
+        "payment_sessions": payment_sessions.stats()
+    }
+
+
+@app.get("/admin/license-code-pool", dependencies=[Depends(require_admin)])
+async def license_code_pool_stats():
+    """Get the depth of the pre-generated license code pool and allocation counters."""
+    return await run_in_threadpool(license_repo.code_allocator.stats)
+
+
+@app.get("/admin/email-outbox", dependencies=[Depends(require_admin)])
+async def email_outbox_stats():
+    """Get queued license email counts per status and worker counters."""
+    return await run_in_threadpool(email_outbox.stats)
+
+
+@app.post("/admin/email-outbox/retry-dead", dependencies=[Depends(require_admin)])
+async def retry_dead_emails():
+    """Requeue every license email that ran out of delivery attempts."""
+    return {"requeued": await run_in_threadpool(email_outbox.retry_dead_letters)}
+
+
+@app.get("/admin/stripe-events", dependencies=[Depends(require_admin)])
+async def stripe_event_stats(status: Optional[str] = None, limit: int = 50):
+    """Get Stripe event counts per status and the most recent events."""
+    stats = await run_in_threadpool(stripe_events.stats)
+    stats["events"] = await run_in_threadpool(stripe_events.list_events, status, min(limit, 500))
+    return stats
+
+
+@app.post("/admin/stripe-events/replay-failed", dependencies=[Depends(require_admin)])
+async def replay_failed_stripe_events():
+    """Queue every failed Stripe event to be applied again."""
+    replayed = await run_in_threadpool(stripe_events.replay_failed)
+    return {"replayed": replayed}
+
+
+@app.post("/admin/stripe-events/{event_id}/replay", dependencies=[Depends(require_admin)])
+async def replay_stripe_event(event_id: str):
+    """Queue one Stripe event to be applied again."""
+    if not await run_in_threadpool(stripe_events.replay, event_id):
+        raise HTTPException(status_code=404, detail="Stripe event not found")
+    return {"replayed": event_id}
+
+
+@app.get("/admin/stripe-gateway", dependencies=[Depends(require_admin)])
+async def stripe_gateway_stats():
+    """Get Stripe call latency and circuit breaker state."""
+    return stripe_gateway.stats()
+
+
+@app.get("/admin/rate-limiter", dependencies=[Depends(require_admin)])
+async def rate_limiter_stats():
+    """Get rate limit settings and how many requests were allowed and limited."""
+    return rate_limiter.stats()
+
+
+@app.get("/admin/admission", dependencies=[Depends(require_admin)])
+async def admission_stats():
+    """Get in-flight requests, queue depths and shed counts per route."""
+    return admission_controller.stats()
+
+
+@app.get("/admin/stats", dependencies=[Depends(require_admin)])
+async def get_admin_stats_snapshot(days: int = 30, top_companies: int = 10):
+    """Get user totals, licenses issued per day and users per company from the counter tables."""
+    if not 1 <= days <= 366 or not 1 <= top_companies <= 100:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366 and top_companies between 1 and 100")
+    return await run_in_threadpool(admin_stats.snapshot, days, top_companies)
+
+
+@app.post("/admin/stats/rebuild", dependencies=[Depends(require_admin)])
+async def rebuild_admin_stats():
+    """Recompute the stats counter tables from the licenses table."""
+    return await run_in_threadpool(admin_stats.rebuild)
+
+
+@app.get("/admin/search", dependencies=[Depends(require_admin)])
+async def search_users(q: str, column: Optional[str] = None, limit: int = 20, offset: int = 0):
+    """Search users by prefixes of their email, names and company, best matches first.
+    Pass next_offset back as offset to get the next page."""
+    if not 1 <= limit <= SEARCH_MAX_LIMIT or offset < 0:
+        raise HTTPException(status_code=400,
+                            detail=f"limit must be between 1 and {SEARCH_MAX_LIMIT} and offset at least 0")
+    try:
+        results, next_offset = await run_in_threadpool(user_search.search, q, column, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UserSearchUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error searching users for {q!r}: {e}")
+        raise HTTPException(status_code=500, detail="Error searching users")
+    return {"results": results, "next_offset": next_offset}
+
+
 @app.get("/check_license/{license_code}")
 async def check_license(license_code: str):
     """Check if a license code is valid."""
     try:
-        license_info = license_repo.get_license_by_code(license_code)
-        if license_info:
+        if await async_license_repo.license_code_exists(license_code):
             return {"valid": True}
         else:
             return {"valid": False}
@@ -58,13 +239,86 @@ async def check_license(license_code: str):
         raise HTTPException(status_code=500, detail="Error checking license")
 
 
+class LicenseBatchRequest(BaseModel):
+    license_codes: List[str]
+
+
+def stream_license_validity(license_codes: List[str]):
+    """Yield a {"results": {code: valid}} JSON document one query chunk at a time."""
+    yield '{"results": {'
+    first = True
+    for start in range(0, len(license_codes), SQLITE_MAX_PARAMETERS):
+        chunk = license_codes[start:start + SQLITE_MAX_PARAMETERS]
+        valid = license_repo.license_codes_exist(chunk)
+        parts = [f"{json.dumps(code)}: {'true' if valid[code] else 'false'}" for code in chunk]
+        if parts:
+            yield ('' if first else ', ') + ', '.join(parts)
+            first = False
+    yield '}}'
+
+
+@app.post("/check_licenses")
+async def check_licenses(batch: LicenseBatchRequest, request: Request):
+    """Check whether each license code in a batch is valid."""
+    license_codes = list(dict.fromkeys(batch.license_codes))
+    if len(license_codes) > CHECK_LICENSES_MAX_CODES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many license codes, at most {CHECK_LICENSES_MAX_CODES} per request")
+    retry_after = rate_limiter.check_codes(request.scope, len(license_codes))
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many requests",
+                            headers={"Retry-After": str(math.ceil(retry_after))})
+
+    if len(license_codes) > CHECK_LICENSES_STREAM_THRESHOLD:
+        return StreamingResponse(
+            stream_license_validity(license_codes), media_type="application/json")
+
+    try:
+        return {"results": await async_license_repo.license_codes_exist(license_codes)}
+    except Exception as e:
+        logger.error(f"Error checking {len(license_codes)} licenses: {e}")
+        raise HTTPException(status_code=500, detail="Error checking licenses")
+
+
+@app.get("/license-token/{license_code}")
+async def get_license_token(license_code: str):
+    """Issue a signed token for a valid license code.
+    Not authenticated: anyone who knows a code gets a token for it, so the route is rate limited.
+    Tokens are HMAC signed, so only /verify-token can verify them."""
+    if not license_repo.token_signer.enabled:
+        raise HTTPException(status_code=503, detail="License tokens are not configured")
+    license_info = await async_license_repo.get_license_by_code(license_code)
+    if not license_info:
+        raise HTTPException(status_code=404, detail="License key not found")
+    return {
+        "license_token": async_license_repo.issue_license_token(
+            license_info['id'], license_info['company_name'])
+    }
+
+
+@app.post("/verify-token")
+async def verify_token(token: str = Form(...)):
+    """Verify a signed license token without touching the database.
+    The only way to verify a token: checking it needs the server's signing secret."""
+    claims = license_repo.token_signer.verify(token)
+    if not claims:
+        return {"valid": False}
+    return {
+        "valid": True,
+        "license_id": claims['lid'],
+        "company_name": claims['cmp'],
+        "issued_at": datetime.utcfromtimestamp(claims['iat']).isoformat(),
+        "expires_at": datetime.utcfromtimestamp(claims['exp']).isoformat()
+    }
+
+
 @app.get("/api-key/by-email/{email}")
 async def get_api_key_by_email(email: str):
     """Get API key by email address."""
     try:
         # Check if user exists
-        user_info = license_repo.get_license_by_email(email)
-        if user_info:
+        if await async_license_repo.user_exists(email):
             return {"email": email, "api_key": MISTRAL_API_KEY}
         else:
             raise HTTPException(
@@ -79,8 +333,7 @@ async def get_api_key_by_license(license_key: str):
     """Get API key by license key."""
     try:
         # Check if license exists
-        license_info = license_repo.get_license_by_code(license_key)
-        if license_info:
+        if await async_license_repo.license_code_exists(license_key):
             return {"api_key": MISTRAL_API_KEY}
         else:
             raise HTTPException(
@@ -100,7 +353,7 @@ async def create_new_account(
 ):
     """Create a new user account with automatic license key generation."""
     try:
-        user_id = license_repo.add_new_user(
+        user_id = await async_license_repo.add_new_user(
             first_name=first_name,
             last_name=last_name,
             company_name=company_name,
@@ -113,11 +366,80 @@ async def create_new_account(
         raise HTTPException(status_code=500, detail="Error creating account")
 
 
+def import_users_csv(upload: UploadFile, mint_license_codes: bool) -> dict:
+    """Stream an uploaded CSV through the bulk importer."""
+    lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    try:
+        return BulkUserImporter(license_repo).import_csv(lines, mint_license_codes=mint_license_codes)
+    finally:
+        lines.detach()
+
+
+@app.post("/admin/import-users", dependencies=[Depends(require_admin)])
+async def import_users(file: UploadFile = File(...), mint_license_codes: bool = Form(False)):
+    """Create accounts in bulk from a CSV with first_name, last_name, company_name and email columns."""
+    try:
+        return await run_in_threadpool(import_users_csv, file, mint_license_codes)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {e}")
+    except Exception as e:
+        logger.error(f"Error importing users from {file.filename}: {e}")
+        raise HTTPException(status_code=500, detail="Error importing users")
+
+
+@app.get("/licenses", dependencies=[Depends(require_admin)])
+async def list_licenses(limit: int = 100, cursor: Optional[str] = None):
+    """List licenses oldest first, one page at a time.
+    Pass the X-Next-Cursor response header back as cursor to get the next page."""
+    if not 1 <= limit <= LICENSES_PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {LICENSES_PAGE_MAX_LIMIT}")
+    try:
+        licenses, next_cursor = await async_license_repo.get_licenses_page(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error listing licenses: {e}")
+        raise HTTPException(status_code=500, detail="Error listing licenses")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return JSONResponse(licenses, headers=headers)
+
+
+def export_licenses_ndjson():
+    """Yield every license as one JSON document per line."""
+    for license_dict in license_repo.iter_licenses():
+        yield json.dumps(license_dict) + "\n"
+
+
+def export_licenses_csv():
+    """Yield every license as CSV, header first."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=LICENSE_EXPORT_FIELDS)
+    writer.writeheader()
+    for count, license_dict in enumerate(license_repo.iter_licenses(), start=1):
+        writer.writerow(license_dict)
+        if count % 1000 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+@app.get("/licenses/export", dependencies=[Depends(require_admin)])
+async def export_licenses(format: str = "ndjson"):
+    """Stream every license as NDJSON or CSV without loading the table into memory."""
+    if format == "ndjson":
+        return StreamingResponse(export_licenses_ndjson(), media_type="application/x-ndjson")
+    if format == "csv":
+        return StreamingResponse(export_licenses_csv(), media_type="text/csv",
+                                 headers={"Content-Disposition": 'attachment; filename="licenses.csv"'})
+    raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+
+
 @app.put("/update-api-key")
 async def update_api_key(email: str = Form(...), new_api_key: str = Form(...)):
     """Update API key for an existing user."""
     try:
-        success = license_repo.update_user_info(
+        success = await async_license_repo.update_user_info(
             email=email,
             mistral_api_key=new_api_key
         )
@@ -135,7 +457,7 @@ async def update_api_key(email: str = Form(...), new_api_key: str = Form(...)):
 async def get_user_info(email: str):
     """Get user information by email."""
     try:
-        user_info = license_repo.get_license_by_email(email)
+        user_info = await async_license_repo.get_license_by_email(email)
         if user_info:
             return user_info
         else:
@@ -151,42 +473,29 @@ async def send_license_email_endpoint(email: str = Form(...)):
     """Create license key and send it via email if user exists."""
     try:
         # First, get user info
-        user_info = license_repo.get_license_by_email(email)
+        user_info = await async_license_repo.get_license_by_email(email)
         logger.info(f"User info for {email}: {user_info}")
         if not user_info:
             raise HTTPException(status_code=404, detail="User not found")
 
-        # Create license key if it doesn't exist
-        if not user_info.get('license_code'):
-            logger.info(f"Creating license key for {email}")
-            license_key = license_repo.create_and_set_license_key(email)
-            if not license_key:
-                logger.error(f"Failed to create license key for {email}")
-                raise HTTPException(
-                    status_code=500, detail="Failed to create license key")
-            logger.info(f"Created license key for {email}: {license_key}")
-        else:
-            license_key = user_info['license_code']
-            logger.info(f"Using existing license key for {email}: {license_key}")
-
-        # Send email
-        email_sender = LicenseEmailSender()
-        success, _ = email_sender.send_license_email(
-            email,
-            user_info['company_name'],
-            license_key
-        )
-
-        if success:
-            logger.info(f"License key sent successfully to {email}: {license_key}")
-            return {
-                "message": "License key sent successfully",
-                "email": email,
-                "license_key": license_key  # Include the license key in the response
-            }
-        else:
+        # Create the license key if needed and queue the email in the same transaction
+        license_key = await async_license_repo.create_and_set_license_key(email, enqueue_email=True)
+        if not license_key:
+            logger.error(f"Failed to create license key for {email}")
             raise HTTPException(
-                status_code=500, detail="Failed to send license email")
+                status_code=500, detail="Failed to create license key")
+        email_outbox.notify()
+
+        logger.info(f"License key email queued for {email}: {license_key}")
+        response = {
+            "message": "License key email queued for delivery",
+            "email": email,
+            "license_key": license_key  # Include the license key in the response
+        }
+        license_token = async_license_repo.issue_license_token(user_info['id'], user_info['company_name'])
+        if license_token:
+            response["license_token"] = license_token
+        return response
 
     except HTTPException:
         raise
@@ -235,7 +544,7 @@ async def create_checkout_session(
             }
 
         # Check if user exists (they should, since BasicInfoStep creates them)
-        user_info = license_repo.get_license_by_email(user_email)
+        user_info = await async_license_repo.get_license_by_email(user_email)
         if not user_info:
             logger.error(f"User not found: {user_email}")
             raise HTTPException(status_code=404, detail="User not found. Please complete the registration first.")
@@ -246,7 +555,7 @@ async def create_checkout_session(
         # Create checkout session
         try:
             logger.info("Creating Stripe checkout session...")
-            session = stripe.checkout.Session.create(
+            session = await stripe_gateway.create_checkout_session(
                 payment_method_types=['card'],
                 mode='subscription',
                 line_items=[{
@@ -268,6 +577,9 @@ async def create_checkout_session(
             )
             logger.info(f"Stripe session created: {session.id}")
             return {"session_id": session.id}
+        except StripeUnavailableError as e:
+            logger.error(f"Stripe unavailable: {e}")
+            raise HTTPException(status_code=503, detail=str(e))
         except stripe.error.StripeError as stripe_error:
             logger.error(f"Stripe error: {stripe_error}")
             error_message = str(stripe_error)
@@ -299,47 +611,16 @@ async def stripe_webhook(request: Request):
         logger.error(f"Invalid signature: {e}")
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    # Handle the checkout.session.completed event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-
-        # Extract user data from metadata
-        user_email = session['metadata']['user_email']
-        company_name = session['metadata']['company_name']
-
-        logger.info(f"Processing successful payment for {user_email}")
-
-        # Get user info and create license key after successful payment
-        user_info = license_repo.get_license_by_email(user_email)
-        if user_info and not user_info.get('license_code'):
-            license_key = license_repo.create_and_set_license_key(user_email)
-        elif user_info:
-            license_key = user_info.get('license_code')
-        else:
-            logger.error(f"User not found during webhook processing: {user_email}")
-            license_key = None
-
-        if license_key:
-            # Send license key email after successful payment
-            logger.info(f"Attempting to send license key email to {user_email} for company {company_name} with license key {license_key}")
-            email_sender = LicenseEmailSender()
-            try:
-                success, sent_license_key = email_sender.send_license_email(
-                    user_email, company_name, license_key)
-                if success:
-                    logger.info(f"License key {license_key} created and emailed to {user_email}")
-                else:
-                    logger.error(f"Failed to send license email to {user_email}")
-            except Exception as e:
-                logger.error(f"Exception while sending license email: {e}")
-        else:
-            logger.error(f"Failed to create license key for {user_email}")
-
-    elif event['type'] == 'customer.subscription.deleted':
-        # Handle subscription cancellation
-        subscription = event['data']['object']
-        customer_id = subscription['customer']
-        logger.info(f"Subscription cancelled for customer {customer_id}")
+    # Record the event and acknowledge right away; it is applied in the background
+    try:
+        is_new = await run_in_threadpool(stripe_events.record, event['id'], event['type'], payload.decode('utf-8'))
+    except Exception as e:
+        logger.error(f"Failed to record Stripe event {event['id']}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to record event")
+    if is_new:
+        stripe_events.notify()
+    else:
+        logger.info(f"Stripe event {event['id']} was already received")
 
     return {"status": "success"}
 
@@ -348,13 +629,62 @@ async def stripe_webhook(request: Request):
 async def user_exists(email: str):
     """Check if a user with the given email already exists."""
     try:
-        exists = license_repo.user_exists(email)
+        exists = await async_license_repo.user_exists(email)
         return {"exists": exists}
     except Exception as e:
         logger.error(f"Error checking if user exists for {email}: {e}")
         raise HTTPException(status_code=500, detail="Error checking user existence")
 
 
+async def complete_payment(session_id: str) -> dict:
+    """Validate a checkout session with Stripe, create the license key and queue its email."""
+    # Retrieve the session from Stripe
+    try:
+        session = await stripe_gateway.retrieve_checkout_session(session_id)
+        logger.info(f"Retrieved Stripe session: {session.id}, status: {session.payment_status}")
+    except StripeUnavailableError as e:
+        logger.error(f"Stripe unavailable: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except stripe.error.StripeError as e:
+        logger.error(f"Error retrieving Stripe session: {e}")
+        raise HTTPException(status_code=400, detail="Invalid session ID")
+
+    # Check if payment was successful
+    if session.payment_status != 'paid':
+        logger.warning(f"Payment not completed for session {session_id}, status: {session.payment_status}")
+        raise HTTPException(status_code=400, detail="Payment not completed")
+
+    # Extract user data from session metadata
+    user_email = session.metadata.get('user_email')
+
+    if not user_email:
+        logger.error(f"No user email found in session metadata for {session_id}")
+        raise HTTPException(status_code=400, detail="User email not found in session")
+
+    logger.info(f"Processing successful payment for {user_email}")
+
+    # Create license key if it doesn't exist, queue the license email with it and record the outcome
+    license_key = await async_license_repo.create_and_set_license_key(
+        user_email, enqueue_email=True, payment_session_id=session_id)
+    if not license_key:
+        # Another worker may have completed the same session first
+        outcome = await run_in_threadpool(payment_sessions.get_outcome, session_id)
+        if outcome:
+            return outcome
+        user_info = await async_license_repo.get_license_by_email(user_email)
+        if not user_info:
+            logger.error(f"User not found: {user_email}")
+            raise HTTPException(status_code=404, detail="User not found")
+        logger.error(f"Failed to create license key for {user_email}")
+        raise HTTPException(status_code=500, detail="Failed to create license key")
+    email_outbox.notify()
+
+    logger.info(f"License key {license_key} created for {user_email}, email queued")
+    outcome = {"email": user_email, "license_code": license_key, "status": "success"}
+    payment_sessions.remember(session_id, outcome)
+    return outcome
+
+
 @app.post("/process-payment-success")
 async def process_payment_success(session_id: str = Form(...)):
     """Process successful payment by validating Stripe session and creating license key."""
@@ -378,74 +708,22 @@ async def process_payment_success(session_id: str = Form(...)):
             else:
                 raise HTTPException(status_code=400, detail="TEST MODE: Invalid session ID. Stripe not configured.")
         
-        # Retrieve the session from Stripe
-        try:
-            session = stripe.checkout.Session.retrieve(session_id)
-            logger.info(f"Retrieved Stripe session: {session.id}, status: {session.payment_status}")
-        except stripe.error.StripeError as e:
-            logger.error(f"Error retrieving Stripe session: {e}")
-            raise HTTPException(status_code=400, detail="Invalid session ID")
-        
-        # Check if payment was successful
-        if session.payment_status != 'paid':
-            logger.warning(f"Payment not completed for session {session_id}, status: {session.payment_status}")
-            raise HTTPException(status_code=400, detail="Payment not completed")
-        
-        # Extract user data from session metadata
-        user_email = session.metadata.get('user_email')
-        company_name = session.metadata.get('company_name')
-        
-        if not user_email:
-            logger.error(f"No user email found in session metadata for {session_id}")
-            raise HTTPException(status_code=400, detail="User email not found in session")
-        
-        logger.info(f"Processing successful payment for {user_email}")
-        
-        # Get user info and create license key
-        user_info = license_repo.get_license_by_email(user_email)
-        if not user_info:
-            logger.error(f"User not found: {user_email}")
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Create license key if it doesn't exist
-        if not user_info.get('license_code'):
-            license_key = license_repo.create_and_set_license_key(user_email)
+        # A completed session is answered from the store, without Stripe or the outbox
+        outcome = payment_sessions.cached_outcome(session_id)
+        if outcome is MISSING:
+            outcome = await run_in_threadpool(payment_sessions.get_outcome, session_id)
+        if outcome is None:
+            # Concurrent calls for the same session share a single completion
+            outcome = await payment_sessions.single_flight.run(session_id, lambda: complete_payment(session_id))
         else:
-            license_key = user_info.get('license_code')
-            
-        if not license_key:
-            logger.error(f"Failed to create license key for {user_email}")
-            raise HTTPException(status_code=500, detail="Failed to create license key")
-        
-        # Send license email
-        email_sender = LicenseEmailSender()
-        try:
-            success, sent_license_key = email_sender.send_license_email(
-                user_email, company_name or user_info['company_name'], license_key)
-            if success:
-                logger.info(f"License key {license_key} created and emailed to {user_email}")
-                return {
-                    "status": "success",
-                    "message": "License key created and sent successfully",
-                    "license_key": license_key,
-                    "email": user_email
-                }
-            else:
-                logger.warning(f"License key created but email failed for {user_email}")
-                return {
-                    "status": "partial_success",
-                    "message": "License key created but email delivery failed",
-                    "license_key": license_key,
-                    "email": user_email
-                }
-        except Exception as email_error:
-            logger.error(f"Exception while sending license email: {email_error}")
-            return {
-                "status": "partial_success",
-                "message": "License key created but email delivery failed",
-                "license_key": license_key,
-                "email": user_email
-            }
+            logger.info(f"Session {session_id} already completed for {outcome['email']}")
+
+        return {
+            "status": outcome["status"],
+            "message": "License key created and email queued for delivery",
+            "license_key": outcome["license_code"],
+            "email": outcome["email"]
+        }
             
     except HTTPException:
         raise
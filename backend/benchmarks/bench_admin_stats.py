@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark the admin stats counter tables.
+
+Compares computing the dashboard figures with COUNT(*) ... GROUP BY scans over
+the licenses table against reading the counter tables, times a full rebuild,
+and measures what maintaining the counters adds to creating an account and
+issuing its license key.
+
+Run with: python benchmarks/bench_admin_stats.py
+"""
+
+import argparse
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from statistics import median
+
+from common import use_temp_database, seed_licenses
+
+
+def time_ms(func, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - started) / repeats * 1000
+
+
+def main(args):
+    from sqlalchemy import select, func
+    import utils.db_utils as db_utils
+    from utils.db_utils import get_license_repository, License
+    from utils.admin_stats import AdminStats
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    seed_licenses(args.licenses)
+    repo = get_license_repository()
+    stats = AdminStats()
+
+    since = datetime.utcnow() - timedelta(days=30)
+    issued_day = func.date(License.license_issued_at)
+
+    def scan():
+        with repo.db_manager.get_connection() as connection:
+            connection.execute(select(func.count(), func.count(License.license_code)).select_from(License)).one()
+            connection.execute(select(issued_day, func.count()).where(License.license_issued_at >= since)
+                               .group_by(issued_day)).all()
+            connection.execute(select(License.company_name, func.count()).group_by(License.company_name)
+                               .order_by(func.count().desc()).limit(10)).all()
+
+    print(f"\n=== Dashboard figures over {args.licenses} licenses ===")
+    started = time.perf_counter()
+    stats.rebuild()
+    print(f"{'rebuild':30} {(time.perf_counter() - started) * 1000:8.2f} ms")
+    print(f"{'GROUP BY scans':30} {time_ms(scan, args.repeats):8.2f} ms")
+    print(f"{'counter tables':30} {time_ms(stats.snapshot, args.repeats):8.2f} ms")
+
+    def signup():
+        email = f"{uuid.uuid4().hex}@stats-bench.example.com"
+        started = time.perf_counter()
+        repo.add_new_user("Bench", "User", "Stats Bench Co", email)
+        repo.create_and_set_license_key(email)
+        return time.perf_counter() - started
+
+    print(f"\n=== Account creation + license key, median of {args.writes} ===")
+    maintained = db_utils.update_stats
+    for name, update_stats in (("without counters", lambda *a, **k: None), ("with counters", maintained)):
+        db_utils.update_stats = update_stats
+        signup()
+        latencies = [signup() for _ in range(args.writes)]
+        print(f"{name:30} {median(latencies) * 1000:8.2f} ms")
+    db_utils.update_stats = maintained
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=300000, help="number of seeded licenses")
+    parser.add_argument("--repeats", type=int, default=50, help="reads to average")
+    parser.add_argument("--writes", type=int, default=200, help="signups per scenario")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    try:
+        main(args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
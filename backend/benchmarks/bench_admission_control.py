@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark admission control under overload.
+
+A low priority route that holds a worker thread for --hold-ms (standing in
+for a slow SMTP send or a busy SQLite writer) receives more requests per
+second than the thread pool can serve, while /check_license traffic arrives
+at a steady rate. Without admission control the slow requests queue without
+bound, so their latency grows for as long as the overload lasts; with it,
+the excess is shed with 503s and the requests that are admitted finish in
+bounded time. Latency is measured from each request's scheduled start.
+
+Run with: python benchmarks/bench_admission_control.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+
+from common import use_temp_database, seed_licenses, summarize, print_results
+
+
+async def fire(client, path: str, rate: float, duration: float, latencies, statuses):
+    """Open-loop traffic: requests start on schedule whether or not earlier ones finished"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    count = int(rate * duration)
+
+    async def one(scheduled: float, request_path: str):
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        response = await client.get(request_path)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 200:
+            latencies.append(loop.time() - scheduled)
+
+    paths = [path.format(code=code) for code in random.choices(fire.codes, k=count)]
+    await asyncio.gather(*(one(started + i / rate, request_path) for i, request_path in enumerate(paths)))
+
+
+async def run_scenario(client, args):
+    check_latencies, check_statuses = [], {}
+    slow_latencies, slow_statuses = [], {}
+    started = time.perf_counter()
+    await asyncio.gather(
+        fire(client, "/check_license/{code}", args.check_rate, args.duration, check_latencies, check_statuses),
+        fire(client, "/bench/slow", args.slow_rate, args.duration, slow_latencies, slow_statuses))
+    elapsed = time.perf_counter() - started
+    return {
+        "/check_license": {**summarize(check_latencies, elapsed), 'statuses': check_statuses},
+        "slow low priority route": {**summarize(slow_latencies, elapsed), 'statuses': slow_statuses},
+    }
+
+
+async def main(args):
+    import httpx
+    import api
+    from starlette.concurrency import run_in_threadpool
+    from utils.admission_control import AdmissionSettings
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    @api.app.get("/bench/slow")
+    async def slow():
+        await run_in_threadpool(time.sleep, args.hold_ms / 1000)
+        return {}
+
+    fire.codes = [row['license_code'] for row in seed_licenses(args.licenses)]
+    api.license_repo.snapshot.rebuild()
+    controller = api.admission_controller
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for enabled in (False, True):
+            controller.settings = AdmissionSettings(
+                enabled=enabled, low_priority_routes=f"{controller.settings.low_priority_routes}, /bench/*")
+            controller.gates.clear()
+            results = await run_scenario(client, args)
+            label = "admission control on" if enabled else "admission control off"
+            print_results(f"{label}: /check_license at {args.check_rate:g}/s, slow route at {args.slow_rate:g}/s "
+                          f"holding a thread {args.hold_ms:g}ms", results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=20000, help="number of seeded licenses")
+    parser.add_argument("--check-rate", type=float, default=200, help="/check_license requests per second")
+    parser.add_argument("--slow-rate", type=float, default=300, help="slow route requests per second")
+    parser.add_argument("--hold-ms", type=float, default=200, help="how long each slow request holds a thread")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of traffic per scenario")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    # Every request comes from one client, so keep the rate limiter out of the measurement
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    try:
+        asyncio.run(main(args))
+    finally:
+        for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
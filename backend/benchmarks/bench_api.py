@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Load-test the main API endpoints in-process and compare with a baseline.
+
+Drives api.app through httpx's ASGI transport, so no server has to be
+running, against a seeded temporary database. Each scenario keeps
+--concurrency requests in flight until --requests have completed, repeats
+that --rounds times and reports the median throughput and latency
+percentiles:
+
+  check_license (valid)    GET /check_license/{code} for seeded codes
+  check_license (invalid)  GET /check_license/{code} for unknown codes
+  user lookup              GET /user/{email} for seeded users
+  create-account           POST /create-account with new emails
+  send-license-email       POST /send-license-email for seeded users without
+                           a license; the email outbox drains in the
+                           background through a stub mailer
+
+Results are compared with a stored baseline (benchmarks/baselines/api.json
+by default). A scenario regresses when its throughput drops, or its p50, p95
+or p99 rises, by more than --tolerance; the script then exits with status 1.
+Baselines are only comparable on the same machine, so record a fresh one
+with --save-baseline before changing the code under test.
+
+Run with: python benchmarks/bench_api.py [--save-baseline]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from common import use_temp_database, seed_licenses, summarize, print_results
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "api.json"
+# Lower is better for latencies, higher is better for throughput
+COMPARED_STATS = {'throughput_rps': 1, 'p50_ms': -1, 'p95_ms': -1, 'p99_ms': -1}
+
+
+class StubMailer:
+    """Stands in for LicenseEmailSender: renders the email, then waits instead of talking SMTP"""
+
+    sent = 0
+    _lock = threading.Lock()
+
+    def __init__(self, latency_ms: float = 0):
+        from utils.email_sender import get_license_email_template
+
+        self.template = get_license_email_template("noreply@visionpay.example.com")
+        self.latency = latency_ms / 1000
+
+    def send_license_email(self, email: str, company_name: str, license_key: str) -> tuple:
+        self.template.build_message(email, company_name, license_key)
+        if self.latency:
+            time.sleep(self.latency)
+        with StubMailer._lock:
+            StubMailer.sent += 1
+        return True, license_key
+
+
+async def wait_for_outbox(timeout: float = 120):
+    """Let the outbox workers deliver everything queued so far, so emails from
+    one round do not compete with the requests of the next"""
+    import api
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        by_status = api.email_outbox.stats()['by_status']
+        if not by_status.get('pending') and not by_status.get('sending'):
+            return
+        await asyncio.sleep(0.05)
+
+
+async def run_round(client, make_request, args):
+    """Send args.requests requests, args.concurrency at a time, timing each one"""
+    latencies = []
+    remaining = iter(range(args.requests))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            response = await make_request(client)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, f"{response.status_code}: {response.text}"
+
+    for _ in range(args.warmup):
+        await make_request(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def run_scenario(client, make_request, args):
+    """Run args.rounds rounds and report the median of each statistic, which
+    keeps one unlucky round (a GC pause, a WAL checkpoint) out of the comparison"""
+    rounds = []
+    for _ in range(args.rounds):
+        rounds.append(await run_round(client, make_request, args))
+        await wait_for_outbox()
+    return {stat: statistics.median(round_stats[stat] for round_stats in rounds) for stat in rounds[0]}
+
+
+def build_scenarios(rows, unlicensed):
+    """Request factories by scenario name"""
+    licensed = [row for row in rows if row['license_code']]
+    unlicensed = iter(unlicensed)
+    new_accounts = itertools.count()
+    rng = random.Random(11)
+
+    async def check_valid(client):
+        return await client.get(f"/check_license/{rng.choice(licensed)['license_code']}")
+
+    async def check_invalid(client):
+        return await client.get(f"/check_license/zz{uuid.uuid4().hex[:8]}")
+
+    async def user_lookup(client):
+        return await client.get(f"/user/{rng.choice(rows)['email']}")
+
+    async def create_account(client):
+        i = next(new_accounts)
+        return await client.post("/create-account", data={
+            'first_name': "Bench", 'last_name': f"User{i}", 'company_name': "Bench Co",
+            'email': f"new{i}@bench.example.com"})
+
+    async def send_license_email(client):
+        return await client.post("/send-license-email", data={'email': next(unlicensed)['email']})
+
+    return {
+        "check_license (valid)": check_valid,
+        "check_license (invalid)": check_invalid,
+        "user lookup": user_lookup,
+        "create-account": create_account,
+        "send-license-email": send_license_email,
+    }
+
+
+def compare(results, baseline, tolerance: float):
+    """Print the change against the baseline per scenario and return the regressions"""
+    regressions = []
+    print(f"\n=== Change against baseline (tolerance {tolerance:.0%}) ===")
+    for name, stats in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:40} no baseline")
+            continue
+        changes = []
+        for stat, direction in COMPARED_STATS.items():
+            if not previous.get(stat):
+                continue
+            change = (stats[stat] - previous[stat]) / previous[stat]
+            changes.append(f"{stat}={change:+.1%}")
+            if change * direction < -tolerance:
+                regressions.append(f"{name} {stat}: {previous[stat]} -> {stats[stat]}")
+        print(f"{name:40} {', '.join(changes)}")
+    return regressions
+
+
+async def run(args):
+    import httpx
+    import api
+
+    # api.py configures INFO logging on import, which would dominate the timings
+    logging.getLogger().setLevel(logging.CRITICAL)
+    from sqlalchemy import update
+    from utils.db_utils import get_db_manager, License
+
+    rows = seed_licenses(args.users)
+    # Leave enough users without a license for every /send-license-email request to issue one
+    unlicensed = rows[:(args.requests + args.warmup) * args.rounds]
+    if len(unlicensed) == len(rows):
+        raise SystemExit("--users must be larger than (--requests + --warmup) * --rounds")
+    with get_db_manager()._engine.begin() as connection:
+        connection.execute(update(License).where(License.email.in_([row['email'] for row in unlicensed]))
+                           .values(license_code=None, license_issued_at=None, updated_at=License.updated_at))
+    for row in unlicensed:
+        row['license_code'] = None
+    api.license_repo.snapshot.rebuild()
+
+    # ASGITransport does not run startup events, so start the outbox here with the stub mailer
+    api.email_outbox.sender_factory = lambda: StubMailer(args.mail_latency_ms)
+    api.email_outbox.start()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, make_request in build_scenarios(rows, unlicensed).items():
+                if args.scenario and not any(pattern in name for pattern in args.scenario):
+                    continue
+                results[name] = await run_scenario(client, make_request, args)
+    finally:
+        api.email_outbox.stop()
+    return results
+
+
+def main(args):
+    results = asyncio.run(run(args))
+    print_results(f"API in-process, {args.users} users, concurrency {args.concurrency}", results)
+    print(f"stub mailer sent {StubMailer.sent} emails")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        document = {
+            'recorded_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+            'args': {key: value for key, value in vars(args).items()
+                     if key in ('users', 'requests', 'warmup', 'rounds', 'concurrency', 'mail_latency_ms')},
+            'results': results,
+        }
+        baseline_path.write_text(json.dumps(document, indent=2) + "\n")
+        print(f"\nSaved baseline to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        print(f"\nNo baseline at {baseline_path}; record one with --save-baseline")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline.get('args', {}).get('concurrency') != args.concurrency:
+        print(f"\nWarning: baseline was recorded with {baseline.get('args')}")
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000, help="number of seeded users")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=100, help="unmeasured requests before each scenario")
+    parser.add_argument("--rounds", type=int, default=3, help="rounds per scenario; the median is reported")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--mail-latency-ms", type=float, default=0, help="time the stub mailer takes per email")
+    parser.add_argument("--scenario", action="append", help="only run scenarios whose name contains this")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="record these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative change before failing")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    # Every request comes from one client, so keep the rate limiter out of the measurement
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    try:
+        exit_code = main(args)
+    finally:
+        for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+    sys.exit(exit_code)
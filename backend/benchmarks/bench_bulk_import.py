@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark provisioning seats from a CSV.
+
+Compares creating each account with add_new_user, one query and one commit
+per row as /create-account does, against BulkUserImporter, which validates
+the stream and inserts chunk_size rows per executemany transaction.
+
+Run with: python benchmarks/bench_bulk_import.py
+"""
+
+import argparse
+import io
+import logging
+import os
+import time
+
+from common import use_temp_database
+
+
+def make_csv(prefix: str, rows: int) -> str:
+    lines = ["first_name,last_name,company_name,email"]
+    lines += [f"Seat,{i},Enterprise Co,{prefix}{i}@enterprise.example.com" for i in range(rows)]
+    return "\n".join(lines) + "\n"
+
+
+def main(args):
+    import csv
+    from utils.bulk_import import BulkUserImporter, BulkImportSettings
+    from utils.db_utils import get_license_repository
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    repo = get_license_repository()
+    results = {}
+
+    started = time.perf_counter()
+    for row in csv.DictReader(io.StringIO(make_csv("single", args.rows))):
+        repo.add_new_user(row['first_name'], row['last_name'], row['company_name'], row['email'])
+    results["add_new_user per row"] = time.perf_counter() - started
+
+    for chunk_size in args.chunk_sizes:
+        for mint in (False, True):
+            importer = BulkUserImporter(repo, BulkImportSettings(chunk_size=chunk_size))
+            csv_text = make_csv(f"bulk{chunk_size}{'m' if mint else ''}-", args.rows)
+            started = time.perf_counter()
+            report = importer.import_csv(io.StringIO(csv_text), mint_license_codes=mint)
+            assert report['imported'] == args.rows, report['errors'][:5]
+            label = f"bulk import, chunks of {chunk_size}" + (", minting codes" if mint else "")
+            results[label] = time.perf_counter() - started
+
+    print(f"\n=== Importing {args.rows} seats ===")
+    for name, elapsed in results.items():
+        print(f"{name:45} {elapsed:8.2f}s   {args.rows / elapsed:>9.0f} rows/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000, help="rows per CSV")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[100, 1000], help="rows per transaction")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    try:
+        main(args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark /check_license latency under concurrent load.
+
+Compares the previous handler, which called the synchronous LicenseRepository
+straight from an async endpoint and therefore blocked the event loop for every
+SQLite query, with the current handler that awaits AsyncLicenseRepository.
+
+Traffic is mostly repeated lookups of a hot set of codes (served from the
+license cache) plus a share of cold codes that need SQLite. Each scenario runs
+once with an idle database and once with a writer that periodically holds an
+exclusive lock, as /create-account and the Stripe webhook do when they commit.
+While a cold lookup waits for that lock, the blocking handler stalls every
+other request on the event loop, including cache hits.
+
+Run with: python benchmarks/bench_check_license_concurrency.py
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from common import use_temp_database, seed_licenses, summarize, print_results
+
+
+class LockingWriter(threading.Thread):
+    """Repeatedly takes SQLite's exclusive lock, holds it, then releases it"""
+
+    def __init__(self, db_path: str, hold_ms: float, interval_ms: float):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.hold = hold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.stopped = threading.Event()
+
+    def run(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        while not self.stopped.is_set():
+            connection.execute("BEGIN EXCLUSIVE")
+            time.sleep(self.hold)
+            connection.execute("COMMIT")
+            self.stopped.wait(self.interval)
+        connection.close()
+
+
+async def run_scenario(client, path_template: str, hot_codes, cold_codes, args):
+    """Fire requests at a fixed arrival rate and time each one from its scheduled
+    start, so time spent waiting behind a blocked event loop is counted."""
+    latencies = []
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    async def fire(scheduled: float, path: str):
+        await asyncio.sleep(max(0.0, scheduled - loop.time()))
+        response = await client.get(path)
+        latencies.append(loop.time() - scheduled)
+        assert response.status_code == 200, response.text
+
+    paths = []
+    for _ in range(args.requests):
+        codes = cold_codes if random.random() < args.cold_ratio else hot_codes
+        paths.append(path_template.format(code=random.choice(codes)))
+    await asyncio.gather(*(fire(started + i / args.rate, path) for i, path in enumerate(paths)))
+    return summarize(latencies, loop.time() - started)
+
+
+async def main(args, db_path: str):
+    import httpx
+    import api
+
+    @api.app.get("/bench/check_license_blocking/{license_code}")
+    async def check_license_blocking(license_code: str):
+        # Handler as it was before AsyncLicenseRepository
+        license_info = api.license_repo.get_license_by_code(license_code)
+        return {"valid": bool(license_info)}
+
+    rows = seed_licenses(args.licenses)
+    codes = [row['license_code'] for row in rows]
+    hot_codes, cold_codes = codes[:args.hot_codes], codes[args.hot_codes:]
+    api.license_repo.snapshot.rebuild()
+
+    scenarios = {
+        "before: sync repository (blocking)": "/bench/check_license_blocking/{code}",
+        "after: AsyncLicenseRepository": "/check_license/{code}",
+    }
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for writer_busy in (False, True):
+            results = {}
+            for name, path_template in scenarios.items():
+                api.license_repo.cache.clear()
+                for code in hot_codes:
+                    api.license_repo.get_license_by_code(code)
+                writer = LockingWriter(db_path, args.writer_hold_ms, args.writer_interval_ms)
+                if writer_busy:
+                    writer.start()
+                results[name] = await run_scenario(client, path_template, hot_codes, cold_codes, args)
+                writer.stopped.set()
+                if writer_busy:
+                    writer.join()
+            label = (f"writer holding lock {args.writer_hold_ms:g}ms every {args.writer_interval_ms:g}ms"
+                     if writer_busy else "idle database")
+            print_results(f"/check_license at {args.rate:g} req/s, "
+                          f"{args.cold_ratio:.0%} cold codes, {label}", results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=20000, help="number of seeded licenses")
+    parser.add_argument("--hot-codes", type=int, default=1000, help="size of the cached hot set")
+    parser.add_argument("--cold-ratio", type=float, default=0.05, help="share of requests for uncached codes")
+    parser.add_argument("--requests", type=int, default=3000, help="requests per scenario")
+    parser.add_argument("--rate", type=float, default=500, help="request arrival rate per second")
+    parser.add_argument("--writer-hold-ms", type=float, default=20, help="how long the writer holds the lock")
+    parser.add_argument("--writer-interval-ms", type=float, default=80, help="pause between writer locks")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    # Every request comes from one client, so keep the rate limiter out of the measurement
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    try:
+        asyncio.run(main(args, db_path))
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
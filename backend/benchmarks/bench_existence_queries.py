@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of yes/no license lookups.
+
+Compares the ORM path the endpoints used before (session.query(License)
+...first() plus to_dict()) with the Core EXISTS queries behind
+license_code_exists and user_exists. The license cache is disabled and the
+code guard is bypassed, so every call reaches SQLite.
+
+Run with: python benchmarks/bench_existence_queries.py
+"""
+
+import argparse
+import os
+import random
+import time
+
+from common import use_temp_database, seed_licenses, random_license_code
+
+
+def time_calls(func, keys) -> dict:
+    started = time.perf_counter()
+    for key in keys:
+        func(key)
+    elapsed = time.perf_counter() - started
+    return {
+        'calls_per_sec': round(len(keys) / elapsed),
+        'avg_us': round(elapsed / len(keys) * 1_000_000, 1)
+    }
+
+
+def main(args):
+    from utils.db_utils import get_license_repository, License
+
+    rows = seed_licenses(args.licenses)
+    repo = get_license_repository()
+
+    def orm_by_code(license_code):
+        with repo.db_manager.get_session() as session:
+            license_obj = session.query(License).filter(License.license_code == license_code).first()
+            return license_obj.to_dict() if license_obj else None
+
+    def orm_by_email(email):
+        with repo.db_manager.get_session() as session:
+            return session.query(License).filter(License.email == email).first() is not None
+
+    present_codes = [random.choice(rows)['license_code'] for _ in range(args.calls)]
+    absent_codes = [random_license_code() for _ in range(args.calls)]
+    present_emails = [random.choice(rows)['email'] for _ in range(args.calls)]
+
+    scenarios = {
+        'code present': (orm_by_code, repo.query_license_code_exists, present_codes),
+        'code absent': (orm_by_code, repo.query_license_code_exists, absent_codes),
+        'email present': (orm_by_email, repo.user_exists, present_emails),
+    }
+    print(f"\n=== Existence lookups, {args.licenses} licenses, {args.calls} calls each ===")
+    for name, (orm_func, core_func, keys) in scenarios.items():
+        # Warm up both paths
+        time_calls(orm_func, keys[:200])
+        time_calls(core_func, keys[:200])
+        orm = time_calls(orm_func, keys)
+        core = time_calls(core_func, keys)
+        speedup = orm['avg_us'] / core['avg_us']
+        print(f"{name:15} ORM {orm['avg_us']:>7} us/call   EXISTS {core['avg_us']:>7} us/call   "
+              f"speedup {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=50000, help="number of seeded licenses")
+    parser.add_argument("--calls", type=int, default=5000, help="lookups per scenario")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    os.environ['LICENSE_CACHE_MAX_SIZE'] = '0'
+    try:
+        main(args)
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
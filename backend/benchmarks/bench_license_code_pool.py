@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark license key issuance as the licenses table grows.
+
+For each table size, users without a license are issued keys with
+create_and_set_license_key, once claiming codes from the pre-generated pool
+and once with the pool disabled, which generates a code and checks both
+tables for it. Each size runs in a fresh subprocess against its own
+temporary database because DatabaseManager reads its path once.
+
+Run with: python benchmarks/bench_license_code_pool.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+from common import use_temp_database, seed_licenses, summarize, print_results
+
+
+def issue_keys(repo, count: int) -> dict:
+    emails = [f"issue-{uuid.uuid4().hex}@bench.example.com" for _ in range(count)]
+    for email in emails:
+        repo.add_new_user("Bench", "Issue", "Bench Co", email)
+    latencies = []
+    started = time.perf_counter()
+    for email in emails:
+        call_started = time.perf_counter()
+        assert repo.create_and_set_license_key(email)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run_size(args):
+    """Seed a database of the given size and print JSON results for both allocation paths"""
+    db_path = use_temp_database(prefix="visionpay_bench_pool_")
+    os.environ['LICENSE_CACHE_MAX_SIZE'] = '0'
+    os.environ['LICENSE_BLOOM_ENABLED'] = 'false'
+    os.environ['LICENSE_CODE_POOL_TARGET_SIZE'] = str(args.keys + 100)
+    logging.getLogger().setLevel(logging.CRITICAL)
+    try:
+        seed_licenses(args.run_size)
+        from utils.db_utils import get_license_repository
+
+        repo = get_license_repository()
+        allocator = repo.code_allocator
+        allocator.refill()
+        summary = {'pool': issue_keys(repo, args.keys)}
+        summary['pool']['empty_claims'] = allocator.stats()['empty_claims']
+        allocator.settings.enabled = False
+        summary['generate and check'] = issue_keys(repo, args.keys)
+        print(json.dumps(summary))
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+def main(args):
+    for size in args.sizes:
+        command = [sys.executable, __file__, '--run-size', str(size), '--keys', str(args.keys)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        summary = json.loads(output.strip().splitlines()[-1])
+        print_results(f"{args.keys} license keys issued with {size} existing licenses", summary)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000],
+                        help="existing licenses per run")
+    parser.add_argument("--keys", type=int, default=2000, help="license keys issued per allocation path")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size is not None:
+        run_size(args)
+    else:
+        main(args)
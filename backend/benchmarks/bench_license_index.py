@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark the packed uint64 license index against dict and set.
+
+For each size in --sizes, builds a set of str, a dict of str to bool and a
+PackedCodeIndex over the same random codes, then reports:
+
+  memory     bytes held by each structure, including the str objects
+  build      time to build each from a list of codes
+  lookup     one membership test at a time, issued and never-issued codes
+  batch      membership of --batch codes at once (a /check_licenses
+             request): a comprehension over the set versus one vectorized
+             contains_many call
+
+Run with: python benchmarks/bench_license_index.py
+"""
+
+import argparse
+import gc
+import sys
+import time
+
+import numpy as np
+
+from common import summarize, print_results
+
+
+def random_codes(count: int, rng: np.random.Generator) -> list:
+    from utils.license_index import ALPHABET
+
+    characters = np.array(list(ALPHABET), dtype='U1')[rng.integers(0, len(ALPHABET), (count, 10))]
+    return characters.view('U10').ravel().tolist()
+
+
+def timed(build):
+    started = time.perf_counter()
+    result = build()
+    return result, round(time.perf_counter() - started, 3)
+
+
+def bench_lookups(contains, probes):
+    latencies = []
+    started = time.perf_counter()
+    for code in probes:
+        call_started = time.perf_counter()
+        contains(code)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def bench_batches(contains_many, batches):
+    latencies = []
+    started = time.perf_counter()
+    for batch in batches:
+        call_started = time.perf_counter()
+        contains_many(batch)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run_size(size: int, args, rng: np.random.Generator):
+    from utils.license_index import PackedCodeIndex
+
+    codes = random_codes(size, rng)
+    strings_bytes = sum(map(sys.getsizeof, codes))
+    hits = [codes[i] for i in rng.integers(0, size, args.lookups)]
+    misses = random_codes(args.lookups, rng)
+    batches = [[codes[i] for i in rng.integers(0, size, args.batch // 2)] + random_codes(args.batch // 2, rng)
+               for _ in range(args.batches)]
+
+    code_set, set_seconds = timed(lambda: set(codes))
+    code_dict, dict_seconds = timed(lambda: dict.fromkeys(codes, True))
+    index, index_seconds = timed(lambda: PackedCodeIndex.from_codes(codes))
+    memory = {
+        "set": sys.getsizeof(code_set) + strings_bytes,
+        "dict": sys.getsizeof(code_dict) + strings_bytes,
+        "packed index": index.size_bytes,
+    }
+    print(f"\n{size} codes")
+    for name, seconds in (("set", set_seconds), ("dict", dict_seconds), ("packed index", index_seconds)):
+        print(f"  {name:<14} {memory[name] / 2 ** 20:8.1f}MiB  {memory[name] / size:6.1f} bytes/code  "
+              f"built in {seconds}s")
+
+    for label, probes in (("issued", hits), ("never-issued", misses)):
+        print_results(f"{size} codes: {len(probes)} lookups of {label} codes", {
+            "set": bench_lookups(code_set.__contains__, probes),
+            "dict": bench_lookups(code_dict.__contains__, probes),
+            "packed index": bench_lookups(index.__contains__, probes),
+        })
+    print_results(f"{size} codes: {args.batches} batches of {args.batch} codes", {
+        "set comprehension": bench_batches(lambda batch: [code in code_set for code in batch], batches),
+        "packed index contains_many": bench_batches(index.contains_many, batches),
+    })
+    del code_set, code_dict, index, codes
+    gc.collect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000000,10000000", help="comma separated index sizes")
+    parser.add_argument("--lookups", type=int, default=100000, help="single lookups per scenario")
+    parser.add_argument("--batch", type=int, default=1000, help="codes per batch")
+    parser.add_argument("--batches", type=int, default=200, help="batches per scenario")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng()
+    for size in (int(part) for part in args.sizes.split(',')):
+        run_size(size, args, rng)
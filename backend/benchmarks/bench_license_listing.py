@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark listing and exporting the licenses table.
+
+Compares loading every license into ORM objects and a list of dicts (the
+previous get_all_licenses) with the streaming iter_licenses export, measuring
+time (slowed down by tracemalloc) and peak Python memory. It also times fetching a page deep into the
+table with LIMIT/OFFSET against the keyset cursor used by get_licenses_page.
+
+Run with: python benchmarks/bench_license_listing.py
+"""
+
+import argparse
+import logging
+import os
+import time
+import tracemalloc
+
+from common import use_temp_database, seed_licenses
+
+
+def measure(func) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def main(args):
+    from utils.db_utils import get_license_repository, License
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    seed_licenses(args.licenses)
+    repo = get_license_repository()
+
+    def load_all_orm():
+        with repo.db_manager.get_session() as session:
+            return len([license.to_dict() for license in session.query(License).all()])
+
+    def stream_all():
+        return sum(1 for _ in repo.iter_licenses())
+
+    print(f"\n=== Reading all {args.licenses} licenses ===")
+    for name, func in (("ORM .all() + list of dicts", load_all_orm), ("iter_licenses (yield_per)", stream_all)):
+        count, elapsed, peak_mb = measure(func)
+        print(f"{name:30} {elapsed:7.2f}s   peak {peak_mb:8.1f} MiB   rows={count}")
+
+    def offset_page():
+        with repo.db_manager.get_session() as session:
+            return session.query(License).order_by(License.created_at, License.id) \
+                .offset(args.licenses - args.page_size).limit(args.page_size).all()
+
+    # Cursor pointing just before the last page
+    _, cursor = repo.get_licenses_page(args.licenses - args.page_size)
+    print(f"\n=== Fetching the last page of {args.page_size} ===")
+    for name, func in (("LIMIT/OFFSET", offset_page),
+                       ("keyset cursor", lambda: repo.get_licenses_page(args.page_size, cursor))):
+        started = time.perf_counter()
+        for _ in range(args.repeats):
+            func()
+        print(f"{name:30} {(time.perf_counter() - started) / args.repeats * 1000:8.2f} ms/page")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=300000, help="number of seeded licenses")
+    parser.add_argument("--page-size", type=int, default=100, help="licenses per page")
+    parser.add_argument("--repeats", type=int, default=20, help="page fetches to average")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    try:
+        main(args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
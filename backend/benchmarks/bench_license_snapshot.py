@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark license code lookups against the memory-mapped snapshot.
+
+Seeds --licenses codes, rebuilds the snapshot from the licenses table and
+times one existence check per issued code (and per never-issued code)
+through:
+
+  snapshot     LicenseSnapshot.lookup, a binary search over the mapping
+  database     LicenseRepository.query_license_code_exists, one indexed query
+  python set   a set of every code held by the process, the per-worker
+               alternative the snapshot replaces
+
+Also reports the rebuild time and the resident size of each structure.
+
+Run with: python benchmarks/bench_license_snapshot.py
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+from common import use_temp_database, seed_licenses, random_license_code, summarize, print_results
+
+
+def bench_lookups(lookup, codes):
+    latencies = []
+    started = time.perf_counter()
+    for code in codes:
+        call_started = time.perf_counter()
+        lookup(code)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def main(args):
+    from utils.db_utils import get_license_repository
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    issued = [row['license_code'] for row in seed_licenses(args.licenses)]
+    repo = get_license_repository()
+
+    rebuild_ms = []
+    for _ in range(args.rebuilds):
+        rebuild_ms.append(repo.snapshot.rebuild()['elapsed_ms'])
+    stats = repo.snapshot.stats()
+    code_set = set(issued)
+    print(f"\nSnapshot of {stats['codes']} codes: {stats['size_bytes'] / 2 ** 20:.1f}MiB on disk, shared by "
+          f"every worker; rebuild {min(rebuild_ms):.0f}ms best of {args.rebuilds}. Python set in each "
+          f"worker: {(sys.getsizeof(code_set) + sum(map(sys.getsizeof, code_set))) / 2 ** 20:.1f}MiB")
+
+    hits = random.sample(issued, min(args.lookups, len(issued)))
+    misses = [random_license_code() for _ in range(args.lookups)]
+    for label, probes in (("issued codes", hits), ("never-issued codes", misses)):
+        print_results(f"{len(probes)} lookups of {label}", {
+            "snapshot": bench_lookups(repo.snapshot.lookup, probes),
+            "database": bench_lookups(repo.query_license_code_exists, probes[:args.lookups // 10]),
+            "python set": bench_lookups(code_set.__contains__, probes),
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=1000000, help="number of seeded licenses")
+    parser.add_argument("--lookups", type=int, default=100000, help="lookups per scenario")
+    parser.add_argument("--rebuilds", type=int, default=3, help="snapshot rebuilds to time")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    try:
+        main(args)
+    finally:
+        for path in (db_path, f"{db_path}-wal", f"{db_path}-shm", f"{db_path}.snapshot", f"{db_path}.snapshot.lock",
+                     f"{db_path}.snapshot.changes"):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark the rate limiter's overhead per request.
+
+Three measurements:
+
+  acquire          cost of one bucket acquire for the in-memory and SQLite
+                   stores, spread over --clients keys
+  contention       acquire throughput from --threads threads with one lock
+                   stripe versus the default 64
+  /check_license   end-to-end latency through api.app with the limiter off,
+                   in memory and in SQLite, from --clients distinct IPs so no
+                   request is actually limited, plus the latency of a 429
+                   for a client whose bucket is empty
+
+Run with: python benchmarks/bench_rate_limiter.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from common import use_temp_database, seed_licenses, summarize, print_results
+
+
+def client_keys(count: int):
+    return [f"198.51.{i // 256 % 256}.{i % 256} /check_license/{{license_code}}" for i in range(count)]
+
+
+def bench_acquire(buckets, keys, calls: int):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(calls):
+        key = keys[i % len(keys)]
+        call_started = time.perf_counter()
+        buckets.acquire(key, 1000.0, 1000.0)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def bench_contention(buckets, keys, threads: int, calls_per_thread: int):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(offset: int):
+        local = []
+        for i in range(calls_per_thread):
+            call_started = time.perf_counter()
+            buckets.acquire(keys[(offset + i) % len(keys)], 1000.0, 1000.0)
+            local.append(time.perf_counter() - call_started)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(n * 7919,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_endpoint(client, codes, ips, requests: int, concurrency: int):
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for i in remaining:
+            headers = {"X-Forwarded-For": ips[i % len(ips)]}
+            started = time.perf_counter()
+            response = await client.get(f"/check_license/{random.choice(codes)}", headers=headers)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code in (200, 429), response.text
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def bench_api(args, sqlite_path: str):
+    import httpx
+    import api
+    from utils.rate_limiter import RateLimitSettings, create_token_buckets
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    codes = [row['license_code'] for row in seed_licenses(args.licenses)]
+    ips = [key.split()[0] for key in client_keys(args.clients)]
+    limiter = api.rate_limiter
+    configurations = {
+        "limiter off": RateLimitSettings(enabled=False),
+        "memory buckets": RateLimitSettings(backend='memory', trust_forwarded_for=True, burst=1e9),
+        "sqlite buckets": RateLimitSettings(backend='sqlite', sqlite_path=sqlite_path,
+                                            trust_forwarded_for=True, burst=1e9),
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for code in codes[:200]:
+            await client.get(f"/check_license/{code}")
+        for name, settings in configurations.items():
+            limiter.settings = settings
+            limiter.buckets = create_token_buckets(settings)
+            results[name] = await bench_endpoint(client, codes, ips, args.requests, args.concurrency)
+
+        # One client with an empty bucket: every request is answered by the middleware
+        limiter.settings = RateLimitSettings(backend='memory', trust_forwarded_for=True, burst=1,
+                                             rate_per_second=0.001)
+        limiter.buckets = create_token_buckets(limiter.settings)
+        results["429 (memory buckets)"] = await bench_endpoint(
+            client, codes, ips[:1], args.requests, args.concurrency)
+    return results
+
+
+def main(args, sqlite_path: str):
+    from utils.rate_limiter import MemoryTokenBuckets, SQLiteTokenBuckets
+
+    keys = client_keys(args.clients)
+    print_results(f"acquire() over {args.clients} clients", {
+        "memory": bench_acquire(MemoryTokenBuckets(), keys, args.calls),
+        "sqlite": bench_acquire(SQLiteTokenBuckets(sqlite_path), keys, args.calls // 10),
+    })
+    print_results(f"acquire() from {args.threads} threads", {
+        "memory, 1 stripe": bench_contention(MemoryTokenBuckets(stripes=1), keys, args.threads, args.calls // args.threads),
+        "memory, 64 stripes": bench_contention(MemoryTokenBuckets(stripes=64), keys, args.threads,
+                                               args.calls // args.threads),
+    })
+    print_results(f"/check_license, {args.clients} clients, concurrency {args.concurrency}",
+                  asyncio.run(bench_api(args, f"{sqlite_path}-api")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=10000, help="distinct client IPs")
+    parser.add_argument("--calls", type=int, default=200000, help="acquire calls per store")
+    parser.add_argument("--threads", type=int, default=8, help="threads in the contention test")
+    parser.add_argument("--licenses", type=int, default=20000, help="number of seeded licenses")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per /check_license scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    sqlite_path = os.path.join(tempfile.mkdtemp(prefix="visionpay_bench_rate_limit_"), "buckets.db")
+    try:
+        main(args, sqlite_path)
+    finally:
+        for path in (db_path, sqlite_path, f"{sqlite_path}-api"):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark license email throughput with and without pooled SMTP connections.
+
+Sends license emails to a local SMTP sink (tests/fake_servers.py) that adds a
+fixed delay to every reply, standing in for the round trip to Gmail. The
+"per-message" scenario opens, logs in and quits a connection for every email,
+as send_license_email used to; the "pooled" scenario goes through
+LicenseEmailSender and its shared SMTPConnectionPool. The sink does not speak
+STARTTLS, so the real per-connection cost against Gmail is higher still.
+
+Run with: python benchmarks/bench_smtp_pool.py
+"""
+
+import argparse
+import logging
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import summarize, print_results
+from tests.fake_servers import SMTPSink
+
+
+def per_message_sender(settings):
+    from utils.email_sender import LicenseEmailSender
+
+    body_sender = LicenseEmailSender(settings)
+
+    def send(email: str, company_name: str, license_key: str):
+        body = body_sender.define_email_body(license_key, company_name)
+        with smtplib.SMTP(settings.smtp_host, settings.smtp_port) as server:
+            server.ehlo()
+            server.login(settings.email_sender, settings.app_password)
+            server.sendmail(settings.email_sender, email, body)
+        return True, license_key
+    return send
+
+
+def run_scenario(send, messages: int, senders: int) -> dict:
+    def timed(i: int) -> float:
+        started = time.perf_counter()
+        send(f"user{i}@example.com", "Bench Co", f"KEY{i:07d}")
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=senders) as executor:
+        latencies = list(executor.map(timed, range(messages)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def main(args):
+    from utils.email_sender import EmailSettings, LicenseEmailSender, get_smtp_pool
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    results = {}
+    for name in ("per-message connection", "pooled connections"):
+        sink = SMTPSink(reply_delay=args.reply_delay_ms / 1000).start()
+        settings = EmailSettings(email_sender="noreply@visionpay.example.com", app_password="bench",
+                                 smtp_host="127.0.0.1", smtp_port=sink.port, smtp_starttls=False,
+                                 pool_size=args.senders)
+        if name.startswith("pooled"):
+            sender = LicenseEmailSender(settings)
+            send = sender.send_license_email
+        else:
+            send = per_message_sender(settings)
+        try:
+            stats = run_scenario(send, args.messages, args.senders)
+        finally:
+            if name.startswith("pooled"):
+                get_smtp_pool(settings).close_all()
+            sink.stop()
+        stats['connections'] = sink.connections
+        stats['logins'] = sink.logins
+        results[name] = stats
+
+    print_results(f"{args.messages} license emails, {args.senders} senders, "
+                  f"{args.reply_delay_ms:g}ms per SMTP reply", results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=300, help="emails per scenario")
+    parser.add_argument("--senders", type=int, default=2, help="concurrent sender threads (outbox workers)")
+    parser.add_argument("--reply-delay-ms", type=float, default=5, help="delay the sink adds to every reply")
+    main(parser.parse_args())
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark SQLite reader throughput while writes are in flight.
+
+For each SQLite profile, reader processes run license_code_exists queries
+while writer processes create accounts and license keys, the way several
+uvicorn workers would serve /check_license next to /create-account and the
+Stripe webhook. Each profile runs in a fresh subprocess against its own
+temporary database because DatabaseManager reads its settings once.
+
+Run with: python benchmarks/bench_sqlite_profiles.py
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+from common import use_temp_database, seed_licenses, summarize, print_results
+
+
+def run_worker(role: str, worker_id: int, codes, duration: float, results):
+    from utils.db_utils import get_license_repository
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    repo = get_license_repository()
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    iteration = 0
+    while time.perf_counter() < deadline:
+        iteration += 1
+        started = time.perf_counter()
+        if role == 'reader':
+            ok = repo.query_license_code_exists(random.choice(codes))
+        else:
+            email = f"writer{worker_id}-{iteration}@bench.example.com"
+            ok = repo.add_new_user("Bench", "Writer", "Bench Co", email) is not None
+            ok = ok and repo.create_and_set_license_key(email) is not None
+        latencies.append(time.perf_counter() - started)
+        if not ok:
+            errors += 1
+    results.put((role, latencies, errors))
+
+
+def run_profile(args):
+    """Seed a database and run readers and writers against it, printing JSON results"""
+    db_path = use_temp_database(prefix=f"visionpay_bench_{args.run_profile}_")
+    os.environ['SQLITE_PROFILE'] = args.run_profile
+    os.environ['LICENSE_CACHE_MAX_SIZE'] = '0'
+    logging.getLogger().setLevel(logging.CRITICAL)
+    try:
+        codes = [row['license_code'] for row in seed_licenses(args.licenses)]
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = [
+            context.Process(target=run_worker, args=(role, i, codes, args.duration, results))
+            for i, role in enumerate(['reader'] * args.readers + ['writer'] * args.writers)
+        ]
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        summary = {}
+        for role in ('reader', 'writer'):
+            latencies = [value for r, values, _ in collected if r == role for value in values]
+            stats = summarize(latencies, args.duration)
+            stats['errors'] = sum(errors for r, _, errors in collected if r == role)
+            summary[role] = stats
+        print(json.dumps(summary))
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+def main(args):
+    for profile in args.profiles:
+        command = [sys.executable, __file__, '--run-profile', profile,
+                   '--licenses', str(args.licenses), '--readers', str(args.readers),
+                   '--writers', str(args.writers), '--duration', str(args.duration)]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        summary = json.loads(output.strip().splitlines()[-1])
+        print_results(f"profile '{profile}': {args.readers} readers, {args.writers} writers, "
+                      f"{args.duration:g}s", {
+                          "reads (license_code_exists)": summary['reader'],
+                          "writes (add user + license key)": summary['writer'],
+                      })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=["default", "production"], help="profiles to compare")
+    parser.add_argument("--licenses", type=int, default=20000, help="number of seeded licenses")
+    parser.add_argument("--readers", type=int, default=2, help="reader processes")
+    parser.add_argument("--writers", type=int, default=1, help="writer processes")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per profile")
+    parser.add_argument("--run-profile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        run_profile(args)
+    else:
+        main(args)
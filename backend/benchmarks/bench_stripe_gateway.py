@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark the effect of Stripe round trips on the rest of the API.
+
+/process-payment-success calls hit a local fake Stripe server with a fixed
+latency while /check_license requests arrive at a steady rate. The "inline"
+scenario calls the Stripe SDK directly inside the async handler, as the
+endpoint used to, so every Stripe round trip freezes the event loop; the
+"gateway" scenario goes through StripeGateway's thread pool.
+
+A second pair of scenarios simulates a Stripe outage where every call hangs
+past the timeout, with the circuit breaker effectively disabled and enabled.
+
+Run with: python benchmarks/bench_stripe_gateway.py
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+
+from common import use_temp_database, seed_licenses, summarize, print_results
+from tests.fake_servers import FakeStripe
+
+
+class InlineStripe:
+    """The previous behaviour: blocking SDK calls on the event loop"""
+
+    async def retrieve_checkout_session(self, session_id: str):
+        import stripe
+        return stripe.checkout.Session.retrieve(session_id)
+
+
+async def fire_at(loop, scheduled: float, request, latencies):
+    await asyncio.sleep(max(0.0, scheduled - loop.time()))
+    await request()
+    latencies.append(loop.time() - scheduled)
+
+
+async def run_scenario(client, license_codes, session_ids, args):
+    """Open-loop /check_license and /process-payment-success traffic; latency is
+    measured from each request's scheduled start"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    check_latencies, payment_latencies = [], []
+
+    async def check():
+        response = await client.get(f"/check_license/{random.choice(license_codes)}")
+        assert response.status_code == 200, response.text
+
+    async def pay():
+        await client.post("/process-payment-success", data={"session_id": random.choice(session_ids)})
+
+    tasks = [fire_at(loop, started + i / args.check_rate, check, check_latencies)
+             for i in range(int(args.duration * args.check_rate))]
+    tasks += [fire_at(loop, started + i / args.payment_rate, pay, payment_latencies)
+              for i in range(int(args.duration * args.payment_rate))]
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - started
+    return summarize(check_latencies, elapsed), summarize(payment_latencies, elapsed)
+
+
+async def main(args):
+    import httpx
+    import stripe
+    import api
+    from utils.stripe_gateway import StripeGateway, StripeGatewaySettings
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    rows = seed_licenses(args.licenses)
+    license_codes = [row['license_code'] for row in rows[:1000]]
+    fake = FakeStripe(latency=args.stripe_latency_ms / 1000).start()
+    stripe.api_base = fake.url
+    stripe.api_key = "sk_test_bench"
+    session_ids = [fake.add_session(row['email']) for row in rows[:200]]
+
+    transport = httpx.ASGITransport(app=api.app)
+    checks, payments = {}, {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm the license cache so /check_license itself never waits on SQLite
+        for code in license_codes:
+            await client.get(f"/check_license/{code}")
+
+        scenarios = {
+            "inline SDK call": InlineStripe(),
+            "StripeGateway": StripeGateway(StripeGatewaySettings(timeout_seconds=5)),
+        }
+        for name, gateway in scenarios.items():
+            api.stripe_gateway = gateway
+            checks[name], payments[name] = await run_scenario(client, license_codes, session_ids, args)
+
+        # Outage: Stripe hangs longer than the timeout on every call
+        fake.latency = 2 * args.outage_timeout
+        outage = {}
+        for name, threshold in (("outage, breaker disabled", 10 ** 9), ("outage, breaker enabled", 5)):
+            api.stripe_gateway = StripeGateway(StripeGatewaySettings(
+                timeout_seconds=args.outage_timeout, failure_threshold=threshold))
+            _, outage[name] = await run_scenario(client, license_codes, session_ids, args)
+            outage[name]['stripe_calls_rejected'] = api.stripe_gateway.stats()['operations'][
+                'checkout_session_retrieve']['rejected']
+    fake.stop()
+
+    print_results(f"/check_license at {args.check_rate:g}/s while /process-payment-success runs at "
+                  f"{args.payment_rate:g}/s, Stripe latency {args.stripe_latency_ms:g}ms", checks)
+    print_results("/process-payment-success", payments)
+    print_results(f"/process-payment-success during a Stripe outage, {args.outage_timeout:g}s timeout", outage)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--licenses", type=int, default=5000, help="number of seeded licenses")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per scenario")
+    parser.add_argument("--check-rate", type=float, default=200, help="/check_license requests per second")
+    parser.add_argument("--payment-rate", type=float, default=5, help="/process-payment-success requests per second")
+    parser.add_argument("--stripe-latency-ms", type=float, default=150, help="fake Stripe response time")
+    parser.add_argument("--outage-timeout", type=float, default=0.5, help="Stripe timeout during the outage")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    # Every request comes from one client, so keep the rate limiter out of the measurement
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+    os.environ['EMAIL_OUTBOX_WORKERS'] = '0'
+    try:
+        asyncio.run(main(args))
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
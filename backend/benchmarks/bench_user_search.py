@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark the FTS5 user search against LIKE scans.
+
+Seeds users with names drawn from small vocabularies, builds the
+licenses_fts index and compares /admin/search style queries (every word
+matched as a prefix, ranked by bm25) with the LIKE '%word%' scans they
+replace. LIKE with LIMIT stops at the first 20 rows it happens to find, so it
+is only slow when few rows match; bm25 ranking scores every match, so FTS is
+slowest for very common words. It also reports the index size and what the
+sync triggers add to inserting users.
+
+Run with: python benchmarks/bench_user_search.py
+"""
+
+import argparse
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+
+from common import use_temp_database, summarize, print_results
+
+FIRST_NAMES = ["james", "mary", "john", "patricia", "robert", "jennifer", "michael", "linda", "william",
+               "elizabeth", "david", "barbara", "richard", "susan", "joseph", "jessica", "thomas", "sarah",
+               "charles", "karen", "christopher", "nancy", "daniel", "lisa", "matthew", "betty", "anthony"]
+COMPANY_WORDS = ["acme", "globex", "initech", "umbrella", "hooli", "vandelay", "stark", "wayne", "tyrell",
+                 "cyberdyne", "soylent", "wonka", "gringotts", "oscorp", "aperture", "massive", "dynamic"]
+COMPANY_SUFFIXES = ["industries", "labs", "corp", "systems", "group", "holdings", "vision", "robotics"]
+
+
+SURNAME_SYLLABLES = ["an", "ber", "cal", "dor", "el", "fitz", "gar", "hol", "ing", "jen", "kel", "lin", "mor",
+                     "nel", "ol", "par", "quin", "ros", "sut", "ton", "ver", "wil", "yor", "zan", "son", "ley"]
+
+
+def user_rows(start: int, count: int, rng: random.Random):
+    now = datetime.utcnow()
+    for i in range(start, start + count):
+        first = rng.choice(FIRST_NAMES)
+        last = ''.join(rng.choice(SURNAME_SYLLABLES) for _ in range(rng.choice((2, 3))))
+        company = f"{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_SUFFIXES)}"
+        domain = f"{company.split()[0]}{i % 997}"
+        # Emails are unique, so addresses that would collide get a number
+        email = f"{first}.{last}{i}@{domain}.com" if rng.random() < 0.3 else f"{first[0]}{last}.{i}@{domain}.com"
+        yield {'id': str(uuid.uuid4()), 'first_name': first.title(), 'last_name': last.title(),
+               'company_name': company.title(), 'email': email, 'license_code': None,
+               'license_issued_at': None, 'created_at': now, 'updated_at': now}
+
+
+def insert_users(engine, start: int, count: int, rng: random.Random, batch_size: int = 20000) -> float:
+    """Insert users, committing every batch_size rows, and return rows per second"""
+    from sqlalchemy import insert
+    from utils.db_utils import License
+
+    started = time.perf_counter()
+    rows = user_rows(start, count, rng)
+    while True:
+        batch = [row for _, row in zip(range(batch_size), rows)]
+        if not batch:
+            break
+        with engine.begin() as connection:
+            connection.execute(insert(License.__table__), batch)
+    return count / (time.perf_counter() - started)
+
+
+def main(args):
+    from sqlalchemy import text
+    from utils.db_utils import get_db_manager
+    from utils.user_search import UserSearch
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    rng = random.Random(7)
+    db_manager = get_db_manager()
+    engine = db_manager._engine
+
+    print(f"Seeding {args.users} users ...")
+    insert_users(engine, 0, args.users, rng)
+    size_before = os.path.getsize(db_manager.db_path)
+    # Committed in chunks of 1000 rows, like a bulk CSV import
+    without_triggers = insert_users(engine, args.users, args.insert_rows, rng, batch_size=1000)
+
+    started = time.perf_counter()
+    search = UserSearch()
+    build_seconds = time.perf_counter() - started
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    index_mb = (os.path.getsize(db_manager.db_path) - size_before) / (1024 * 1024)
+    with_triggers = insert_users(engine, args.users + args.insert_rows, args.insert_rows, rng, batch_size=1000)
+
+    print(f"\n=== Index over {args.users + args.insert_rows} users ===")
+    print(f"{'build':30} {build_seconds:8.2f} s")
+    print(f"{'approximate size':30} {index_mb:8.1f} MiB")
+    print(f"{'inserts without triggers':30} {without_triggers:8.0f} rows/s")
+    print(f"{'inserts with triggers':30} {with_triggers:8.0f} rows/s")
+
+    like_query = text(
+        "SELECT * FROM licenses WHERE email LIKE :pattern OR first_name LIKE :pattern "
+        "OR last_name LIKE :pattern OR company_name LIKE :pattern LIMIT 20")
+    queries = {
+        "rare last name prefix": "fitzquinyor",
+        "first name + last name": "mary kelros",
+        "first name + company": "mary acme",
+        "company prefix": "cyberd",
+        "email prefix": "jmorton",
+        "common first name": "mary",
+        "no match": "zzyzx",
+    }
+    results = {}
+    for name, query in queries.items():
+        term = query.split()[0]
+        for method, run in (
+                ("LIKE '%word%'", lambda: connection.execute(like_query, {'pattern': f"%{term}%"}).all()),
+                ("FTS5 prefix", lambda: search.search(query, limit=20))):
+            latencies = []
+            with engine.connect() as connection:
+                started = time.perf_counter()
+                for _ in range(args.repeats if method == "FTS5 prefix" else args.like_repeats):
+                    call_started = time.perf_counter()
+                    run()
+                    latencies.append(time.perf_counter() - call_started)
+            results[f"{name} / {method}"] = summarize(latencies, time.perf_counter() - started)
+    print_results("Top 20 results", results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000000, help="number of seeded users")
+    parser.add_argument("--insert-rows", type=int, default=50000, help="rows inserted to time the triggers")
+    parser.add_argument("--repeats", type=int, default=200, help="FTS searches per query")
+    parser.add_argument("--like-repeats", type=int, default=5, help="LIKE scans per query")
+    args = parser.parse_args()
+
+    db_path = use_temp_database()
+    try:
+        main(args)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
@@ -0,0 +1,103 @@
+"""
+Shared helpers for the VisionPay backend benchmarks.
+
+Benchmarks run against a throwaway SQLite database so they never touch
+db/visionpay_licenses.db. Call use_temp_database() before importing api or
+utils.db_utils, since the database path is read when DatabaseManager is
+first created.
+"""
+
+import os
+import sys
+import math
+import string
+import secrets
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Sequence, Any
+
+# Add the backend directory to the Python path
+backend_dir = str(Path(__file__).parent.parent)
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)
+
+LICENSE_CODE_ALPHABET = string.ascii_letters + string.digits
+
+
+def use_temp_database(prefix: str = "visionpay_bench_") -> str:
+    """Point DatabaseManager at a new temporary SQLite file and return its path"""
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    os.environ['VISIONPAY_DB_PATH'] = path
+    return path
+
+
+def random_license_code() -> str:
+    return ''.join(secrets.choice(LICENSE_CODE_ALPHABET) for _ in range(10))
+
+
+def seed_licenses(count: int, with_codes: bool = True, batch_size: int = 10000) -> List[Dict[str, Any]]:
+    """Insert count synthetic users straight into the licenses table and return the rows"""
+    from sqlalchemy import insert
+    from utils.db_utils import get_db_manager, License
+
+    engine = get_db_manager()._engine
+    now = datetime.utcnow()
+    rows = []
+    codes = set()
+    for i in range(count):
+        code = None
+        if with_codes:
+            code = random_license_code()
+            while code in codes:
+                code = random_license_code()
+            codes.add(code)
+        created_at = now - timedelta(seconds=count - i)
+        rows.append({
+            'id': str(uuid.uuid4()),
+            'first_name': f"First{i}",
+            'last_name': f"Last{i}",
+            'company_name': f"Company {i % 500}",
+            'email': f"user{i}@bench{i % 500}.example.com",
+            'license_code': code,
+            'license_issued_at': created_at if code else None,
+            'created_at': created_at,
+            'updated_at': created_at
+        })
+
+    with engine.begin() as connection:
+        for start in range(0, len(rows), batch_size):
+            connection.execute(insert(License.__table__), rows[start:start + batch_size])
+    return rows
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(latencies: Sequence[float], elapsed: float) -> Dict[str, float]:
+    """Summarize per-request latencies (seconds) measured over elapsed seconds"""
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0
+    }
+
+
+def print_results(title: str, results: Dict[str, Dict[str, Any]]):
+    """Print one line per scenario"""
+    print(f"\n=== {title} ===")
+    for name, stats in results.items():
+        details = ", ".join(f"{key}={value}" for key, value in stats.items())
+        print(f"{name:40} {details}")
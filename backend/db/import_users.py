@@ -0,0 +1,40 @@
+import sys
+import argparse
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = str(Path(__file__).parent.parent)
+sys.path.append(backend_dir)
+
+from utils.bulk_import import BulkUserImporter, BulkImportSettings
+
+
+def import_users(csv_path, mint_license_codes=False, chunk_size=None):
+    """Import users from a CSV file and print the report"""
+    settings = BulkImportSettings()
+    if chunk_size:
+        settings.chunk_size = chunk_size
+    with open(csv_path, newline='', encoding='utf-8-sig') as csv_file:
+        report = BulkUserImporter(settings=settings).import_csv(csv_file, mint_license_codes=mint_license_codes)
+
+    print("\n=== Bulk Import ===")
+    print("Rows read:", report['rows'])
+    print("Imported:", report['imported'])
+    print("License codes created:", report['license_codes_created'])
+    print("Errors:", report['error_count'])
+    for error in report['errors']:
+        print(f"  line {error['line']}: {error['email'] or '-'}: {error['error']}")
+    if report['error_count'] > len(report['errors']):
+        print(f"  ... and {report['error_count'] - len(report['errors'])} more")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create accounts from a CSV with first_name, last_name, company_name and email columns")
+    parser.add_argument("csv_path")
+    parser.add_argument("--mint-license-codes", action="store_true", help="give every imported user a license code")
+    parser.add_argument("--chunk-size", type=int, help="rows inserted per transaction")
+    args = parser.parse_args()
+
+    import_users(args.csv_path, args.mint_license_codes, args.chunk_size)
@@ -9,18 +9,14 @@ sys.path.append(backend_dir)
 from utils.db_utils import get_license_repository
 
 def print_all_licenses():
-    """Print all licenses in the database"""
+    """Print all licenses in the database, streaming them from SQLite"""
     repo = get_license_repository()
-    licenses = repo.get_all_licenses()
+    total = 0
     
-    if not licenses:
-        print("No licenses found in database")
-        return
-        
-    print("\n=== All Licenses ===")
-    print(f"Total records: {len(licenses)}\n")
-    
-    for license in licenses:
+    for license in repo.iter_licenses():
+        if total == 0:
+            print("\n=== All Licenses ===\n")
+        total += 1
         print("License ID:", license['id'])
         print("Name:", f"{license['first_name']} {license['last_name']}")
         print("Company:", license['company_name'])
@@ -29,6 +25,11 @@ def print_all_licenses():
         print("Created:", license['created_at'])
         print("Updated:", license['updated_at'])
         print("-" * 50)
+    
+    if not total:
+        print("No licenses found in database")
+        return
+    print(f"Total records: {total}")
 
 if __name__ == "__main__":
     print_all_licenses()
@@ -0,0 +1,42 @@
+import sys
+import argparse
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = str(Path(__file__).parent.parent)
+sys.path.append(backend_dir)
+
+from utils.user_search import UserSearch
+
+
+def rebuild_search_index():
+    """Re-index every user for /admin/search, e.g. after a VACUUM"""
+    result = UserSearch().rebuild()
+    print("\n=== Search Index Rebuilt ===")
+    print(f"Took {result['elapsed_ms']}ms")
+    return result
+
+
+def search(query, column=None, limit=20):
+    """Print the users matching a search query, best first"""
+    users, _ = UserSearch().search(query, column, limit)
+    print(f"\n=== {len(users)} users matching {query!r} ===")
+    for user in users:
+        print(f"  {user['email']:40} {user['first_name']} {user['last_name']} ({user['company_name']})")
+    return users
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or query the FTS5 index behind /admin/search")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild", help="re-index every user")
+    search_parser = subparsers.add_parser("search", help="run a search")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--column", choices=["email", "first_name", "last_name", "company_name"])
+    search_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rebuild_search_index()
+    else:
+        search(args.query, args.column, args.limit)
@@ -0,0 +1,38 @@
+import sys
+import argparse
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = str(Path(__file__).parent.parent)
+sys.path.append(backend_dir)
+
+from utils.admin_stats import AdminStats
+
+
+def rebuild_stats(show=False):
+    """Recompute the admin stats tables from the licenses table and print the totals"""
+    stats = AdminStats()
+    totals = stats.rebuild()
+
+    print("\n=== Stats Rebuilt ===")
+    print("Users:", totals['users'])
+    print("Licensed users:", totals['licensed_users'])
+    print(f"Took {totals['elapsed_ms']}ms")
+    if show:
+        snapshot = stats.snapshot()
+        print("\nLicenses issued in the last 30 days:")
+        for day in snapshot['licenses_issued_per_day']:
+            print(f"  {day['day']}: {day['licenses']}")
+        print("\nTop companies:")
+        for company in snapshot['top_companies']:
+            print(f"  {company['company_name']}: {company['users']}")
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the counter tables behind /admin/stats from the licenses table")
+    parser.add_argument("--show", action="store_true", help="print the rebuilt figures")
+    args = parser.parse_args()
+
+    rebuild_stats(args.show)
@@ -0,0 +1,78 @@
+import sys
+import argparse
+from pathlib import Path
+
+# Add the backend directory to the Python path
+backend_dir = str(Path(__file__).parent.parent)
+sys.path.append(backend_dir)
+
+from utils.stripe_events import get_stripe_event_processor
+
+
+def list_events(status=None, limit=50):
+    """Print the most recently received Stripe events"""
+    processor = get_stripe_event_processor()
+    print("\n=== Stripe Events ===")
+    print("By status:", processor.stats()['by_status'])
+    events = processor.list_events(status, limit)
+    if not events:
+        print("No Stripe events found")
+        return
+    print()
+    for event in events:
+        print("Event ID:", event['id'])
+        print("Type:", event['type'])
+        print("Status:", event['status'])
+        print("Attempts:", event['attempts'], "| Deliveries:", event['deliveries'])
+        print("Received:", event['received_at'])
+        print("Processed:", event['processed_at'] or 'Not yet')
+        if event['last_error']:
+            print("Last error:", event['last_error'])
+        print("-" * 50)
+
+
+def replay(event_ids):
+    """Queue the given events to be applied again"""
+    processor = get_stripe_event_processor()
+    for event_id in event_ids:
+        if processor.replay(event_id):
+            print(f"Queued {event_id} for replay")
+        else:
+            print(f"Unknown event {event_id}")
+
+
+def replay_failed():
+    """Queue every failed event to be applied again"""
+    print(f"Queued {get_stripe_event_processor().replay_failed()} failed events for replay")
+
+
+def process_pending():
+    """Apply every due event now, in this process"""
+    processor = get_stripe_event_processor()
+    count = 0
+    while processor.process_one():
+        count += 1
+    print(f"Processed {count} events")
+    print("By status:", processor.stats()['by_status'])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded Stripe webhook events")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="show recent events")
+    list_parser.add_argument("--status", help="only events with this status (pending, processed, failed, ...)")
+    list_parser.add_argument("--limit", type=int, default=50)
+    replay_parser = commands.add_parser("replay", help="queue events to be applied again")
+    replay_parser.add_argument("event_ids", nargs="+")
+    commands.add_parser("replay-failed", help="queue every failed event again")
+    commands.add_parser("process", help="apply due events now instead of waiting for the server")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        list_events(args.status, args.limit)
+    elif args.command == "replay":
+        replay(args.event_ids)
+    elif args.command == "replay-failed":
+        replay_failed()
+    else:
+        process_pending()
@@ -0,0 +1,25 @@
+"""
+Shared pytest setup.
+
+Points DatabaseManager at a throwaway SQLite file before any test imports
+utils.db_utils, so tests never write to db/visionpay_licenses.db, and sets
+the admin API key that admin_client sends.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault(
+    'VISIONPAY_DB_PATH',
+    os.path.join(tempfile.mkdtemp(prefix='visionpay_tests_'), 'visionpay_test.db'))
+os.environ.setdefault('ADMIN_API_KEY', 'test-admin-key')
+
+
+@pytest.fixture
+def admin_client():
+    """TestClient for the app that sends the admin API key"""
+    from fastapi.testclient import TestClient
+    import api
+    return TestClient(api.app, headers={"X-Admin-API-Key": os.environ['ADMIN_API_KEY']})
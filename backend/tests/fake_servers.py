@@ -0,0 +1,205 @@
+"""
+Local stand-ins for external services, used by tests and benchmarks.
+
+SMTPSink is a minimal SMTP server that accepts AUTH PLAIN and swallows every
+message, so the email sender can be exercised without Gmail. FakeStripe
+implements the checkout session endpoints of the Stripe API with adjustable
+latency and failures; point stripe.api_base at its url.
+"""
+
+import json
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line: str):
+        if self.server.reply_delay:
+            time.sleep(self.server.reply_delay)
+        self.wfile.write(line.encode('ascii') + b"\r\n")
+
+    def handle(self):
+        sink = self.server
+        with sink.lock:
+            sink.connections += 1
+            sink.open_sockets.append(self.connection)
+        try:
+            self.reply("220 localhost SMTP sink ready")
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode('ascii', 'replace').strip()
+                verb = command.split(' ', 1)[0].upper()
+                if verb == 'EHLO':
+                    self.wfile.write(b"250-localhost\r\n")
+                    self.reply("250 AUTH PLAIN")
+                elif verb == 'AUTH':
+                    with sink.lock:
+                        sink.logins += 1
+                    self.reply("235 Authentication successful")
+                elif verb == 'DATA':
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    while self.rfile.readline() not in (b".\r\n", b""):
+                        pass
+                    with sink.lock:
+                        sink.messages += 1
+                    self.reply("250 Message accepted")
+                elif verb == 'QUIT':
+                    self.reply("221 Bye")
+                    return
+                else:
+                    # HELO, MAIL, RCPT, RSET, NOOP
+                    self.reply("250 OK")
+        except OSError:
+            return
+        finally:
+            with sink.lock:
+                if self.connection in sink.open_sockets:
+                    sink.open_sockets.remove(self.connection)
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """SMTP server on localhost that counts connections, logins and messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, reply_delay: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _SMTPSinkHandler)
+        self.reply_delay = reply_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.open_sockets: List[socket.socket] = []
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "SMTPSink":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def drop_connections(self):
+        """Close every client connection, as a server restart would"""
+        with self.lock:
+            sockets, self.open_sockets = self.open_sockets, []
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body: Dict[str, Any]):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Request-Id", f"req_{uuid.uuid4().hex[:14]}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self) -> Optional[Dict[str, Any]]:
+        fake = self.server
+        with fake.lock:
+            fake.requests += 1
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fake.fail_status:
+            self.send_json(fake.fail_status, {"error": {"type": "api_error", "message": "Fake Stripe failure"}})
+            return None
+        return {}
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qsl(self.rfile.read(length).decode('utf-8'))
+        if self.handle_request() is None:
+            return
+        if self.path != "/v1/checkout/sessions":
+            self.send_json(404, {"error": {"type": "invalid_request_error", "message": "Unrecognized request URL"}})
+            return
+        params = dict(form)
+        session = {
+            "id": f"cs_test_{uuid.uuid4().hex}",
+            "object": "checkout.session",
+            "mode": params.get("mode"),
+            "customer_email": params.get("customer_email"),
+            "payment_status": self.server.payment_status,
+            "success_url": params.get("success_url"),
+            "metadata": {key[len("metadata["):-1]: value for key, value in form if key.startswith("metadata[")}
+        }
+        with self.server.lock:
+            self.server.sessions[session["id"]] = session
+        self.send_json(200, session)
+
+    def do_GET(self):
+        if self.handle_request() is None:
+            return
+        prefix = "/v1/checkout/sessions/"
+        session = self.server.sessions.get(self.path[len(prefix):]) if self.path.startswith(prefix) else None
+        if session is None:
+            self.send_json(404, {"error": {"type": "invalid_request_error", "code": "resource_missing",
+                                           "message": "No such checkout.session"}})
+            return
+        self.send_json(200, session)
+
+
+class FakeStripe(ThreadingHTTPServer):
+    """Stripe API stand-in serving checkout sessions on localhost"""
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _FakeStripeHandler)
+        self.latency = latency
+        # Answer every request with this HTTP status instead, to simulate an outage
+        self.fail_status = 0
+        self.payment_status = "paid"
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_error(self, request, client_address):
+        # Clients that time out hang up before the delayed response is written
+        pass
+
+    def add_session(self, user_email: str, payment_status: str = "paid") -> str:
+        """Create a checkout session directly and return its id"""
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        with self.lock:
+            self.sessions[session_id] = {"id": session_id, "object": "checkout.session",
+                                         "payment_status": payment_status,
+                                         "metadata": {"user_email": user_email}}
+        return session_id
+
+    def start(self) -> "FakeStripe":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,81 @@
+"""
+Tests for the incrementally maintained admin stats.
+
+Run with: python -m pytest tests/test_admin_stats.py
+"""
+
+import io
+import uuid
+from datetime import datetime
+
+from utils.admin_stats import get_admin_stats
+from utils.bulk_import import BulkUserImporter
+from utils.db_utils import get_license_repository
+
+
+def unique(name: str) -> str:
+    return f"{name}-{uuid.uuid4().hex[:8]}"
+
+
+def company_users(snapshot, company_name):
+    return {company['company_name']: company['users'] for company in snapshot['top_companies']}.get(company_name)
+
+
+def test_counters_follow_every_write_and_match_a_rebuild():
+    repo = get_license_repository()
+    stats = get_admin_stats()
+    stats.rebuild()
+    before = stats.snapshot(top_companies=100)
+    company, renamed = unique("Stats Co"), unique("Renamed Co")
+    emails = [f"{unique('stats')}@stats.example.com" for _ in range(4)]
+
+    for email in emails:
+        repo.add_new_user("Stat", "Istic", company, email)
+    repo.create_and_set_license_key(emails[0])
+    repo.create_and_set_license_key(emails[1])
+    repo.create_and_set_license_key(emails[1])
+    repo.update_user_info(emails[2], company_name=renamed)
+    repo.delete_user(emails[0])
+    repo.add_new_user("Du", "Plicate", company, emails[3])
+    csv_text = "first_name,last_name,company_name,email\n" + "".join(
+        f"Bulk,{i},{company},{unique('bulk')}@stats.example.com\n" for i in range(3))
+    BulkUserImporter().import_csv(io.StringIO(csv_text), mint_license_codes=True)
+
+    after = stats.snapshot(top_companies=100)
+    assert after['users'] - before['users'] == 6
+    assert after['licensed_users'] - before['licensed_users'] == 4
+    assert after['users_without_license'] - before['users_without_license'] == 2
+    assert company_users(after, company) == 5
+    assert company_users(after, renamed) == 1
+    today = datetime.utcnow().date().isoformat()
+    issued_today = {day['day']: day['licenses'] for day in after['licenses_issued_per_day']}.get(today, 0)
+    issued_before = {day['day']: day['licenses'] for day in before['licenses_issued_per_day']}.get(today, 0)
+    assert issued_today - issued_before == 4
+
+    stats.rebuild()
+    assert stats.snapshot(top_companies=100) == after
+
+
+def test_company_rows_disappear_when_their_last_user_leaves():
+    repo = get_license_repository()
+    stats = get_admin_stats()
+    company = unique("Gone Co")
+    email = f"{unique('gone')}@stats.example.com"
+    repo.add_new_user("Go", "Ne", company, email)
+    assert company_users(stats.snapshot(top_companies=100), company) == 1
+
+    repo.delete_user(email)
+
+    assert company_users(stats.snapshot(top_companies=100), company) is None
+
+
+def test_stats_endpoints(admin_client):
+    rebuilt = admin_client.post("/admin/stats/rebuild")
+    snapshot = admin_client.get("/admin/stats", params={"days": 7, "top_companies": 3})
+
+    assert rebuilt.status_code == 200 and rebuilt.json()['users'] >= 0
+    assert snapshot.status_code == 200
+    body = snapshot.json()
+    assert body['users'] == rebuilt.json()['users']
+    assert len(body['top_companies']) <= 3
+    assert admin_client.get("/admin/stats", params={"days": 0}).status_code == 400
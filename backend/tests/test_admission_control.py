@@ -0,0 +1,131 @@
+"""
+Tests for per-route admission control and load shedding.
+
+Run with: python -m pytest tests/test_admission_control.py
+"""
+
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from utils.admission_control import (AdmissionControlMiddleware, AdmissionController, AdmissionSettings,
+                                     PriorityLimits, RouteGate, CRITICAL, LOW, NORMAL)
+
+
+def limits(concurrency=1, queue=1, target_ms=10, interval_ms=200):
+    return PriorityLimits(max_concurrency=concurrency, max_queue=queue, target_ms=target_ms, interval_ms=interval_ms)
+
+
+def test_routes_are_classified_by_priority():
+    settings = AdmissionSettings()
+
+    assert settings.priority_of("/check_license/{license_code}") == CRITICAL
+    assert settings.priority_of("/send-license-email") == LOW
+    assert settings.priority_of("/admin/search") == LOW
+    assert settings.priority_of("/create-account") == NORMAL
+    assert PriorityLimits.parse("8, 32, 5, 100") == limits(8, 32, 5, 100)
+
+
+def test_gate_queues_hands_over_slots_and_sheds_when_full():
+    async def scenario():
+        gate = RouteGate("/r", NORMAL, limits(concurrency=1, queue=1))
+        assert await gate.acquire()
+        waiting = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.queue_depth == 1
+        assert not await gate.acquire()
+
+        gate.release()
+        assert await waiting
+        assert (gate.in_flight, gate.queue_depth) == (1, 0)
+        gate.release()
+        return gate
+
+    gate = asyncio.run(scenario())
+    assert (gate.in_flight, gate.admitted, gate.queued, gate.shed_queue_full) == (0, 2, 1, 1)
+
+
+def test_standing_queue_switches_to_the_short_target_wait():
+    now = [0.0]
+
+    async def timed_acquire(gate):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert not await gate.acquire()
+        return loop.time() - started
+
+    async def scenario():
+        gate = RouteGate("/r", NORMAL, limits(concurrency=1, queue=10, target_ms=10, interval_ms=200),
+                         clock=lambda: now[0])
+        await gate.acquire()
+        normal_wait = await timed_acquire(gate)
+
+        blocker = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        # The queue has now been non-empty for longer than the interval
+        now[0] += 1
+        standing_wait = await timed_acquire(gate)
+        await blocker
+        return normal_wait, standing_wait, gate
+
+    normal_wait, standing_wait, gate = asyncio.run(scenario())
+    assert normal_wait >= 0.19
+    assert standing_wait < 0.1
+    assert gate.shed_wait == 3
+
+
+def make_app(**overrides):
+    settings = AdmissionSettings(critical_routes="/critical", low_priority_routes="/low",
+                                 normal=limits(concurrency=1, queue=0), low=limits(concurrency=10, queue=0),
+                                 low_priority_shed_in_flight=1, **overrides)
+    controller = AdmissionController(settings)
+    app = FastAPI()
+    app.add_middleware(AdmissionControlMiddleware, controller=controller)
+    release = asyncio.Event()
+
+    @app.get("/slow")
+    async def slow():
+        await release.wait()
+        return {}
+
+    @app.get("/critical")
+    async def critical():
+        return {}
+
+    @app.get("/low")
+    async def low():
+        return {}
+
+    return app, controller, release
+
+
+def test_middleware_sheds_with_503_and_protects_critical_routes():
+    async def scenario():
+        app, controller, release = make_app()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.ensure_future(client.get("/slow"))
+            while controller.in_flight == 0:
+                await asyncio.sleep(0.001)
+            responses = [await client.get(path) for path in ("/slow", "/low", "/critical")]
+            release.set()
+            assert (await slow).status_code == 200
+            after = await client.get("/low")
+        return responses, after, controller
+
+    (shed, low, critical), after, controller = asyncio.run(scenario())
+    assert shed.status_code == 503 and shed.headers["Retry-After"] == "1"
+    assert low.status_code == 503
+    assert critical.status_code == 200
+    assert after.status_code == 200
+    assert controller.in_flight == 0
+    assert controller.stats()['routes']['/slow']['shed_queue_full'] == 1
+    assert controller.shed_low_priority == 1
+
+
+def test_admission_stats_endpoint(admin_client):
+    response = admin_client.get("/admin/admission")
+
+    assert response.status_code == 200
+    assert response.json()['enabled'] is True
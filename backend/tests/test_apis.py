@@ -14,6 +14,7 @@ Run with: python test_apis.py
 
 import requests
 import json
+import os
 import time
 import sys
 from datetime import datetime
@@ -21,6 +22,8 @@ from typing import Dict, Any, Optional
 
 # Configuration
 BASE_URL = "http://localhost:8000"
+# Sent with every request; /licenses and /admin/* require it
+ADMIN_HEADERS = {"X-Admin-API-Key": os.getenv("ADMIN_API_KEY", "")}
 TEST_USER_DATA = {
     "first_name": "John",
     "last_name": "Doe", 
@@ -72,13 +75,13 @@ def make_request(method: str, endpoint: str, data: Optional[Dict] = None, params
     
     try:
         if method.upper() == "GET":
-            response = requests.get(url, params=params, timeout=10)
+            response = requests.get(url, params=params, headers=ADMIN_HEADERS, timeout=10)
         elif method.upper() == "POST":
-            response = requests.post(url, json=data, timeout=10)
+            response = requests.post(url, json=data, headers=ADMIN_HEADERS, timeout=10)
         elif method.upper() == "PUT":
-            response = requests.put(url, json=data, timeout=10)
+            response = requests.put(url, json=data, headers=ADMIN_HEADERS, timeout=10)
         elif method.upper() == "DELETE":
-            response = requests.delete(url, timeout=10)
+            response = requests.delete(url, headers=ADMIN_HEADERS, timeout=10)
         else:
             raise ValueError(f"Unsupported HTTP method: {method}")
         
@@ -422,6 +425,98 @@ def test_delete_user():
     
     return True
 
+# Batch license checks, run in-process by pytest rather than against a live server
+
+def app_client():
+    """A TestClient for the app, imported here so the script above runs without it"""
+    from fastapi.testclient import TestClient
+    import api
+    return TestClient(api.app)
+
+def issued_license_codes(count: int) -> list:
+    """Create count licensed users and return their codes"""
+    import uuid
+    from utils.db_utils import get_license_repository
+    repo = get_license_repository()
+    codes = []
+    for _ in range(count):
+        email = f"batch-{uuid.uuid4().hex[:8]}@example.com"
+        repo.add_new_user("Batch", "Check", "Batch Co", email)
+        codes.append(repo.create_and_set_license_key(email))
+    return codes
+
+def unissued_license_codes(count: int, prefix: str) -> list:
+    return [f"{prefix}{i:06d}" for i in range(count)]
+
+def test_check_licenses_empty_batch():
+    response = app_client().post("/check_licenses", json={"license_codes": []})
+
+    assert response.status_code == 200
+    assert response.json() == {"results": {}}
+
+def test_check_licenses_rejects_batches_over_the_cap():
+    import api
+    codes = unissued_license_codes(api.CHECK_LICENSES_MAX_CODES + 1, "CAP")
+
+    response = app_client().post("/check_licenses", json={"license_codes": codes})
+
+    assert response.status_code == 413
+    # Duplicates count once
+    response = app_client().post("/check_licenses", json={"license_codes": codes[:2] * 6000})
+    assert response.json() == {"results": {codes[0]: False, codes[1]: False}}
+
+def test_check_licenses_answers_across_query_chunks():
+    import api
+    from utils.db_utils import SQLITE_MAX_PARAMETERS
+    issued = issued_license_codes(4)
+    codes = unissued_license_codes(api.CHECK_LICENSES_STREAM_THRESHOLD, "CHUNK")
+    # First and last code of the first two chunks
+    positions = (0, SQLITE_MAX_PARAMETERS - 1, SQLITE_MAX_PARAMETERS, len(codes) - 1)
+    for position, code in zip(positions, issued):
+        codes[position] = code
+
+    response = app_client().post("/check_licenses", json={"license_codes": codes})
+
+    assert response.status_code == 200 and "content-length" in response.headers
+    results = response.json()["results"]
+    assert list(results) == codes
+    assert [code for code, valid in results.items() if valid] == issued
+
+def test_check_licenses_streams_large_batches():
+    import api
+    issued = issued_license_codes(2)
+    codes = issued[:1] + unissued_license_codes(2 * api.CHECK_LICENSES_STREAM_THRESHOLD, "STREAM") + issued[1:]
+
+    response = app_client().post("/check_licenses", json={"license_codes": codes})
+
+    assert response.status_code == 200 and "content-length" not in response.headers
+    results = response.json()["results"]
+    assert list(results) == codes
+    assert [code for code, valid in results.items() if valid] == issued
+
+def test_check_licenses_sees_codes_issued_by_another_process():
+    import os
+    import subprocess
+    import uuid
+    from pathlib import Path
+    email = f"batch-{uuid.uuid4().hex[:8]}@example.com"
+    # The other process exits before it rebuilds the license snapshot
+    script = f"""
+import os
+from utils.db_utils import get_license_repository
+repo = get_license_repository()
+repo.add_new_user("Batch", "Check", "Batch Co", {email!r})
+print(repo.create_and_set_license_key({email!r}), flush=True)
+os._exit(0)
+"""
+    result = subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, env=os.environ,
+                            capture_output=True, text=True, check=True, timeout=60)
+    license_code = result.stdout.split()[-1]
+
+    response = app_client().post("/check_licenses", json={"license_codes": [license_code, "NOTISSUED1"]})
+
+    assert response.json() == {"results": {license_code: True, "NOTISSUED1": False}}
+
 def run_complete_user_flow():
     """Run the complete user flow simulation"""
     print(f"\n{Colors.BOLD}{Colors.BLUE}=== VisionPay API Testing Suite ==={Colors.END}\n")
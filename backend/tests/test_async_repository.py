@@ -0,0 +1,86 @@
+"""
+Tests for AsyncLicenseRepository, the awaitable repository the endpoints use.
+
+Run with: python -m pytest tests/test_async_repository.py
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+import api
+from utils.db_utils import AsyncLicenseRepository, get_license_repository
+
+
+class SlowRepository:
+    """Stands in for LicenseRepository with a blocking query that records its concurrency"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.running = 0
+        self.most_running = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def get_user_by_id(self, user_id: str):
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            self.threads.add(threading.get_ident())
+        time.sleep(self.seconds)
+        with self._lock:
+            self.running -= 1
+        return {'id': user_id}
+
+
+def test_queries_run_off_the_event_loop_within_the_thread_limit():
+    slow = SlowRepository(seconds=0.1)
+    repo = AsyncLicenseRepository(slow)
+    repo.thread_limit = 2
+
+    async def scenario():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        users = await asyncio.gather(*(repo.get_user_by_id(str(i)) for i in range(6)))
+        ticker.cancel()
+        return users, ticks
+
+    users, ticks = asyncio.run(scenario())
+
+    assert users == [{'id': str(i)} for i in range(6)]
+    assert slow.most_running == 2
+    assert threading.get_ident() not in slow.threads
+    # Three rounds of 0.1s; a blocked loop would not have ticked in between
+    assert ticks >= 15
+
+
+def test_repository_works_from_one_event_loop_after_another():
+    # Built outside any event loop, as api builds it at import
+    repo = AsyncLicenseRepository(get_license_repository())
+    email = f"async-{uuid.uuid4().hex[:8]}@example.com"
+
+    async def create():
+        await repo.add_new_user("As", "Ync", "Async Co", email)
+        return await repo.create_and_set_license_key(email)
+
+    async def look_up(license_code: str):
+        return await repo.get_license_by_email(email), await repo.license_code_exists(license_code)
+
+    license_code = asyncio.run(create())
+    license_info, issued = asyncio.run(look_up(license_code))
+
+    assert license_info['license_code'] == license_code and issued
+    # TestClient runs the app on yet another loop
+    response = TestClient(api.app).get(f"/check_license/{license_code}")
+    assert response.status_code == 200 and response.json()['valid']
+    assert asyncio.run(repo.delete_user(email))
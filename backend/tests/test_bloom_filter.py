@@ -0,0 +1,148 @@
+"""
+Unit tests for the license code Bloom filter.
+
+Run with: python -m pytest tests/test_bloom_filter.py
+"""
+
+import os
+import secrets
+import string
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import api
+from utils.bloom_filter import BloomFilter, BloomFilterSettings, LicenseCodeGuard
+
+ALPHABET = string.ascii_letters + string.digits
+
+
+def random_code() -> str:
+    return ''.join(secrets.choice(ALPHABET) for _ in range(10))
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(capacity=5000, false_positive_rate=0.01)
+    codes = [random_code() for _ in range(5000)]
+    for code in codes:
+        bloom.add(code)
+    assert all(code in bloom for code in codes)
+
+
+def test_false_positive_rate_close_to_target():
+    bloom = BloomFilter(capacity=5000, false_positive_rate=0.01)
+    issued = {random_code() for _ in range(5000)}
+    for code in issued:
+        bloom.add(code)
+
+    probes = [code for code in (random_code() for _ in range(20000)) if code not in issued]
+    false_positives = sum(1 for code in probes if code in bloom)
+    assert false_positives / len(probes) < 0.03
+    assert bloom.estimated_false_positive_rate() < 0.02
+
+
+def test_memory_budget_caps_filter_size():
+    bloom = BloomFilter(capacity=1_000_000, false_positive_rate=0.001, max_bytes=1024)
+    assert bloom.size_bytes == 1024
+
+
+def issue_license_in_another_process() -> str:
+    """Create a licensed user through a second process, which exits before rebuilding the snapshot"""
+    email = f"elsewhere-{uuid.uuid4().hex[:8]}@example.com"
+    script = f"""
+import os
+from utils.db_utils import get_license_repository
+repo = get_license_repository()
+repo.add_new_user("Else", "Where", "Elsewhere Co", {email!r})
+print(repo.create_and_set_license_key({email!r}), flush=True)
+os._exit(0)
+"""
+    result = subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent,
+                            env=os.environ, capture_output=True, text=True, check=True, timeout=60)
+    return result.stdout.split()[-1]
+
+
+def test_codes_issued_by_another_process_are_not_rejected():
+    repo = api.license_repo
+    license_code = issue_license_in_another_process()
+
+    assert not repo.code_guard.ready
+    assert not repo.certainly_missing(license_code)
+    assert repo.license_code_exists(license_code)
+    assert repo.get_license_by_code(license_code)['license_code'] == license_code
+    assert repo.get_licenses_by_codes([license_code]).keys() == {license_code}
+
+
+def test_guard_is_disabled_when_other_processes_write():
+    stats = TestClient(api.app).get("/cache-stats").json()['license_code_guard']
+
+    assert not stats['enabled'] and 'license snapshot' in stats['disabled_reason']
+    assert api.license_repo.code_guard.might_contain("NOTISSUED1")
+
+
+def test_sole_writer_rejects_unissued_codes_with_the_guard():
+    script = """
+import os
+from utils.db_utils import get_license_repository
+repo = get_license_repository()
+repo.add_new_user("Me", "Mory", "Memory Co", "memory@example.com")
+license_code = repo.create_and_set_license_key("memory@example.com")
+assert repo.code_guard.ready
+assert repo.license_code_exists(license_code)
+assert not repo.license_code_exists("NOTISSUED1")
+assert repo.code_guard.rejected == 1
+os._exit(0)
+"""
+    env = dict(os.environ, VISIONPAY_DB_PATH=':memory:')
+    subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, env=env,
+                   check=True, timeout=60)
+
+
+def make_guard(**settings) -> LicenseCodeGuard:
+    """A guard separate from the process-wide singleton"""
+    guard = object.__new__(LicenseCodeGuard)
+    guard.__init__()
+    guard.settings = BloomFilterSettings(**settings)
+    return guard
+
+
+def test_codes_added_during_a_rebuild_are_kept():
+    guard = make_guard(expected_items=100)
+
+    def loader():
+        # Issued after the codes were read, before the new filter is swapped in
+        guard.add("BBBBBBBBBB")
+        return ["AAAAAAAAAA"]
+
+    guard.build(loader)
+    guard.build(loader)
+
+    assert guard.might_contain("AAAAAAAAAA") and guard.might_contain("BBBBBBBBBB")
+
+
+def test_rebuilds_run_off_the_calling_thread():
+    codes = [f"CODE{i:06d}" for i in range(20)]
+    builds = []
+
+    def loader():
+        builds.append(threading.get_ident())
+        return list(codes)
+
+    guard = make_guard(expected_items=100, rebuild_stale_ratio=0.1, rebuild_debounce_seconds=0.05)
+    guard.build(loader)
+    for code in codes[:5]:
+        codes.remove(code)
+        guard.remove(code)
+
+    assert len(builds) == 1
+    deadline = time.monotonic() + 10
+    while guard.rebuilds < 2:
+        assert time.monotonic() < deadline, "the stale filter was not rebuilt"
+        time.sleep(0.01)
+    assert len(builds) == 2 and builds[1] != threading.get_ident()
+    assert guard.stale_items == 0
@@ -0,0 +1,93 @@
+"""
+Tests for bulk user imports from CSV.
+
+Run with: python -m pytest tests/test_bulk_import.py
+"""
+
+import io
+import uuid
+
+from utils.bulk_import import BulkUserImporter, BulkImportSettings
+from utils.db_utils import get_license_repository
+
+
+def make_csv(rows, header="first_name,last_name,company_name,email") -> str:
+    return "\n".join([header] + [",".join(row) for row in rows]) + "\n"
+
+
+def unique_email(name: str) -> str:
+    return f"{name}-{uuid.uuid4().hex[:8]}@import.example.com"
+
+
+def test_rows_are_imported_in_chunks_with_per_row_errors():
+    repo = get_license_repository()
+    existing = unique_email("existing")
+    repo.add_new_user("Ex", "Isting", "Import Co", existing)
+    good = [unique_email(f"seat{i}") for i in range(5)]
+    rows = [("Seat", str(i), "Import Co", email) for i, email in enumerate(good)]
+    rows += [
+        ("No", "Email", "Import Co", ""),
+        ("Bad", "Email", "Import Co", "not-an-email"),
+        ("Dup", "Licate", "Import Co", good[0]),
+        ("Al", "Ready", "Import Co", existing),
+    ]
+    importer = BulkUserImporter(settings=BulkImportSettings(chunk_size=2))
+
+    report = importer.import_csv(io.StringIO(make_csv(rows)))
+
+    assert (report['rows'], report['imported'], report['error_count']) == (9, 5, 4)
+    assert [(error['line'], error['error']) for error in report['errors']] == [
+        (7, "missing email"), (8, "invalid email"), (9, "duplicate email in file"),
+        (10, "email already registered")]
+    for email in good:
+        assert repo.user_exists(email)
+        assert repo.get_license_by_email(email)['license_code'] is None
+
+
+def test_import_can_mint_license_codes():
+    repo = get_license_repository()
+    emails = [unique_email(f"minted{i}") for i in range(3)]
+    csv_text = make_csv([("Min", "Ted", "Mint Co", email) for email in emails])
+
+    report = BulkUserImporter().import_csv(io.StringIO(csv_text), mint_license_codes=True)
+
+    assert report['license_codes_created'] == 3
+    codes = {repo.get_license_by_email(email)['license_code'] for email in emails}
+    assert len(codes) == 3 and None not in codes
+    assert all(repo.license_code_exists(code) for code in codes)
+
+
+def test_negative_cache_entries_are_dropped_on_import():
+    repo = get_license_repository()
+    email = unique_email("cached")
+    assert repo.user_exists(email) is False
+
+    BulkUserImporter().import_csv(io.StringIO(make_csv([("Ca", "Ched", "Cache Co", email)])))
+
+    assert repo.user_exists(email) is True
+
+
+def test_conflicting_rows_fall_back_to_row_by_row_inserts():
+    repo = get_license_repository()
+    email = unique_email("conflict")
+    other = unique_email("other")
+    users = [{'first_name': "A", 'last_name': "B", 'company_name': "C", 'email': address}
+             for address in (email, email, other)]
+
+    results = repo.bulk_add_users(users, mint_license_codes=True)
+
+    assert results == [None, "email already registered", None]
+    assert repo.get_license_by_email(email)['license_code']
+    assert repo.get_license_by_email(other)['license_code']
+
+
+def test_upload_endpoint_imports_csv(admin_client):
+    email = unique_email("upload")
+    response = admin_client.post("/admin/import-users",
+                                 files={"file": ("seats.csv", make_csv([("Up", "Load", "Upload Co", email)]))},
+                                 data={"mint_license_codes": "true"})
+    assert response.status_code == 200
+    assert response.json()['imported'] == 1
+
+    response = admin_client.post("/admin/import-users", files={"file": ("seats.csv", "name,email\nA,a@example.com\n")})
+    assert response.status_code == 400
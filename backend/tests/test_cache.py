@@ -0,0 +1,127 @@
+"""
+Unit tests for the TTL + LRU license lookup cache, and for the repository
+writes that invalidate it.
+
+Run with: python -m pytest tests/test_cache.py
+"""
+
+import uuid
+
+from utils.cache import TTLCache, MISSING
+from utils.db_utils import get_license_repository
+
+
+class FakeClock:
+    """Manually advanced clock so expiry can be tested without sleeping"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_cache(max_size: int = 3) -> tuple:
+    clock = FakeClock()
+    cache = TTLCache(max_size=max_size, ttl_seconds=10, negative_ttl_seconds=2, clock=clock)
+    return cache, clock
+
+
+def test_hit_and_miss_counters():
+    cache, _ = make_cache()
+    assert cache.get("ABC") is MISSING
+    cache.set("ABC", {"license_code": "ABC"})
+    assert cache.get("ABC") == {"license_code": "ABC"}
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+
+
+def test_negative_entries_use_their_own_ttl():
+    cache, clock = make_cache()
+    cache.set("positive", {"license_code": "positive"})
+    cache.set("negative", None)
+
+    clock.now = 3
+    assert cache.get("negative") is MISSING
+    assert cache.get("positive") is not MISSING
+
+    clock.now = 11
+    assert cache.get("positive") is MISSING
+    assert cache.stats()["expirations"] == 2
+
+
+def test_lru_eviction():
+    cache, _ = make_cache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_and_disabled_cache():
+    cache, _ = make_cache()
+    cache.set("a", 1)
+    cache.invalidate("a")
+    assert cache.get("a") is MISSING
+    assert cache.stats()["invalidations"] == 1
+
+    disabled = TTLCache(max_size=0, ttl_seconds=10, negative_ttl_seconds=2)
+    disabled.set("a", 1)
+    assert disabled.get("a") is MISSING
+
+
+def add_user() -> str:
+    email = f"cache-{uuid.uuid4().hex[:8]}@example.com"
+    get_license_repository().add_new_user("Ca", "Che", "Cache Co", email)
+    return email
+
+
+def test_issuing_a_license_invalidates_the_cached_user():
+    repo = get_license_repository()
+    email = add_user()
+    assert repo.get_license_by_email(email)['license_code'] is None
+    assert repo.cache.by_email.get(email) is not MISSING
+
+    license_code = repo.create_and_set_license_key(email)
+
+    assert repo.get_license_by_email(email)['license_code'] == license_code
+    assert repo.get_license_by_code(license_code)['email'] == email
+    assert repo.license_code_exists(license_code)
+
+
+def test_updating_a_user_invalidates_both_cached_lookups():
+    repo = get_license_repository()
+    email = add_user()
+    license_code = repo.create_and_set_license_key(email)
+    repo.get_license_by_email(email)
+    repo.get_license_by_code(license_code)
+
+    assert repo.update_user_info(email, company_name="Renamed Co")
+
+    assert repo.get_license_by_email(email)['company_name'] == "Renamed Co"
+    assert repo.get_license_by_code(license_code)['company_name'] == "Renamed Co"
+
+
+def test_deleting_a_user_invalidates_every_cached_lookup():
+    repo = get_license_repository()
+    email = add_user()
+    license_code = repo.create_and_set_license_key(email)
+    repo.get_license_by_email(email)
+    repo.query_license_by_code(license_code)
+    repo.cache.code_exists.set(license_code, True)
+
+    assert repo.delete_user(email)
+
+    assert repo.get_license_by_email(email) is None
+    assert repo.cache.by_code.get(license_code) is MISSING
+    assert repo.cache.code_exists.get(license_code) is MISSING
+    assert repo.get_license_by_code(license_code) is None
+    assert not repo.license_code_exists(license_code)
@@ -0,0 +1,92 @@
+"""
+Tests for the license email outbox and its retry / dead-letter handling.
+
+Run with: python -m pytest tests/test_email_outbox.py
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from utils.db_utils import get_license_repository, EmailOutbox
+from utils.email_outbox import EmailOutboxWorker, EmailOutboxSettings
+
+
+class StubSender:
+    """Records sends and fails the first `failures` of them"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.sent = []
+
+    def send_license_email(self, email, company_name, license_key):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("SMTP unavailable")
+        self.sent.append((email, company_name, license_key))
+        return True, license_key
+
+
+def make_worker(sender, max_attempts: int = 3) -> EmailOutboxWorker:
+    settings = EmailOutboxSettings(max_attempts=max_attempts, backoff_seconds=60)
+    return EmailOutboxWorker(settings, sender_factory=lambda: sender)
+
+
+def queue_license_email() -> tuple:
+    repo = get_license_repository()
+    email = f"outbox-{uuid.uuid4().hex[:8]}@example.com"
+    repo.add_new_user("Out", "Box", "Outbox Co", email)
+    license_key = repo.create_and_set_license_key(email, enqueue_email=True)
+    return repo, email, license_key
+
+
+def make_due(worker: EmailOutboxWorker):
+    with worker.db_manager.get_connection() as connection:
+        connection.execute(update(EmailOutbox).where(EmailOutbox.status == 'pending')
+                           .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1)))
+        connection.commit()
+
+
+def drain(worker: EmailOutboxWorker, sender):
+    while worker.process_one(sender):
+        pass
+
+
+def test_license_key_and_email_are_queued_together():
+    _, email, license_key = queue_license_email()
+    sender = StubSender()
+    worker = make_worker(sender)
+
+    drain(worker, sender)
+
+    assert (email, "Outbox Co", license_key) in sender.sent
+    assert worker.stats()['by_status'].get('pending', 0) == 0
+
+
+def test_failed_send_is_retried_with_backoff():
+    _, email, license_key = queue_license_email()
+    sender = StubSender(failures=1)
+    worker = make_worker(sender)
+
+    drain(worker, sender)
+    assert worker.failed == 1
+    assert (email, "Outbox Co", license_key) not in sender.sent
+
+    make_due(worker)
+    drain(worker, sender)
+    assert (email, "Outbox Co", license_key) in sender.sent
+
+
+def test_message_is_dead_lettered_after_max_attempts():
+    queue_license_email()
+    sender = StubSender(failures=10)
+    worker = make_worker(sender, max_attempts=2)
+
+    drain(worker, sender)
+    make_due(worker)
+    drain(worker, sender)
+
+    assert worker.dead_lettered == 1
+    assert worker.stats()['by_status'].get('dead', 0) >= 1
+    assert worker.retry_dead_letters() >= 1
@@ -0,0 +1,44 @@
+"""
+Tests for the compiled license email templates and message skeleton.
+
+Run with: python -m pytest tests/test_email_templates.py
+"""
+
+import email
+from email import policy
+
+import pytest
+
+from utils.email_sender import LicenseEmailTemplate, LICENSE_EMAIL_SUBJECT
+
+
+def parse(raw: str):
+    return email.message_from_string(raw, policy=policy.default)
+
+
+def test_message_has_text_and_html_alternatives():
+    template = LicenseEmailTemplate("noreply@visionpay.example.com")
+    message = parse(template.build_message("buyer@example.com", "Acme", "ABCDEFGHIJ"))
+
+    assert message['Subject'] == LICENSE_EMAIL_SUBJECT
+    assert message['From'] == "noreply@visionpay.example.com"
+    assert message['To'] == "buyer@example.com"
+    assert message.get_content_type() == "multipart/alternative"
+    assert [part.get_content_type() for part in message.iter_parts()] == ["text/plain", "text/html"]
+    assert "ABCDEFGHIJ" in message.get_body(("plain",)).get_content()
+    assert '<div class="license-key">ABCDEFGHIJ</div>' in message.get_body(("html",)).get_content()
+    assert not message.defects
+
+
+def test_recipient_fields_are_escaped_and_encoded():
+    template = LicenseEmailTemplate("noreply@visionpay.example.com")
+    message = parse(template.build_message("buyer@example.com", "Société <Générale>", "<KEY>"))
+
+    assert "Société <Générale>" in message.get_body(("plain",)).get_content()
+    assert "&lt;KEY&gt;" in message.get_body(("html",)).get_content()
+
+
+def test_recipient_with_line_break_is_rejected():
+    template = LicenseEmailTemplate("noreply@visionpay.example.com")
+    with pytest.raises(ValueError):
+        template.build_message("buyer@example.com\r\nBcc: everyone@example.com", "Acme", "ABCDEFGHIJ")
@@ -0,0 +1,76 @@
+"""
+Tests for the Core EXISTS lookups behind the yes/no license endpoints.
+
+Run with: python -m pytest tests/test_existence_queries.py
+"""
+
+import uuid
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import api
+from utils.cache import MISSING
+from utils.db_utils import get_db_manager, get_license_repository
+
+
+@contextmanager
+def captured_statements():
+    """Collect the SQL sent to SQLite while the block runs"""
+    statements = []
+    engine = get_db_manager()._engine
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def create_licensed_user() -> tuple:
+    repo = get_license_repository()
+    email = f"exists-{uuid.uuid4().hex[:8]}@example.com"
+    repo.add_new_user("Ex", "Ists", "Exists Co", email)
+    return email, repo.create_and_set_license_key(email)
+
+
+def test_existence_checks_select_only_exists():
+    repo = get_license_repository()
+    email, license_code = create_licensed_user()
+    repo.cache.clear()
+
+    with captured_statements() as statements:
+        answers = [repo.user_exists(email), repo.user_exists(f"nobody-{email}"),
+                   repo.query_license_code_exists(license_code), repo.query_license_code_exists("NOTISSUED1")]
+
+    assert answers == [True, False, True, False]
+    assert len(statements) == 4
+    assert all(statement.startswith("SELECT EXISTS") for statement in statements)
+    assert not any("licenses.first_name" in statement for statement in statements)
+
+
+def test_existence_answers_are_cached_until_the_license_changes():
+    repo = get_license_repository()
+    email, license_code = create_licensed_user()
+    repo.query_license_code_exists(license_code)
+    assert repo.cache.code_exists.get(license_code) is True
+
+    repo.delete_user(email)
+
+    assert repo.cache.code_exists.get(license_code) is MISSING
+    assert not repo.query_license_code_exists(license_code)
+    assert not repo.user_exists(email)
+
+
+def test_yes_no_endpoints():
+    email, license_code = create_licensed_user()
+    client = TestClient(api.app)
+
+    assert client.get(f"/check_license/{license_code}").json() == {"valid": True}
+    assert client.get("/check_license/NOTISSUED1").json() == {"valid": False}
+    assert client.get(f"/user-exists/{email}").json() == {"exists": True}
+    assert client.get(f"/user-exists/nobody-{email}").json() == {"exists": False}
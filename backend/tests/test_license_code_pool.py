@@ -0,0 +1,78 @@
+"""
+Tests for the pool of pre-generated license codes.
+
+Run with: python -m pytest tests/test_license_code_pool.py
+"""
+
+import uuid
+
+from sqlalchemy import delete, select
+
+from utils.db_utils import get_license_repository, LicenseCodePool
+from utils.license_code_pool import LicenseCodeAllocator, LicenseCodePoolSettings
+
+
+def make_allocator(target_size: int = 20, enabled: bool = True) -> LicenseCodeAllocator:
+    settings = LicenseCodePoolSettings(enabled=enabled, low_watermark=5, target_size=target_size, batch_size=8)
+    return LicenseCodeAllocator(settings)
+
+
+def empty_pool(allocator: LicenseCodeAllocator):
+    with allocator.db_manager.get_connection() as connection:
+        connection.execute(delete(LicenseCodePool))
+        connection.commit()
+
+
+def new_user() -> str:
+    email = f"pool-{uuid.uuid4().hex[:8]}@example.com"
+    get_license_repository().add_new_user("Po", "Ol", "Pool Co", email)
+    return email
+
+
+def test_refill_tops_pool_up_to_target():
+    allocator = make_allocator()
+    empty_pool(allocator)
+
+    assert allocator.refill() == 20
+    assert allocator.depth() == 20
+    assert allocator.refill() == 0
+
+
+def test_license_key_is_claimed_from_pool(monkeypatch):
+    allocator = make_allocator()
+    empty_pool(allocator)
+    allocator.refill()
+    with allocator.db_manager.get_connection() as connection:
+        oldest = connection.execute(
+            select(LicenseCodePool.license_code).order_by(LicenseCodePool.id).limit(1)).scalar_one()
+    repo = get_license_repository()
+    monkeypatch.setattr(repo, "code_allocator", allocator)
+
+    license_key = repo.create_and_set_license_key(new_user())
+
+    assert license_key == oldest
+    assert allocator.depth() == 19
+    assert allocator.stats()['claimed'] == 1
+    assert repo.license_code_exists(license_key)
+
+
+def test_empty_or_disabled_pool_falls_back_to_generated_codes(monkeypatch):
+    repo = get_license_repository()
+    for allocator in (make_allocator(), make_allocator(enabled=False)):
+        empty_pool(allocator)
+        monkeypatch.setattr(repo, "code_allocator", allocator)
+        assert repo.create_and_set_license_key(new_user())
+    assert allocator.depth() == 0
+
+
+def test_minting_skips_codes_already_issued(monkeypatch):
+    allocator = make_allocator(target_size=2)
+    empty_pool(allocator)
+    issued = get_license_repository().create_and_set_license_key(new_user())
+    batches = iter([{issued, "Fresh00001"}, {"Fresh00001", "Fresh00002"}])
+    monkeypatch.setattr(allocator, "_candidates", lambda count: next(batches))
+
+    assert allocator.refill() == 2
+    with allocator.db_manager.get_connection() as connection:
+        pooled = set(connection.execute(select(LicenseCodePool.license_code)).scalars())
+    assert pooled == {"Fresh00001", "Fresh00002"}
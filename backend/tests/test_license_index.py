@@ -0,0 +1,132 @@
+"""
+Tests for the packed uint64 license code index.
+
+Run with: python -m pytest tests/test_license_index.py
+"""
+
+import os
+import secrets
+import string
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import api
+from utils.license_index import PackedCodeIndex, decode_key, encode_code, encode_codes, INVALID_KEY
+
+ALPHABET = string.ascii_letters + string.digits
+
+
+def random_code() -> str:
+    return ''.join(secrets.choice(ALPHABET) for _ in range(10))
+
+
+def test_keys_round_trip_and_sort_like_the_codes():
+    codes = [random_code() for _ in range(2000)] + ["0000000000", "zzzzzzzzzz"]
+    keys = encode_codes(codes)
+
+    assert keys.tolist() == [encode_code(code) for code in codes]
+    assert [decode_key(key) for key in keys] == codes
+    assert [decode_key(key) for key in np.sort(keys)] == sorted(codes)
+
+
+def test_codes_that_cannot_be_packed_are_rejected():
+    invalid = ["short", "ABCDEFGHIJK", "ABCDEFGHI-", "ABCDEFGHIü", "ABCDEFGHI一", "", "ABCDEFGHIJ\x00",
+               "ABCDEFGHI\x00", "ABCDEFGHIJ\x00\x00\x00"]
+
+    assert all(encode_code(code) is None for code in invalid)
+    assert (encode_codes(invalid) == INVALID_KEY).all()
+    assert (encode_codes(["ABCDEFGHIJ", "short"]) == [encode_code("ABCDEFGHIJ"), INVALID_KEY]).all()
+
+
+def test_pending_changes_are_visible_before_and_after_a_merge():
+    codes = [random_code() for _ in range(1000)]
+    index = PackedCodeIndex.from_codes(codes[:500], merge_threshold=100, chunk_size=64)
+    for code in codes[500:550]:
+        index.add(code)
+    for code in codes[:10] + codes[500:505]:
+        index.discard(code)
+    strangers = [random_code() for _ in range(100)]
+
+    def check():
+        present = set(codes[10:500] + codes[505:550])
+        expected = [code in present for code in codes + strangers]
+        assert index.contains_many(codes + strangers).tolist() == expected
+        assert [code in index for code in codes + strangers] == expected
+        assert len(index) == len(present)
+
+    check()
+    index.merge()
+    assert index.merges == 1
+    check()
+
+    for code in codes[550:]:
+        index.add(code)
+    assert index.merges == 5
+    assert index.contains_many(codes[550:]).all()
+
+
+def create_licensed_user() -> tuple:
+    email = f"index-{uuid.uuid4().hex[:8]}@example.com"
+    api.license_repo.add_new_user("In", "Dex", "Index Co", email)
+    return email, api.license_repo.create_and_set_license_key(email)
+
+
+def sync_index_with_snapshot():
+    repo = api.license_repo
+    repo.snapshot.rebuild()
+    repo.license_codes_exist(["0000000000"])
+    deadline = time.monotonic() + 10
+    while repo.code_index.generation != repo.snapshot.covering().generation:
+        assert time.monotonic() < deadline, "license index did not catch up with the snapshot"
+        time.sleep(0.01)
+
+
+def test_batch_check_answers_issued_codes_from_the_index():
+    repo = api.license_repo
+    email, license_code = create_licensed_user()
+    sync_index_with_snapshot()
+    answered = repo.code_index.answered
+
+    response = TestClient(api.app).post("/check_licenses", json={"license_codes": [license_code, "NOTISSUED1"]})
+
+    assert response.json() == {"results": {license_code: True, "NOTISSUED1": False}}
+    assert repo.code_index.answered == answered + 2
+    repo.delete_user(email)
+    assert repo.license_codes_exist([license_code]) == {license_code: False}
+
+
+def test_code_with_trailing_nul_is_not_valid():
+    email, license_code = create_licensed_user()
+    sync_index_with_snapshot()
+
+    response = TestClient(api.app).post("/check_licenses", json={"license_codes": [license_code + "\x00"]})
+
+    assert response.json() == {"results": {license_code + "\x00": False}}
+    api.license_repo.delete_user(email)
+
+
+def test_code_deleted_by_another_process_is_no_longer_valid():
+    repo = api.license_repo
+    email, license_code = create_licensed_user()
+    sync_index_with_snapshot()
+    assert repo.license_codes_exist([license_code]) == {license_code: True}
+
+    # The other process exits before it rebuilds the snapshot
+    script = f"""
+import os
+from utils.db_utils import get_license_repository
+get_license_repository().delete_user({email!r})
+os._exit(0)
+"""
+    subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, env=os.environ,
+                   check=True, timeout=60)
+
+    assert repo.license_codes_exist([license_code]) == {license_code: False}
+    response = TestClient(api.app).post("/check_licenses", json={"license_codes": [license_code]})
+    assert response.json() == {"results": {license_code: False}}
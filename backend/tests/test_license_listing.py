@@ -0,0 +1,92 @@
+"""
+Tests for keyset-paginated license listing and streaming exports.
+
+Run with: python -m pytest tests/test_license_listing.py
+"""
+
+import csv
+import io
+import json
+import math
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+import api
+from utils.db_utils import get_license_repository, License, decode_license_cursor
+
+
+def walk_pages(repo, limit: int):
+    licenses, cursor = repo.get_licenses_page(limit)
+    pages = 1
+    while cursor:
+        page, cursor = repo.get_licenses_page(limit, cursor)
+        licenses += page
+        pages += 1
+    return licenses, pages
+
+
+def test_pages_cover_every_license_once_in_order():
+    repo = get_license_repository()
+    # Rows sharing a created_at are ordered by id
+    same_time = datetime(2020, 1, 1)
+    with repo.db_manager.get_connection() as connection:
+        connection.execute(insert(License.__table__), [
+            {'id': f"00000000-page-{i:04d}", 'first_name': "Page", 'last_name': str(i), 'company_name': "Page Co",
+             'email': f"page{i}-{datetime.utcnow().timestamp()}@example.com", 'created_at': same_time,
+             'updated_at': same_time} for i in range(7)])
+        connection.commit()
+
+    everything = list(repo.iter_licenses(batch_size=3))
+    licenses, pages = walk_pages(repo, 3)
+
+    assert licenses == everything
+    assert pages == math.ceil(len(everything) / 3)
+    keys = [(license['created_at'], license['id']) for license in licenses]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+
+def test_listing_and_admin_routes_require_the_admin_key():
+    client = TestClient(api.app)
+    for path in ("/licenses", "/licenses/export", "/admin/stats"):
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={"X-Admin-API-Key": "wrong"}).status_code == 401
+
+
+def test_malformed_cursor_is_rejected(admin_client):
+    with pytest.raises(ValueError):
+        decode_license_cursor("not-a-cursor")
+    response = admin_client.get("/licenses", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_endpoint_pages_with_next_cursor_header(admin_client):
+    repo = get_license_repository()
+    repo.add_new_user("List", "Ing", "List Co", f"listing-{datetime.utcnow().timestamp()}@example.com")
+
+    seen, cursor = [], None
+    while True:
+        response = admin_client.get("/licenses", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        assert isinstance(response.json(), list)
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [license['id'] for license in seen] == [license['id'] for license in repo.iter_licenses()]
+    assert admin_client.get("/licenses", params={"limit": 0}).status_code == 400
+
+
+def test_exports_stream_every_license(admin_client):
+    repo = get_license_repository()
+    expected = [license['id'] for license in repo.iter_licenses()]
+
+    ndjson = admin_client.get("/licenses/export", params={"format": "ndjson"})
+    assert [json.loads(line)['id'] for line in ndjson.text.splitlines()] == expected
+
+    exported = admin_client.get("/licenses/export", params={"format": "csv"})
+    assert [row['id'] for row in csv.DictReader(io.StringIO(exported.text))] == expected
+    assert admin_client.get("/licenses/export", params={"format": "xml"}).status_code == 400
@@ -0,0 +1,139 @@
+"""
+Tests for the memory-mapped license code snapshot.
+
+Run with: python -m pytest tests/test_license_snapshot.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import api
+from utils.license_snapshot import (LicenseSnapshot, LicenseSnapshotSettings, MappedSnapshot,
+                                    read_generation, write_snapshot)
+
+
+def snapshot_path() -> str:
+    return os.path.join(tempfile.mkdtemp(prefix='visionpay_snapshot_'), 'licenses.db.snapshot')
+
+
+def make_snapshot(path: str, codes) -> LicenseSnapshot:
+    settings = LicenseSnapshotSettings(enabled=True, reload_check_seconds=0, min_interval_seconds=3600)
+    snapshot = LicenseSnapshot(settings, path=path)
+    snapshot._loader = lambda: sorted(codes)
+    return snapshot
+
+
+def test_write_and_map_round_trip():
+    path = snapshot_path()
+    codes = sorted(["A1b2C3d4E5", "zzzzzzzzzz", "0000000000", "short", "ünïcödé123"])
+
+    result = write_snapshot(path, codes, built_at=time.time())
+    mapped = MappedSnapshot(path)
+
+    assert result == {'generation': 1, 'codes': 3, 'skipped': 2}
+    assert all(code in mapped for code in ("A1b2C3d4E5", "zzzzzzzzzz", "0000000000"))
+    assert "A1b2C3d4E6" not in mapped
+    assert "short" not in mapped and "ünïcödé123" not in mapped
+    assert write_snapshot(path, codes, built_at=time.time())['generation'] == 2
+    assert read_generation(path) == 2
+
+
+def test_readers_answer_only_from_a_snapshot_newer_than_every_change():
+    path = snapshot_path()
+    codes = ["AAAAAAAAAA"]
+    writer = make_snapshot(path, codes)
+    reader = make_snapshot(path, codes)
+    writer.rebuild()
+
+    assert reader.lookup("AAAAAAAAAA") is True
+    assert reader.lookup("BBBBBBBBBB") is False
+
+    codes.append("BBBBBBBBBB")
+    writer.changed()
+    assert reader.lookup("BBBBBBBBBB") is None
+    assert reader.lookup("AAAAAAAAAA") is None
+
+    writer.rebuild()
+    assert reader.lookup("BBBBBBBBBB") is True
+    assert reader.stats()['generation'] == 2
+
+
+def test_deleted_code_is_not_trusted_until_a_newer_snapshot_drops_it():
+    path = snapshot_path()
+    codes = ["AAAAAAAAAA", "BBBBBBBBBB"]
+    snapshot = make_snapshot(path, codes)
+    snapshot.rebuild()
+
+    snapshot._removed["AAAAAAAAAA"] = time.time()
+    assert snapshot.lookup("AAAAAAAAAA") is False
+
+    codes.remove("AAAAAAAAAA")
+    snapshot.rebuild()
+    assert snapshot.lookup("AAAAAAAAAA") is False
+    assert snapshot.stats()['pending_removals'] == 0
+
+
+def test_removals_are_not_lost_while_snapshots_reload():
+    path = snapshot_path()
+    snapshot = make_snapshot(path, [])
+    snapshot.rebuild()
+
+    def remove(prefix: str):
+        for i in range(20000):
+            snapshot.removed(f"{prefix}{i:09d}")
+
+    workers = [threading.Thread(target=remove, args=(prefix,)) for prefix in "ABCD"]
+    switch_interval = sys.getswitchinterval()
+    # Switch threads often, so removals land in the middle of a reload
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in workers:
+            thread.start()
+        while any(thread.is_alive() for thread in workers):
+            # Built long ago, so none of the removals are covered by it
+            write_snapshot(path, [], built_at=0)
+            snapshot._reload()
+        for thread in workers:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    assert snapshot.stats()['pending_removals'] == 80000
+
+
+def test_pending_rebuild_is_flushed_when_a_writer_exits():
+    path = snapshot_path()
+    script = f"""
+from utils.license_snapshot import LicenseSnapshot, LicenseSnapshotSettings
+snapshot = LicenseSnapshot(LicenseSnapshotSettings(debounce_seconds=3600), path={path!r})
+snapshot.start(lambda: ["AAAAAAAAAA"])
+"""
+    subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, check=True, timeout=60)
+
+    assert read_generation(path) == 1
+    assert "AAAAAAAAAA" in MappedSnapshot(path)
+
+
+def test_repository_answers_from_the_snapshot():
+    repo = api.license_repo
+    email = f"snapshot-{uuid.uuid4().hex[:8]}@example.com"
+    repo.add_new_user("Snap", "Shot", "Snapshot Co", email)
+    license_code = repo.create_and_set_license_key(email)
+
+    repo.snapshot.rebuild()
+    answered = repo.snapshot.answered
+    assert repo.license_code_exists(license_code)
+    assert repo.snapshot.answered == answered + 1
+
+    repo.delete_user(email)
+    assert not repo.license_code_exists(license_code)
+    stats = TestClient(api.app).get("/cache-stats").json()['license_snapshot']
+    assert stats['ready'] and not stats['covers_changes']
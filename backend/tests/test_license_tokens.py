@@ -0,0 +1,105 @@
+"""
+Unit tests for offline-verifiable signed license tokens.
+
+Run with: python -m pytest tests/test_license_tokens.py
+"""
+
+import json
+
+from fastapi.testclient import TestClient
+
+import api
+from utils.license_tokens import LicenseTokenSigner, LicenseTokenSettings, _b64encode
+
+
+def make_signer(signing_keys: str, active_key_id: str = "") -> LicenseTokenSigner:
+    return LicenseTokenSigner(LicenseTokenSettings(
+        signing_keys=signing_keys, active_key_id=active_key_id, ttl_days=30))
+
+
+def test_issue_and_verify_round_trip():
+    signer = make_signer("k1:first-secret")
+    token = signer.issue("license-id", "Test Company", issued_at=1_700_000_000)
+
+    claims = signer.verify(token, now=1_700_000_100)
+    assert claims == {
+        "lid": "license-id",
+        "cmp": "Test Company",
+        "iat": 1_700_000_000,
+        "exp": 1_700_000_000 + 30 * 86400
+    }
+
+
+def test_expired_and_tampered_tokens_are_rejected():
+    signer = make_signer("k1:first-secret")
+    token = signer.issue("license-id", "Test Company", issued_at=1_700_000_000)
+
+    assert signer.verify(token, now=1_700_000_000 + 31 * 86400) is None
+
+    key_id, payload, signature = token.split(".")
+    forged = make_signer("k1:other-secret").issue("license-id", "Evil Corp", issued_at=1_700_000_000)
+    assert signer.verify(f"{key_id}.{forged.split('.')[1]}.{signature}", now=1_700_000_100) is None
+    assert signer.verify("not-a-token") is None
+
+
+def test_key_rotation_keeps_old_tokens_valid():
+    old_signer = make_signer("k1:first-secret")
+    old_token = old_signer.issue("license-id", "Test Company", issued_at=1_700_000_000)
+
+    rotated = make_signer("k1:first-secret,k2:second-secret", active_key_id="k2")
+    new_token = rotated.issue("license-id", "Test Company", issued_at=1_700_000_000)
+
+    assert new_token.startswith("k2.")
+    assert rotated.verify(old_token, now=1_700_000_100) is not None
+    assert rotated.verify(new_token, now=1_700_000_100) is not None
+    assert old_signer.verify(new_token, now=1_700_000_100) is None
+
+
+def test_disabled_without_keys():
+    signer = make_signer("")
+    assert not signer.enabled
+    assert signer.issue("license-id", "Test Company") is None
+
+
+def signed(signer: LicenseTokenSigner, claims) -> str:
+    """A token with a valid signature over arbitrary claims"""
+    payload = _b64encode(json.dumps(claims).encode('utf-8'))
+    return f"k1.{payload}.{signer._sign('k1', payload)}"
+
+
+MALFORMED_TOKENS = [
+    "k1.é.abc",
+    "k1.abc.é",
+    "k1.abc.def.ghi",
+    "k1.!!!.abc",
+]
+
+
+def test_malformed_tokens_are_rejected():
+    signer = make_signer("k1:first-secret")
+    claims = {"lid": "license-id", "cmp": "Test Company", "iat": 1_700_000_000, "exp": 1_800_000_000}
+    malformed = MALFORMED_TOKENS + [
+        signed(signer, [1]),
+        signed(signer, "text"),
+        signed(signer, {key: value for key, value in claims.items() if key != "cmp"}),
+        signed(signer, {**claims, "iat": "yesterday"}),
+        signed(signer, {**claims, "exp": None}),
+    ]
+
+    assert signer.verify(signed(signer, claims), now=1_700_000_100) == claims
+    for token in malformed:
+        assert signer.verify(token, now=1_700_000_100) is None, token
+
+
+def test_verify_token_endpoint_answers_invalid_for_malformed_tokens(monkeypatch):
+    signer = make_signer("k1:first-secret")
+    monkeypatch.setattr(api.license_repo, "token_signer", signer)
+    client = TestClient(api.app)
+
+    for token in MALFORMED_TOKENS + [signed(signer, [1]), signed(signer, {"exp": 4_000_000_000})]:
+        response = client.post("/verify-token", data={"token": token})
+        assert response.status_code == 200, token
+        assert response.json() == {"valid": False}
+
+    token = signer.issue("license-id", "Test Company")
+    assert client.post("/verify-token", data={"token": token}).json()["valid"] is True
@@ -0,0 +1,120 @@
+"""
+Tests for the Prometheus metrics served on /metrics.
+
+Run with: python -m pytest tests/test_metrics.py
+"""
+
+import asyncio
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import api
+from tests.fake_servers import SMTPSink
+from utils.email_sender import EmailSettings, SMTPConnectionPool
+from utils.metrics import MetricsMiddleware, MetricsRegistry, MetricsSettings, ServerMetrics, get_metrics
+from utils.stripe_gateway import StripeGateway, StripeGatewaySettings, StripeUnavailableError
+
+
+def sample(text: str, name: str, **labels) -> float:
+    """Value of the sample with exactly these labels, or 0 if it is absent"""
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = re.escape(f"{name}{{{label_text}}}" if labels else name) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_registry_renders_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ('path',))
+    latency = registry.histogram('latency_seconds', 'Latency', (), buckets=(0.1, 1.0))
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    for value in (0.05, 0.5, 5.0):
+        latency.labels().observe(value)
+
+    text = registry.render()
+
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{path="/a\\"b"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert sample(text, 'latency_seconds_sum') == pytest.approx(5.55)
+    with pytest.raises(ValueError):
+        requests.labels('/a', 'extra')
+
+
+def test_requests_are_labelled_by_route_template():
+    client = TestClient(api.app)
+    before = client.get("/metrics").text
+
+    client.get("/check_license/AAAAAAAAAA")
+    client.get("/check_license/BBBBBBBBBB")
+    client.get("/no/such/route")
+    response = client.get("/metrics")
+
+    assert response.headers['content-type'].startswith("text/plain; version=0.0.4")
+    text = response.text
+    route = "/check_license/{license_code}"
+    assert sample(text, 'http_requests_total', method="GET", route=route, status="200") - \
+        sample(before, 'http_requests_total', method="GET", route=route, status="200") == 2
+    assert sample(text, 'http_request_duration_seconds_count', method="GET", route=route) - \
+        sample(before, 'http_request_duration_seconds_count', method="GET", route=route) == 2
+    assert sample(text, 'http_requests_total', method="GET", route="<unmatched>", status="404") >= 1
+    assert 'AAAAAAAAAA' not in text
+    assert sample(text, 'http_requests_in_progress', method="GET", route=route) == 0
+    assert sample(text, 'http_requests_in_progress', method="GET", route="/metrics") == 1
+    assert sample(text, 'db_query_duration_seconds_count', operation="select") > 0
+
+
+def test_unhandled_errors_are_counted():
+    metrics = ServerMetrics(MetricsSettings(enabled=True))
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+    @app.get("/boom/{item}")
+    async def boom(item: str):
+        raise RuntimeError("boom")
+
+    client = TestClient(app, raise_server_exceptions=False)
+    assert client.get("/boom/1").status_code == 500
+
+    text = metrics.render()
+    assert sample(text, 'http_request_errors_total', method="GET", route="/boom/{item}") == 1
+    assert sample(text, 'http_requests_total', method="GET", route="/boom/{item}", status="500") == 1
+    assert sample(text, 'http_requests_in_progress', method="GET", route="/boom/{item}") == 0
+
+
+def test_stripe_and_smtp_calls_are_timed():
+    metrics = get_metrics()
+    gateway = StripeGateway(StripeGatewaySettings(failure_threshold=1, reset_seconds=60))
+
+    def fail():
+        raise ConnectionError("down")
+
+    assert asyncio.run(gateway.call('metrics_test', lambda: 42)) == 42
+    with pytest.raises(ConnectionError):
+        asyncio.run(gateway.call('metrics_test', fail))
+    with pytest.raises(StripeUnavailableError):
+        asyncio.run(gateway.call('metrics_test', lambda: 42))
+
+    sink = SMTPSink().start()
+    try:
+        pool = SMTPConnectionPool(EmailSettings(
+            email_sender="noreply@visionpay.example.com", app_password="secret", smtp_host="127.0.0.1",
+            smtp_port=sink.port, smtp_starttls=False, smtp_timeout_seconds=5))
+        pool.sendmail("noreply@visionpay.example.com", "a@example.com", "Subject: hi\r\n\r\nbody")
+        pool.close_all()
+    finally:
+        sink.stop()
+
+    text = metrics.render()
+    for outcome in ('ok', 'error'):
+        assert sample(text, 'stripe_request_duration_seconds_count', operation="metrics_test", outcome=outcome) == 1
+    assert sample(text, 'stripe_breaker_rejections_total', operation="metrics_test") == 1
+    assert sample(text, 'smtp_operation_duration_seconds_count', operation="connect", outcome="ok") >= 1
+    assert sample(text, 'smtp_operation_duration_seconds_count', operation="send", outcome="ok") >= 1
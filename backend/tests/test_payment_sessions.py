@@ -0,0 +1,104 @@
+"""
+Tests for the completed checkout session cache behind /process-payment-success.
+
+Run with: python -m pytest tests/test_payment_sessions.py
+"""
+
+import asyncio
+import uuid
+
+import httpx
+import pytest
+import stripe
+from sqlalchemy import select, func
+
+import api
+from tests.fake_servers import FakeStripe
+from utils.cache import SingleFlight
+from utils.db_utils import get_license_repository, EmailOutbox
+from utils.payment_sessions import PaymentSessionStore
+from utils.stripe_gateway import StripeGateway, StripeGatewaySettings
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    server = FakeStripe().start()
+    monkeypatch.setattr(stripe, "api_base", server.url)
+    monkeypatch.setattr(stripe, "api_key", "sk_test_fake")
+    monkeypatch.setattr(api, "stripe_gateway", StripeGateway(StripeGatewaySettings(timeout_seconds=5)))
+    monkeypatch.setattr(api, "payment_sessions", PaymentSessionStore())
+    yield server
+    server.stop()
+
+
+def new_paid_session(fake_stripe: FakeStripe) -> tuple:
+    email = f"session-{uuid.uuid4().hex[:8]}@example.com"
+    get_license_repository().add_new_user("Pay", "Ment", "Session Co", email)
+    return email, fake_stripe.add_session(email)
+
+
+def queued_emails(email: str) -> int:
+    with api.payment_sessions.db_manager.get_connection() as connection:
+        return connection.execute(
+            select(func.count()).select_from(EmailOutbox).where(EmailOutbox.email == email)).scalar_one()
+
+
+async def post_many(session_id: str, count: int):
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(
+            client.post("/process-payment-success", data={"session_id": session_id}) for _ in range(count)))
+
+
+def test_reloads_do_not_call_stripe_or_queue_email_again(fake_stripe):
+    email, session_id = new_paid_session(fake_stripe)
+
+    first, = asyncio.run(post_many(session_id, 1))
+    for _ in range(3):
+        again, = asyncio.run(post_many(session_id, 1))
+        assert again.json() == first.json()
+
+    assert first.json()["email"] == email
+    assert fake_stripe.requests == 1
+    assert queued_emails(email) == 1
+
+
+def test_concurrent_calls_collapse_into_one(fake_stripe):
+    fake_stripe.latency = 0.2
+    email, session_id = new_paid_session(fake_stripe)
+
+    responses = asyncio.run(post_many(session_id, 10))
+
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["license_key"] for response in responses}) == 1
+    assert fake_stripe.requests == 1
+    assert queued_emails(email) == 1
+    assert api.payment_sessions.single_flight.collapsed == 9
+
+
+def test_outcome_survives_a_restart(fake_stripe):
+    email, session_id = new_paid_session(fake_stripe)
+    first, = asyncio.run(post_many(session_id, 1))
+
+    store = PaymentSessionStore()
+    assert store.get_outcome(session_id) == {"email": email, "license_code": first.json()["license_key"],
+                                             "status": "success"}
+    assert store.get_outcome("cs_test_unknown") is None
+
+
+def test_single_flight_shares_errors():
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.run("key", failing) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(calls) == 1
+    assert flight.stats()["in_flight"] == 0
@@ -0,0 +1,79 @@
+"""
+Tests for the per-request SQL profiler.
+
+Run with: python -m pytest tests/test_query_profiler.py
+"""
+
+import uuid
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from utils.db_utils import get_db_manager, get_license_repository, get_async_license_repository
+from utils.query_profiler import QueryProfilerMiddleware, QueryProfilerSettings, profile_queries
+
+LOOKUP = text("SELECT email FROM licenses WHERE email = :email")
+
+
+def test_duplicate_repeated_and_slow_statements_are_flagged():
+    settings = QueryProfilerSettings(slow_query_ms=0, repeat_threshold=3)
+    db_manager = get_db_manager()
+
+    with profile_queries(settings) as profile:
+        with db_manager.get_connection() as connection:
+            connection.execute(LOOKUP, {'email': "same@profiler.example.com"})
+            connection.execute(LOOKUP, {'email': "same@profiler.example.com"})
+            for i in range(3):
+                connection.execute(LOOKUP, {'email': f"user{i}@profiler.example.com"})
+
+    assert profile.query_count == 5
+    assert profile.total_seconds > 0
+    assert [count for _, count in profile.duplicates()] == [2]
+    assert [count for _, count in profile.repeated()] == [5]
+    assert len(profile.slow_queries) == 5
+    assert profile.summary()['duplicates'][0]['statement'].startswith("SELECT email FROM licenses")
+
+
+def test_queries_outside_a_profile_are_not_recorded():
+    with profile_queries() as profile:
+        pass
+    with get_db_manager().get_connection() as connection:
+        connection.execute(LOOKUP, {'email': "nobody@profiler.example.com"})
+
+    assert profile.query_count == 0
+
+
+def test_middleware_attributes_worker_thread_queries_to_the_request():
+    repo = get_license_repository()
+    email = f"profiled-{uuid.uuid4().hex[:8]}@profiler.example.com"
+    repo.add_new_user("Pro", "Filer", "Profiler Co", email)
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware, settings=QueryProfilerSettings(enabled=True))
+
+    @app.get("/async/{email}")
+    async def async_lookup(email: str):
+        # AsyncLicenseRepository runs the query in an anyio worker thread
+        repo.cache.clear()
+        return await get_async_license_repository().get_license_by_email(email)
+
+    @app.get("/sync/{email}")
+    def sync_lookup(email: str):
+        repo.cache.clear()
+        repo.get_license_by_email(email)
+        repo.cache.clear()
+        return repo.get_license_by_email(email)
+
+    @app.get("/none")
+    async def no_queries():
+        return {}
+
+    client = TestClient(app)
+    async_response = client.get(f"/async/{email}")
+    sync_response = client.get(f"/sync/{email}")
+
+    assert async_response.json()['email'] == email
+    assert int(async_response.headers['X-DB-Queries']) == 1
+    assert float(async_response.headers['X-DB-Time']) > 0
+    assert int(sync_response.headers['X-DB-Queries']) == 2
+    assert client.get("/none").headers['X-DB-Queries'] == "0"
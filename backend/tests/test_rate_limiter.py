@@ -0,0 +1,127 @@
+"""
+Tests for the token bucket rate limit on license lookup endpoints.
+
+Run with: python -m pytest tests/test_rate_limiter.py
+"""
+
+import os
+import tempfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import api
+from utils.rate_limiter import (MemoryTokenBuckets, SQLiteTokenBuckets, RateLimiter, RateLimitMiddleware,
+                                RateLimitSettings)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets_and_clock(request):
+    clock = FakeClock()
+    if request.param == 'memory':
+        yield MemoryTokenBuckets(stripes=4, cleanup_interval_seconds=60, clock=clock), clock
+        return
+    path = os.path.join(tempfile.mkdtemp(prefix='visionpay_rate_limit_'), 'buckets.db')
+    yield SQLiteTokenBuckets(path, cleanup_interval_seconds=60, clock=clock), clock
+
+
+def test_buckets_allow_a_burst_then_refill_at_the_rate(buckets_and_clock):
+    buckets, clock = buckets_and_clock
+
+    assert [buckets.acquire("a", rate=2, burst=3) for _ in range(3)] == [0, 0, 0]
+    assert buckets.acquire("a", rate=2, burst=3) == pytest.approx(0.5)
+    assert buckets.acquire("b", rate=2, burst=3) == 0
+
+    clock.now += 0.5
+    assert buckets.acquire("a", rate=2, burst=3) == 0
+    assert buckets.acquire("a", rate=2, burst=3) == pytest.approx(0.5)
+
+
+def test_idle_buckets_are_dropped_once_full(buckets_and_clock):
+    buckets, clock = buckets_and_clock
+    buckets.acquire("idle", rate=1, burst=10)
+    buckets.acquire("busy", rate=1, burst=100)
+
+    clock.now += 10
+    assert buckets.cleanup() == 1
+    assert len(buckets) == 1
+
+    # A dropped bucket comes back full, as it would have been anyway
+    assert buckets.acquire("idle", rate=1, burst=10) == 0
+
+
+def make_app(**settings):
+    limiter = RateLimiter(RateLimitSettings(backend='memory', **settings))
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter)
+    calls = []
+
+    @app.get("/check_license/{license_code}")
+    async def check_license(license_code: str):
+        calls.append(license_code)
+        return {"valid": False}
+
+    @app.get("/open")
+    async def open_route():
+        return {}
+
+    return app, limiter, calls
+
+
+def test_limited_requests_get_429_before_reaching_the_handler():
+    app, limiter, calls = make_app(rate_per_second=0.5, burst=2)
+    client = TestClient(app)
+
+    statuses = [client.get(f"/check_license/CODE{i}").status_code for i in range(4)]
+    limited = client.get("/check_license/OTHER")
+
+    assert statuses == [200, 200, 429, 429]
+    assert limited.json() == {"detail": "Too many requests"}
+    assert limited.headers["Retry-After"] == "2"
+    assert calls == ["CODE0", "CODE1"]
+    assert all(client.get("/open").status_code == 200 for _ in range(5))
+    assert (limiter.allowed, limiter.limited) == (2, 3)
+
+
+def test_clients_are_limited_separately():
+    app, limiter, _ = make_app(rate_per_second=0.1, burst=1, trust_forwarded_for=True)
+    client = TestClient(app)
+
+    first = client.get("/check_license/X", headers={"X-Forwarded-For": "203.0.113.1, 10.0.0.1"})
+    second = client.get("/check_license/X", headers={"X-Forwarded-For": "203.0.113.2"})
+    repeat = client.get("/check_license/X", headers={"X-Forwarded-For": "203.0.113.1"})
+
+    assert (first.status_code, second.status_code, repeat.status_code) == (200, 200, 429)
+
+
+def test_batch_checks_are_charged_per_code(monkeypatch):
+    limiter = RateLimiter(RateLimitSettings(backend='memory', codes_per_second=1, code_burst=50))
+    monkeypatch.setattr(api, "rate_limiter", limiter)
+    client = TestClient(api.app)
+
+    def check(count: int, prefix: str):
+        return client.post("/check_licenses", json={"license_codes": [f"{prefix}{i:05d}" for i in range(count)]})
+
+    large = check(100, "LARGE")
+    first, second = check(30, "FIRST"), check(30, "SECND")
+
+    assert large.status_code == 429 and large.headers["Retry-After"] == "50"
+    assert (first.status_code, second.status_code) == (200, 429)
+    assert second.headers["Retry-After"] == "10"
+    assert (limiter.allowed, limiter.limited) == (1, 2)
+
+
+def test_rate_limiter_stats_endpoint(admin_client):
+    response = admin_client.get("/admin/rate-limiter")
+
+    assert response.status_code == 200
+    assert "/check_license/{license_code}" in response.json()['routes']
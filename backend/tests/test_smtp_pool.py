@@ -0,0 +1,64 @@
+"""
+Tests for the pooled SMTP connections behind LicenseEmailSender.
+
+Run with: python -m pytest tests/test_smtp_pool.py
+"""
+
+import pytest
+
+from tests.fake_servers import SMTPSink
+from utils.email_sender import EmailSettings, LicenseEmailSender, SMTPConnectionPool
+
+
+@pytest.fixture
+def sink():
+    server = SMTPSink().start()
+    yield server
+    server.stop()
+
+
+def make_settings(sink: SMTPSink, **overrides) -> EmailSettings:
+    values = dict(email_sender="noreply@visionpay.example.com", app_password="secret",
+                  smtp_host="127.0.0.1", smtp_port=sink.port, smtp_starttls=False,
+                  smtp_timeout_seconds=5, pool_size=2)
+    values.update(overrides)
+    return EmailSettings(**values)
+
+
+def test_connection_is_reused_across_messages(sink):
+    pool = SMTPConnectionPool(make_settings(sink))
+    for i in range(5):
+        pool.sendmail("noreply@visionpay.example.com", f"user{i}@example.com", "Subject: hi\r\n\r\nbody")
+
+    assert sink.messages == 5
+    assert sink.logins == 1
+    assert pool.stats()['reuses'] == 4
+    pool.close_all()
+
+
+def test_dropped_connection_is_replaced(sink):
+    pool = SMTPConnectionPool(make_settings(sink))
+    pool.sendmail("noreply@visionpay.example.com", "a@example.com", "Subject: hi\r\n\r\nbody")
+    sink.drop_connections()
+    pool.sendmail("noreply@visionpay.example.com", "b@example.com", "Subject: hi\r\n\r\nbody")
+
+    assert sink.messages == 2
+    assert sink.logins == 2
+    pool.close_all()
+
+
+def test_idle_connections_are_closed(sink):
+    pool = SMTPConnectionPool(make_settings(sink, idle_timeout_seconds=0))
+    pool.sendmail("noreply@visionpay.example.com", "a@example.com", "Subject: hi\r\n\r\nbody")
+    pool.close_idle()
+
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['idle_closed'] == 1
+
+
+def test_license_email_goes_through_the_pool(sink):
+    sender = LicenseEmailSender(make_settings(sink))
+    assert sender.send_license_email("a@example.com", "Pool Co", "ABCDEFGHIJ") == (True, "ABCDEFGHIJ")
+    assert sender.send_license_email("b@example.com", "Pool Co", "KLMNOPQRST") == (True, "KLMNOPQRST")
+    assert sink.messages == 2
+    assert sink.logins == 1
@@ -0,0 +1,60 @@
+"""
+Tests for the SQLite performance profiles and connection pooling of DatabaseManager.
+
+Run with: python -m pytest tests/test_sqlite_profile.py
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy.pool import QueuePool
+
+from utils.db_utils import DatabaseSettings, SQLITE_PROFILES, get_db_manager
+
+
+def test_profiles_and_overrides():
+    assert DatabaseSettings(profile='production').pragmas() == SQLITE_PROFILES['production']
+    assert DatabaseSettings(profile='default').pragmas() == {}
+    assert DatabaseSettings(profile='default', busy_timeout='100').pragmas() == {'busy_timeout': '100'}
+    assert DatabaseSettings(profile='production', synchronous='FULL').pragmas()['synchronous'] == 'FULL'
+    with pytest.raises(ValueError):
+        DatabaseSettings(profile='fastest').pragmas()
+
+
+def pragma(connection, name: str):
+    return connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+
+def test_production_pragmas_apply_to_every_pooled_connection():
+    manager = get_db_manager()
+    assert manager.settings.profile == 'production'
+    assert isinstance(manager._engine.pool, QueuePool)
+
+    # Two connections checked out at once are two separate SQLite connections
+    with manager.get_connection() as first, manager.get_connection() as second:
+        for connection in (first, second):
+            assert pragma(connection, "journal_mode") == 'wal'
+            assert pragma(connection, "synchronous") == 1  # NORMAL
+            assert pragma(connection, "busy_timeout") == 5000
+            assert pragma(connection, "cache_size") == -64 * 1024
+            assert pragma(connection, "temp_store") == 2  # MEMORY
+
+
+def test_in_memory_database_is_shared_by_every_session():
+    script = """
+import os
+from sqlalchemy.pool import StaticPool
+from utils.db_utils import get_db_manager, get_license_repository
+assert isinstance(get_db_manager()._engine.pool, StaticPool)
+repo = get_license_repository()
+repo.add_new_user("In", "Memory", "Memory Co", "memory@example.com")
+with get_db_manager().get_connection() as connection:
+    assert connection.exec_driver_sql("SELECT count(*) FROM licenses").scalar() == 1
+os._exit(0)
+"""
+    env = dict(os.environ, VISIONPAY_DB_PATH=':memory:')
+    subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, env=env,
+                   check=True, timeout=60)
@@ -0,0 +1,139 @@
+"""
+Tests for the Stripe webhook event ledger and its background processor.
+
+Run with: python -m pytest tests/test_stripe_events.py
+"""
+
+import hashlib
+import hmac
+import json
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select, func
+
+from utils.db_utils import get_license_repository, EmailOutbox, StripeEvent
+from utils.stripe_events import StripeEventProcessor, StripeEventSettings
+
+WEBHOOK_SECRET = "whsec_test_secret"
+
+
+def make_processor(max_attempts: int = 3) -> StripeEventProcessor:
+    return StripeEventProcessor(StripeEventSettings(max_attempts=max_attempts, backoff_seconds=60))
+
+
+def new_customer() -> str:
+    email = f"stripe-{uuid.uuid4().hex[:8]}@example.com"
+    get_license_repository().add_new_user("Stripe", "Buyer", "Stripe Co", email)
+    return email
+
+
+def checkout_event(email: str, event_id: str = None) -> dict:
+    return {
+        "id": event_id or f"evt_{uuid.uuid4().hex}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {"id": "cs_test_1", "object": "checkout.session",
+                            "metadata": {"user_email": email, "company_name": "Stripe Co"}}}
+    }
+
+
+def record(processor: StripeEventProcessor, event: dict) -> bool:
+    return processor.record(event["id"], event["type"], json.dumps(event))
+
+
+def drain(processor: StripeEventProcessor):
+    while processor.process_one():
+        pass
+
+
+def queued_emails(processor: StripeEventProcessor, email: str) -> int:
+    with processor.db_manager.get_connection() as connection:
+        return connection.execute(
+            select(func.count()).select_from(EmailOutbox).where(EmailOutbox.email == email)).scalar_one()
+
+
+def event_row(processor: StripeEventProcessor, event_id: str):
+    with processor.db_manager.get_connection() as connection:
+        return connection.execute(select(StripeEvent).where(StripeEvent.id == event_id)).first()
+
+
+def test_checkout_event_is_applied_once():
+    email = new_customer()
+    event = checkout_event(email)
+    processor = make_processor()
+
+    assert record(processor, event) is True
+    assert record(processor, event) is False
+    drain(processor)
+
+    assert get_license_repository().get_license_by_email(email)['license_code']
+    assert queued_emails(processor, email) == 1
+    row = event_row(processor, event["id"])
+    assert (row.status, row.deliveries, row.attempts) == ("processed", 2, 1)
+
+
+def test_failed_event_is_retried_then_marked_failed():
+    event = checkout_event("nobody-" + uuid.uuid4().hex[:8] + "@example.com")
+    processor = make_processor(max_attempts=1)
+
+    record(processor, event)
+    drain(processor)
+
+    row = event_row(processor, event["id"])
+    assert row.status == "failed"
+    assert "Failed to create license key" in row.last_error
+    assert processor.replay_failed() >= 1
+    assert event_row(processor, event["id"]).status == "pending"
+
+
+def test_replay_applies_event_again():
+    email = new_customer()
+    event = checkout_event(email)
+    processor = make_processor()
+    record(processor, event)
+    drain(processor)
+
+    assert processor.replay(event["id"]) is True
+    assert processor.replay("evt_unknown") is False
+    drain(processor)
+
+    # The license key is kept; replaying resends the license email
+    assert queued_emails(processor, email) == 2
+    assert event_row(processor, event["id"]).status == "processed"
+
+
+def test_unhandled_event_types_are_ignored():
+    processor = make_processor()
+    event = {"id": f"evt_{uuid.uuid4().hex}", "type": "invoice.paid", "data": {"object": {}}}
+    record(processor, event)
+    drain(processor)
+
+    assert event_row(processor, event["id"]).status == "ignored"
+
+
+def signed_headers(payload: str) -> dict:
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return {"stripe-signature": f"t={timestamp},v1={signature}", "content-type": "application/json"}
+
+
+def test_webhook_records_event_and_acknowledges(monkeypatch):
+    import api
+
+    monkeypatch.setattr(api, "STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    client = TestClient(api.app)
+    email = new_customer()
+    payload = json.dumps(checkout_event(email))
+
+    for _ in range(2):
+        response = client.post("/stripe-webhook", content=payload, headers=signed_headers(payload))
+        assert response.status_code == 200
+    assert client.post("/stripe-webhook", content=payload, headers={"stripe-signature": "t=1,v1=bad"}).status_code == 400
+
+    # Nothing is applied until the processor runs
+    assert get_license_repository().get_license_by_email(email)['license_code'] is None
+    drain(api.stripe_events)
+    assert get_license_repository().get_license_by_email(email)['license_code']
+    assert queued_emails(api.stripe_events, email) == 1
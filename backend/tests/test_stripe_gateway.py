@@ -0,0 +1,146 @@
+"""
+Tests for the Stripe gateway: thread offload, timeouts and the circuit breaker.
+Stripe calls go to the FakeStripe server in tests/fake_servers.py.
+
+Run with: python -m pytest tests/test_stripe_gateway.py
+"""
+
+import asyncio
+import uuid
+
+import pytest
+import stripe
+from fastapi.testclient import TestClient
+
+import api
+from tests.fake_servers import FakeStripe
+from utils.db_utils import get_license_repository
+from utils.stripe_gateway import CircuitBreaker, StripeGateway, StripeGatewaySettings, StripeUnavailableError
+
+
+@pytest.fixture
+def fake_stripe(monkeypatch):
+    server = FakeStripe().start()
+    monkeypatch.setattr(stripe, "api_base", server.url)
+    monkeypatch.setattr(stripe, "api_key", "sk_test_fake")
+    monkeypatch.setattr(stripe, "default_http_client", None)
+    yield server
+    server.stop()
+
+
+def make_gateway(**overrides) -> StripeGateway:
+    values = dict(threads=4, timeout_seconds=2, failure_threshold=2, reset_seconds=60)
+    values.update(overrides)
+    return StripeGateway(StripeGatewaySettings(**values))
+
+
+def test_breaker_opens_after_consecutive_failures_and_recovers():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    now[0] = 11
+    assert breaker.state == 'half_open'
+    assert breaker.allow() and not breaker.allow()  # a single trial call
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    now[0] = 22
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_checkout_sessions_round_trip(fake_stripe):
+    gateway = make_gateway()
+
+    async def scenario():
+        created = await gateway.create_checkout_session(
+            mode='subscription', success_url="http://localhost/ok", metadata={'user_email': "a@example.com"})
+        return await gateway.retrieve_checkout_session(created.id)
+
+    session = asyncio.run(scenario())
+    assert session.metadata['user_email'] == "a@example.com"
+    assert gateway.stats()['operations']['checkout_session_retrieve']['calls'] == 1
+
+
+def test_slow_stripe_times_out(fake_stripe):
+    fake_stripe.latency = 0.5
+    gateway = make_gateway(timeout_seconds=0.1)
+
+    with pytest.raises(StripeUnavailableError):
+        asyncio.run(gateway.retrieve_checkout_session(fake_stripe.add_session("a@example.com")))
+    assert gateway.stats()['operations']['checkout_session_retrieve']['timeouts'] == 1
+
+
+def test_outage_opens_breaker_and_fails_fast(fake_stripe):
+    fake_stripe.fail_status = 500
+    gateway = make_gateway()
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(stripe.error.APIError):
+                await gateway.retrieve_checkout_session("cs_test_x")
+        with pytest.raises(StripeUnavailableError):
+            await gateway.retrieve_checkout_session("cs_test_x")
+
+    asyncio.run(scenario())
+    assert fake_stripe.requests == 2
+    assert gateway.stats()['breaker']['state'] == 'open'
+
+
+def test_invalid_requests_do_not_open_breaker(fake_stripe):
+    gateway = make_gateway()
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(stripe.error.InvalidRequestError):
+                await gateway.retrieve_checkout_session("cs_test_missing")
+
+    asyncio.run(scenario())
+    assert gateway.stats()['breaker']['state'] == 'closed'
+
+
+def test_cancelled_trial_call_does_not_wedge_the_breaker(fake_stripe):
+    fake_stripe.fail_status = 500
+    gateway = make_gateway(reset_seconds=0.1)
+    session_id = fake_stripe.add_session("a@example.com")
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(stripe.error.APIError):
+                await gateway.retrieve_checkout_session(session_id)
+        await asyncio.sleep(0.2)
+        fake_stripe.fail_status = 0
+        fake_stripe.latency = 0.5
+        trial = asyncio.create_task(gateway.retrieve_checkout_session(session_id))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        fake_stripe.latency = 0
+        return await gateway.retrieve_checkout_session(session_id)
+
+    assert asyncio.run(scenario()).id == session_id
+    assert gateway.stats()['breaker']['state'] == 'closed'
+
+
+def test_process_payment_success_uses_gateway(fake_stripe, monkeypatch):
+    monkeypatch.setattr(api, "stripe_gateway", make_gateway())
+    email = f"gateway-{uuid.uuid4().hex[:8]}@example.com"
+    get_license_repository().add_new_user("Gate", "Way", "Gateway Co", email)
+    client = TestClient(api.app)
+
+    response = client.post("/process-payment-success", data={"session_id": fake_stripe.add_session(email)})
+    assert response.status_code == 200
+    assert response.json()["license_key"] == get_license_repository().get_license_by_email(email)["license_code"]
+
+    fake_stripe.fail_status = 500
+    for _ in range(2):
+        client.post("/process-payment-success", data={"session_id": "cs_test_x"})
+    assert client.post("/process-payment-success", data={"session_id": "cs_test_x"}).status_code == 503
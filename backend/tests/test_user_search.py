@@ -0,0 +1,93 @@
+"""
+Tests for the FTS5 user search behind /admin/search.
+
+Run with: python -m pytest tests/test_user_search.py
+"""
+
+import io
+import uuid
+
+import pytest
+
+from utils.bulk_import import BulkUserImporter
+from utils.db_utils import get_license_repository
+from utils.user_search import get_user_search
+
+
+def unique_word(prefix: str) -> str:
+    return f"{prefix}{uuid.uuid4().hex[:10]}"
+
+
+def emails(users):
+    return [user['email'] for user in users]
+
+
+def test_prefix_search_follows_inserts_updates_and_deletes():
+    repo = get_license_repository()
+    search = get_user_search()
+    company = unique_word("acme")
+    email = f"{unique_word('ada')}@search.example.com"
+    repo.add_new_user("Ada", "Lovelace", company, email)
+
+    assert emails(search.search(company[:8])[0]) == [email]
+    assert emails(search.search(f"{email[:6]} {company}")[0]) == [email]
+    assert emails(search.search(company, column='company_name')[0]) == [email]
+    assert search.search(company, column='email')[0] == []
+
+    renamed = unique_word("globex")
+    repo.update_user_info(email, company_name=renamed)
+    assert search.search(company)[0] == []
+    assert emails(search.search(renamed)[0]) == [email]
+
+    repo.delete_user(email)
+    assert search.search(renamed)[0] == []
+
+
+def test_bulk_imports_are_indexed_and_results_paginate():
+    search = get_user_search()
+    company = unique_word("initech")
+    csv_text = "first_name,last_name,company_name,email\n" + "".join(
+        f"Peter,Gibbons{i},{company},{unique_word('peter')}@search.example.com\n" for i in range(5))
+    BulkUserImporter().import_csv(io.StringIO(csv_text))
+
+    first, next_offset = search.search(company, limit=3)
+    second, last_offset = search.search(company, limit=3, offset=next_offset)
+
+    assert (len(first), next_offset, len(second), last_offset) == (3, 3, 2, None)
+    assert len(set(emails(first)) | set(emails(second))) == 5
+
+
+def test_email_matches_rank_above_company_matches():
+    repo = get_license_repository()
+    word = unique_word("rank")
+    by_company = f"{unique_word('a')}@search.example.com"
+    by_email = f"{word}@search.example.com"
+    repo.add_new_user("Com", "Pany", f"{word} Holdings", by_company)
+    repo.add_new_user("E", "Mail", "Other Co", by_email)
+
+    assert emails(get_user_search().search(word)[0]) == [by_email, by_company]
+
+
+def test_query_syntax_is_treated_as_plain_words():
+    search = get_user_search()
+
+    assert search.build_match('jo" OR x*') == '"jo"* "OR"* "x"*'
+    with pytest.raises(ValueError):
+        search.search("  ***  ")
+    with pytest.raises(ValueError):
+        search.search("jo", column="license_code")
+
+
+def test_search_endpoint(admin_client):
+    repo = get_license_repository()
+    word = unique_word("endpoint")
+    email = f"{word}@search.example.com"
+    repo.add_new_user("End", "Point", "Api Co", email)
+
+    response = admin_client.get("/admin/search", params={"q": word[:12], "limit": 5})
+
+    assert response.status_code == 200
+    assert emails(response.json()['results']) == [email]
+    assert response.json()['next_offset'] is None
+    assert admin_client.get("/admin/search", params={"q": "!!"}).status_code == 400
+    assert admin_client.get("/admin/search", params={"q": "x", "limit": 0}).status_code == 400
@@ -0,0 +1,67 @@
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from sqlalchemy import select
+from utils.db_utils import DatabaseManager, StatsCounter, LicenseIssuanceDay, CompanyUserCount, rebuild_stats
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class AdminStats:
+    """Aggregate figures for the admin dashboard, read from counter tables.
+
+    LicenseRepository updates stats_counters, stats_license_issuance_daily and
+    stats_company_users in the same transaction as every insert, license
+    issuance, company change and delete, so reading them costs a few primary
+    key or index lookups however large the licenses table grows, instead of
+    COUNT(*) ... GROUP BY scans over it. rebuild() recomputes them from the
+    licenses table, e.g. after rows were changed outside the repository.
+    """
+
+    def __init__(self):
+        self.db_manager = DatabaseManager()
+
+    def snapshot(self, days: int = 30, top_companies: int = 10) -> Dict[str, Any]:
+        """Return user totals, licenses issued on each of the last days UTC days
+        and the companies with the most users"""
+        since = datetime.utcnow().date() - timedelta(days=days - 1)
+        with self.db_manager.get_connection() as connection:
+            counters = dict(connection.execute(select(StatsCounter.name, StatsCounter.value)).all())
+            issued = connection.execute(
+                select(LicenseIssuanceDay.day, LicenseIssuanceDay.licenses)
+                .where(LicenseIssuanceDay.day >= since).order_by(LicenseIssuanceDay.day)).all()
+            companies = connection.execute(
+                select(CompanyUserCount.company_name, CompanyUserCount.users)
+                .order_by(CompanyUserCount.users.desc()).limit(top_companies)).all()
+        users = counters.get('users', 0)
+        licensed_users = counters.get('licensed_users', 0)
+        return {
+            'users': users,
+            'licensed_users': licensed_users,
+            'users_without_license': users - licensed_users,
+            'licenses_issued_per_day': [{'day': day.isoformat(), 'licenses': licenses} for day, licenses in issued],
+            'top_companies': [{'company_name': name, 'users': count} for name, count in companies]
+        }
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Recompute the counter tables from the licenses table in one transaction"""
+        started = time.perf_counter()
+        with self.db_manager.get_connection() as connection:
+            totals = rebuild_stats(connection)
+            connection.commit()
+        totals['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"Rebuilt stats for {totals['users']} users in {totals['elapsed_ms']}ms")
+        return totals
+
+
+_admin_stats: Optional[AdminStats] = None
+
+
+def get_admin_stats() -> AdminStats:
+    """Get the process-wide admin stats reader"""
+    global _admin_stats
+    if _admin_stats is None:
+        _admin_stats = AdminStats()
+    return _admin_stats
@@ -0,0 +1,249 @@
+import os
+import time
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+from utils.metrics import route_template, UNMATCHED_ROUTE
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CRITICAL = 'critical'
+NORMAL = 'normal'
+LOW = 'low'
+
+# License validation is what the desktop clients depend on, so it is shed last
+DEFAULT_CRITICAL_ROUTES = ('/check_license/{license_code}, /check_licenses, '
+                           '/license-token/{license_code}, /verify-token')
+# Routes that wait on Stripe or SMTP, and admin reads that scan the licenses table
+DEFAULT_LOW_PRIORITY_ROUTES = '/create-checkout-session, /send-license-email, /admin/*, /licenses, /licenses/export'
+
+
+class PriorityLimits(BaseModel):
+    """Admission limits applied to each route of one priority class"""
+    max_concurrency: int
+    max_queue: int
+    # Longest a request may wait while a queue is standing, and the usual longest wait
+    target_ms: float
+    interval_ms: float
+
+    @classmethod
+    def parse(cls, text: str) -> 'PriorityLimits':
+        """Parse "max_concurrency,max_queue,target_ms,interval_ms" """
+        concurrency, queue, target_ms, interval_ms = (part.strip() for part in text.split(','))
+        return cls(max_concurrency=int(concurrency), max_queue=int(queue),
+                   target_ms=float(target_ms), interval_ms=float(interval_ms))
+
+
+class AdmissionSettings(BaseModel):
+    """Tunables for per-route admission control and load shedding"""
+    enabled: bool = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    critical_routes: str = os.getenv('ADMISSION_CRITICAL_ROUTES', DEFAULT_CRITICAL_ROUTES)
+    # A trailing * matches every route starting with what comes before it
+    low_priority_routes: str = os.getenv('ADMISSION_LOW_PRIORITY_ROUTES', DEFAULT_LOW_PRIORITY_ROUTES)
+    # Critical requests never switch to the short target wait
+    critical: PriorityLimits = PriorityLimits.parse(os.getenv('ADMISSION_CRITICAL_LIMITS', '64,1024,500,500'))
+    normal: PriorityLimits = PriorityLimits.parse(os.getenv('ADMISSION_NORMAL_LIMITS', '32,256,10,200'))
+    low: PriorityLimits = PriorityLimits.parse(os.getenv('ADMISSION_LOW_LIMITS', '16,64,5,100'))
+    # With this many requests in flight across all routes, low priority requests are shed on arrival
+    low_priority_shed_in_flight: int = int(os.getenv('ADMISSION_LOW_PRIORITY_SHED_IN_FLIGHT', '64'))
+    retry_after_seconds: int = int(os.getenv('ADMISSION_RETRY_AFTER', '1'))
+
+    def priority_of(self, route: str) -> str:
+        for priority, routes in ((CRITICAL, self.critical_routes), (LOW, self.low_priority_routes)):
+            for pattern in (part.strip() for part in routes.split(',')):
+                if route == pattern or (pattern.endswith('*') and route.startswith(pattern[:-1])):
+                    return priority
+        return NORMAL
+
+    def limits_for(self, priority: str) -> PriorityLimits:
+        return {CRITICAL: self.critical, NORMAL: self.normal, LOW: self.low}[priority]
+
+
+class RouteGate:
+    """Concurrency limit and bounded FIFO queue for one route, with CoDel-style shedding.
+
+    Up to max_concurrency requests run at once and up to max_queue more wait
+    for a slot. A request normally waits at most interval_ms. If the queue
+    has not been empty at any point in the last interval, it is a standing
+    queue, the kind that only adds latency, and new requests wait at most
+    target_ms before they are shed. Short bursts are absorbed; sustained
+    overload is turned away quickly instead of making everyone slow.
+
+    Gates are used from the event loop only, so they need no locks.
+    """
+
+    def __init__(self, route: str, priority: str, limits: PriorityLimits,
+                 clock: Callable[[], float] = time.monotonic):
+        self.route = route
+        self.priority = priority
+        self.limits = limits
+        self._clock = clock
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_empty = clock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_wait = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Wait for a slot; False means the request should be shed"""
+        now = self._clock()
+        if not self._waiters:
+            self._last_empty = now
+            if self.in_flight < self.limits.max_concurrency:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+        if len(self._waiters) >= self.limits.max_queue:
+            self.shed_queue_full += 1
+            return False
+
+        standing = now - self._last_empty > self.limits.interval_ms / 1000
+        timeout = (self.limits.target_ms if standing else self.limits.interval_ms) / 1000
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        expiry = asyncio.get_running_loop().call_later(timeout, self._expire, waiter)
+        try:
+            granted = await waiter
+        except asyncio.CancelledError:
+            # The client went away; pass on a slot it was handed in the meantime
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            raise
+        finally:
+            expiry.cancel()
+            self._discard(waiter)
+        if granted:
+            self.admitted += 1
+        else:
+            self.shed_wait += 1
+        return granted
+
+    def _expire(self, waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(False)
+            self._discard(waiter)
+
+    def _discard(self, waiter: asyncio.Future):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            return
+        if not self._waiters:
+            self._last_empty = self._clock()
+
+    def release(self):
+        """Hand the slot to the oldest waiter, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not self._waiters:
+                self._last_empty = self._clock()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'priority': self.priority,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'shed_queue_full': self.shed_queue_full,
+            'shed_wait': self.shed_wait
+        }
+
+
+class AdmissionController:
+    """One RouteGate per route template, limited by the route's priority class.
+
+    Besides each route's own limits, low priority requests are shed on
+    arrival while the server as a whole has low_priority_shed_in_flight
+    requests in flight, leaving that capacity to license validation.
+    """
+
+    def __init__(self, settings: Optional[AdmissionSettings] = None):
+        self.settings = settings or AdmissionSettings()
+        self.gates: Dict[str, RouteGate] = {}
+        self.in_flight = 0
+        self.shed_low_priority = 0
+
+    def gate_for(self, route: str) -> RouteGate:
+        gate = self.gates.get(route)
+        if gate is None:
+            priority = self.settings.priority_of(route)
+            gate = self.gates[route] = RouteGate(route, priority, self.settings.limits_for(priority))
+        return gate
+
+    async def admit(self, route: str) -> Optional[RouteGate]:
+        """The route's gate holding a slot for this request, or None if it should be shed"""
+        gate = self.gate_for(route)
+        if gate.priority == LOW and self.in_flight >= self.settings.low_priority_shed_in_flight:
+            self.shed_low_priority += 1
+            return None
+        if not await gate.acquire():
+            return None
+        self.in_flight += 1
+        return gate
+
+    def release(self, gate: RouteGate):
+        self.in_flight -= 1
+        gate.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.settings.enabled,
+            'in_flight': self.in_flight,
+            'shed_low_priority': self.shed_low_priority,
+            'routes': {route: gate.stats() for route, gate in sorted(self.gates.items())}
+        }
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware answering 503 with Retry-After when a request is shed"""
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or get_admission_controller()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.controller.settings.enabled:
+            await self.app(scope, receive, send)
+            return
+        route = route_template(scope)
+        if route == UNMATCHED_ROUTE:
+            await self.app(scope, receive, send)
+            return
+
+        gate = await self.controller.admit(route)
+        if gate is None:
+            response = JSONResponse({"detail": "Server is busy, retry later"}, status_code=503,
+                                    headers={"Retry-After": str(self.controller.settings.retry_after_seconds)})
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(gate)
+
+
+_admission_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    """Get the process-wide admission controller"""
+    global _admission_controller
+    if _admission_controller is None:
+        _admission_controller = AdmissionController()
+    return _admission_controller
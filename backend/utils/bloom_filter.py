@@ -0,0 +1,253 @@
+import os
+import math
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from pydantic import BaseModel
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class BloomFilterSettings(BaseModel):
+    """Tunables for the license code Bloom filter"""
+    enabled: bool = os.getenv('LICENSE_BLOOM_ENABLED', 'true').lower() == 'true'
+    expected_items: int = int(os.getenv('LICENSE_BLOOM_EXPECTED_ITEMS', '100000'))
+    false_positive_rate: float = float(os.getenv('LICENSE_BLOOM_FP_RATE', '0.01'))
+    max_bytes: int = int(os.getenv('LICENSE_BLOOM_MAX_BYTES', str(16 * 1024 * 1024)))
+    # Deleted codes cannot be cleared from a Bloom filter, so the filter is
+    # rebuilt once this fraction of its items have been deleted
+    rebuild_stale_ratio: float = float(os.getenv('LICENSE_BLOOM_REBUILD_STALE_RATIO', '0.1'))
+    # Rebuilds triggered by adds and removes run this long after the trigger, off the request thread
+    rebuild_debounce_seconds: float = float(os.getenv('LICENSE_BLOOM_REBUILD_DEBOUNCE_SECONDS', '1'))
+    # Periodic rebuild from the database, dropping deleted codes. 0 disables it.
+    refresh_seconds: float = float(os.getenv('LICENSE_BLOOM_REFRESH_SECONDS', '0'))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing"""
+
+    def __init__(self, capacity: int, false_positive_rate: float, max_bytes: Optional[int] = None):
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2))
+        if max_bytes:
+            num_bits = min(num_bits, max_bytes * 8)
+        self.num_bits = max(num_bits, 8)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str):
+        """Add an item to the filter"""
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._bits)
+
+    def estimated_false_positive_rate(self) -> float:
+        """Expected false-positive rate for the current number of items"""
+        if not self.count:
+            return 0.0
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class LicenseCodeGuard:
+    """Singleton Bloom filter of every issued license code.
+
+    The filter holds the codes this process loaded at startup or issued
+    since, so a code it rejects was not issued by this process. That only
+    proves the code was never issued when no other process writes to the
+    database, so LicenseRepository disables the guard for file databases
+    and relies on the shared license snapshot instead. Deleted codes stay
+    in the filter (they only cost a false positive) until enough of them
+    pile up to trigger a rebuild.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LicenseCodeGuard, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.settings = BloomFilterSettings()
+            self._filter: Optional[BloomFilter] = None
+            self._loader: Optional[Callable[[], Iterable[str]]] = None
+            self._lock = threading.Lock()
+            self._build_lock = threading.Lock()
+            # Codes added, and how many removed, while a build is loading; None when no build runs
+            self._pending_added: Optional[List[str]] = None
+            self._pending_removed = 0
+            self._refresh_timer: Optional[threading.Timer] = None
+            self._rebuild_timer: Optional[threading.Timer] = None
+            self.disabled_reason: Optional[str] = None
+            self.stale_items = 0
+            self.rejected = 0
+            self.passed = 0
+            self.rebuilds = 0
+            self.initialized = True
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled and self.disabled_reason is None
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._filter is not None
+
+    def disable(self, reason: str):
+        """Stop answering and drop the filter, e.g. because its rejections cannot be trusted"""
+        with self._lock:
+            self.disabled_reason = reason
+            self._filter = None
+        for timer in (self._refresh_timer, self._rebuild_timer):
+            if timer:
+                timer.cancel()
+        logger.info(f"License code Bloom filter disabled: {reason}")
+
+    def build(self, loader: Callable[[], Iterable[str]]):
+        """(Re)build the filter from every code returned by loader"""
+        if not self.enabled:
+            return
+        self._loader = loader
+        with self._build_lock:
+            self._build(loader)
+
+    def _build(self, loader: Callable[[], Iterable[str]]):
+        with self._lock:
+            self._pending_added = []
+            self._pending_removed = 0
+        try:
+            codes = list(loader())
+        except Exception as e:
+            with self._lock:
+                self._pending_added = None
+            logger.error(f"Failed to load license codes for Bloom filter: {e}")
+            return
+
+        capacity = max(self.settings.expected_items, len(codes) * 2)
+        new_filter = BloomFilter(capacity, self.settings.false_positive_rate, self.settings.max_bytes)
+        for code in codes:
+            new_filter.add(code)
+
+        with self._lock:
+            # Codes issued while the codes were loading may be missing from them
+            for code in self._pending_added:
+                new_filter.add(code)
+            self._filter = new_filter if self.enabled else None
+            self.stale_items = self._pending_removed
+            self._pending_added = None
+            self.rebuilds += 1
+        logger.info(f"License code Bloom filter built with {len(codes)} codes "
+                    f"({new_filter.size_bytes} bytes, {new_filter.num_hashes} hashes)")
+        self._schedule_refresh()
+
+    def _schedule_refresh(self):
+        if self.settings.refresh_seconds <= 0:
+            return
+        if self._refresh_timer:
+            self._refresh_timer.cancel()
+        self._refresh_timer = threading.Timer(self.settings.refresh_seconds, self.build, args=(self._loader,))
+        self._refresh_timer.daemon = True
+        self._refresh_timer.start()
+
+    def _schedule_rebuild(self):
+        """Rebuild on a timer thread, so the request that crossed the threshold does not load every code"""
+        with self._lock:
+            if self._rebuild_timer and self._rebuild_timer.is_alive():
+                return
+            self._rebuild_timer = threading.Timer(self.settings.rebuild_debounce_seconds, self._scheduled_rebuild)
+            self._rebuild_timer.daemon = True
+            self._rebuild_timer.start()
+
+    def _scheduled_rebuild(self):
+        self.build(self._loader)
+
+    def add(self, license_code: str):
+        """Record a newly issued license code"""
+        if not self.enabled or not license_code:
+            return
+        with self._lock:
+            if self._pending_added is not None:
+                self._pending_added.append(license_code)
+            if self._filter is None:
+                return
+            self._filter.add(license_code)
+            needs_rebuild = self._filter.count > self._filter.capacity
+        if needs_rebuild and self._loader:
+            self._schedule_rebuild()
+
+    def remove(self, license_code: str):
+        """Record that a license code was deleted"""
+        if not self.enabled or not license_code:
+            return
+        with self._lock:
+            if self._pending_added is not None:
+                self._pending_removed += 1
+            if self._filter is None:
+                return
+            self.stale_items += 1
+            needs_rebuild = self.stale_items > self._filter.count * self.settings.rebuild_stale_ratio
+        if needs_rebuild and self._loader:
+            self._schedule_rebuild()
+
+    def might_contain(self, license_code: str) -> bool:
+        """Return False only if the license code was certainly never issued"""
+        bloom = self._filter
+        if not self.ready or bloom is None:
+            return True
+        if license_code in bloom:
+            self.passed += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """Return filter sizing and hit counters"""
+        bloom = self._filter
+        if not self.enabled:
+            return {'enabled': False, 'ready': False,
+                    'disabled_reason': self.disabled_reason or 'LICENSE_BLOOM_ENABLED is false'}
+        if bloom is None:
+            return {'enabled': True, 'ready': False}
+        return {
+            'enabled': True,
+            'ready': True,
+            'items': bloom.count,
+            'stale_items': self.stale_items,
+            'capacity': bloom.capacity,
+            'size_bytes': bloom.size_bytes,
+            'max_bytes': self.settings.max_bytes,
+            'num_hashes': bloom.num_hashes,
+            'target_false_positive_rate': self.settings.false_positive_rate,
+            'estimated_false_positive_rate': round(bloom.estimated_false_positive_rate(), 6),
+            'rejected': self.rejected,
+            'passed': self.passed,
+            'rebuilds': self.rebuilds
+        }
+
+
+def get_license_code_guard() -> LicenseCodeGuard:
+    """Get the license code guard instance"""
+    return LicenseCodeGuard()
@@ -0,0 +1,98 @@
+import os
+import re
+import csv
+from typing import Any, Dict, Iterable, List, Optional
+from pydantic import BaseModel
+from utils.db_utils import LicenseRepository, get_license_repository
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'company_name', 'email')
+# Column lengths of the licenses table
+MAX_LENGTHS = {'first_name': 100, 'last_name': 100, 'company_name': 200, 'email': 255}
+EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class BulkImportSettings(BaseModel):
+    """Tunables for bulk user imports"""
+    # Rows inserted per transaction
+    chunk_size: int = int(os.getenv('BULK_IMPORT_CHUNK_SIZE', '1000'))
+    # Row errors listed in the report; the rest are only counted
+    max_reported_errors: int = int(os.getenv('BULK_IMPORT_MAX_REPORTED_ERRORS', '1000'))
+
+
+class BulkUserImporter:
+    """Imports users from a CSV stream in chunked, batched transactions.
+
+    The CSV needs first_name, last_name, company_name and email columns. Rows
+    are validated as they are read; valid rows are inserted chunk_size at a
+    time with LicenseRepository.bulk_add_users. A bad or duplicate row is
+    reported with its line number and skipped without affecting the others.
+    """
+
+    def __init__(self, repository: Optional[LicenseRepository] = None,
+                 settings: Optional[BulkImportSettings] = None):
+        self.repository = repository or get_license_repository()
+        self.settings = settings or BulkImportSettings()
+
+    def import_csv(self, lines: Iterable[str], mint_license_codes: bool = False) -> Dict[str, Any]:
+        """Import every row of a CSV and return a summary with per-row errors"""
+        report = {'rows': 0, 'imported': 0, 'license_codes_created': 0, 'error_count': 0, 'errors': []}
+        reader = csv.DictReader(lines)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+        seen_emails = set()
+        chunk: List[Dict[str, str]] = []
+        chunk_lines: List[int] = []
+        for row in reader:
+            report['rows'] += 1
+            user, error = self.validate_row(row)
+            if error is None and user['email'] in seen_emails:
+                error = "duplicate email in file"
+            if error:
+                self._add_error(report, reader.line_num, row.get('email'), error)
+                continue
+            seen_emails.add(user['email'])
+            chunk.append(user)
+            chunk_lines.append(reader.line_num)
+            if len(chunk) >= self.settings.chunk_size:
+                self._flush(chunk, chunk_lines, mint_license_codes, report)
+                chunk, chunk_lines = [], []
+        if chunk:
+            self._flush(chunk, chunk_lines, mint_license_codes, report)
+
+        logger.info(f"Bulk import finished: {report['imported']} of {report['rows']} rows imported, "
+                    f"{report['error_count']} errors")
+        return report
+
+    @staticmethod
+    def validate_row(row: Dict[str, Optional[str]]) -> tuple:
+        """Return (user, None) for a valid row or (None, reason)"""
+        user = {column: (row.get(column) or '').strip() for column in REQUIRED_COLUMNS}
+        for column in REQUIRED_COLUMNS:
+            if not user[column]:
+                return None, f"missing {column}"
+            if len(user[column]) > MAX_LENGTHS[column]:
+                return None, f"{column} longer than {MAX_LENGTHS[column]} characters"
+        if not EMAIL_PATTERN.match(user['email']):
+            return None, "invalid email"
+        return user, None
+
+    def _flush(self, chunk: List[Dict[str, str]], chunk_lines: List[int], mint_license_codes: bool,
+               report: Dict[str, Any]):
+        results = self.repository.bulk_add_users(chunk, mint_license_codes=mint_license_codes)
+        for user, line, error in zip(chunk, chunk_lines, results):
+            if error:
+                self._add_error(report, line, user['email'], error)
+            else:
+                report['imported'] += 1
+                report['license_codes_created'] += mint_license_codes
+
+    def _add_error(self, report: Dict[str, Any], line: int, email: Optional[str], error: str):
+        report['error_count'] += 1
+        if len(report['errors']) < self.settings.max_reported_errors:
+            report['errors'].append({'line': line, 'email': email, 'error': error})
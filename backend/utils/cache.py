@@ -0,0 +1,198 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from pydantic import BaseModel
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Sentinel returned by TTLCache.get when a key is not cached
+MISSING = object()
+
+
+class CacheSettings(BaseModel):
+    """Tunables for the in-process license lookup cache"""
+    max_size: int = int(os.getenv('LICENSE_CACHE_MAX_SIZE', '10000'))
+    ttl_seconds: float = float(os.getenv('LICENSE_CACHE_TTL', '300'))
+    negative_ttl_seconds: float = float(os.getenv('LICENSE_CACHE_NEGATIVE_TTL', '30'))
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a TTL.
+
+    Negative entries (value ``None``) use their own, usually shorter, TTL so
+    that a code which is created shortly after a failed lookup becomes visible
+    quickly even without explicit invalidation. A ``max_size`` of 0 disables
+    the cache entirely.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, negative_ttl_seconds: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key, or MISSING"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store value for key, evicting the least recently used entry if full"""
+        if self.max_size <= 0:
+            return
+        ttl = self.negative_ttl_seconds if value is None else self.ttl_seconds
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop key from the cache if present"""
+        with self._lock:
+            if self._entries.pop(key, MISSING) is not MISSING:
+                self.invalidations += 1
+
+    def clear(self):
+        """Drop every entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+
+class SingleFlight:
+    """Collapses concurrent async calls for the same key into one.
+
+    The first caller starts the call; callers that arrive while it is in
+    flight await the same result or exception. The call keeps running if its
+    first caller is cancelled, so followers still get an answer.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Task"] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: "asyncio.Task"):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved in case every caller was cancelled
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        """Return call counters"""
+        return {'in_flight': len(self._calls), 'calls': self.calls, 'collapsed': self.collapsed}
+
+
+class LicenseCache:
+    """Singleton holding the license lookup caches keyed by code and by email.
+
+    The cache is per process: with several uvicorn workers, a write made in one
+    worker only invalidates that worker's entries and the others catch up when
+    their entries expire.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LicenseCache, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.settings = CacheSettings()
+            self.by_code = self._build_cache()
+            self.by_email = self._build_cache()
+            # Existence-only answers for /check_license, stored as True or None
+            self.code_exists = self._build_cache()
+            self.initialized = True
+            logger.info(f"License cache initialized: {self.settings}")
+
+    def _build_cache(self) -> TTLCache:
+        return TTLCache(
+            max_size=self.settings.max_size,
+            ttl_seconds=self.settings.ttl_seconds,
+            negative_ttl_seconds=self.settings.negative_ttl_seconds
+        )
+
+    def invalidate(self, email: Optional[str] = None, license_code: Optional[str] = None):
+        """Drop cached lookups for an email and/or license code"""
+        if email:
+            self.by_email.invalidate(email)
+        if license_code:
+            self.by_code.invalidate(license_code)
+            self.code_exists.invalidate(license_code)
+
+    def clear(self):
+        """Drop every cached lookup"""
+        self.by_code.clear()
+        self.by_email.clear()
+        self.code_exists.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return counters for every cache"""
+        return {
+            'by_code': self.by_code.stats(),
+            'by_email': self.by_email.stats(),
+            'code_exists': self.code_exists.stats()
+        }
+
+
+def get_license_cache() -> LicenseCache:
+    """Get the license cache instance"""
+    return LicenseCache()
@@ -3,12 +3,30 @@ import os
 import string
 import secrets
 import uuid
-from datetime import datetime
-from typing import Optional, List, Dict, Any
-from sqlalchemy import create_engine, Column, String, DateTime, Integer
+import asyncio
+import functools
+import json
+import base64
+from collections import Counter
+from datetime import datetime, date
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple
+import anyio
+from sqlalchemy import create_engine, event, inspect, Column, String, Text, Date, DateTime, Integer, Index, select, \
+    exists, update, delete, func, text, bindparam, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.pool import QueuePool, StaticPool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import IntegrityError
+from pydantic import BaseModel
+from utils.cache import get_license_cache, MISSING
+from utils.bloom_filter import get_license_code_guard
+from utils.license_snapshot import get_license_snapshot
+from utils.license_index import get_license_index
+from utils.license_tokens import get_license_token_signer
+from utils.metrics import instrument_engine
+from utils.query_profiler import profile_engine
 import logging
 
 # Configure logging
@@ -18,6 +36,49 @@ logger = logging.getLogger(__name__)
 # SQLAlchemy setup
 Base = declarative_base()
 
+# Stay below SQLite's default limit of 999 host parameters per statement
+SQLITE_MAX_PARAMETERS = 900
+
+# Pragmas applied to every new SQLite connection, per performance profile.
+# 'production' uses WAL so readers are not blocked while /create-account or the
+# Stripe webhook commit, and makes writers wait instead of failing when locked.
+SQLITE_PROFILES = {
+    'default': {},
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY'
+    }
+}
+
+
+class DatabaseSettings(BaseModel):
+    """SQLite performance profile and connection pool settings.
+    Individual SQLITE_* pragma variables override the chosen profile."""
+    profile: str = os.getenv('SQLITE_PROFILE', 'production')
+    journal_mode: Optional[str] = os.getenv('SQLITE_JOURNAL_MODE')
+    synchronous: Optional[str] = os.getenv('SQLITE_SYNCHRONOUS')
+    busy_timeout: Optional[str] = os.getenv('SQLITE_BUSY_TIMEOUT_MS')
+    mmap_size: Optional[str] = os.getenv('SQLITE_MMAP_SIZE')
+    cache_size: Optional[str] = os.getenv('SQLITE_CACHE_SIZE')
+    pool_size: int = int(os.getenv('SQLITE_POOL_SIZE', '10'))
+    max_overflow: int = int(os.getenv('SQLITE_MAX_OVERFLOW', '20'))
+
+    def pragmas(self) -> Dict[str, Any]:
+        """Pragmas for the configured profile with any overrides applied"""
+        if self.profile not in SQLITE_PROFILES:
+            raise ValueError(f"Unknown SQLite profile {self.profile!r}, expected one of {list(SQLITE_PROFILES)}")
+        pragmas = dict(SQLITE_PROFILES[self.profile])
+        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size'):
+            value = getattr(self, name)
+            if value is not None:
+                pragmas[name] = value
+        return pragmas
+
+
 class License(Base):
     """SQLAlchemy model for license data"""
     __tablename__ = 'licenses'
@@ -28,9 +89,13 @@ class License(Base):
     company_name = Column(String(200), nullable=False)
     email = Column(String(255), unique=True, nullable=False, index=True)
     license_code = Column(String(10), unique=True, nullable=True, index=True)
+    license_issued_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # Keyset pagination and exports walk the table in (created_at, id) order
+    __table_args__ = (Index('ix_licenses_created_at_id', 'created_at', 'id'),)
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert license object to dictionary"""
         return {
@@ -40,11 +105,173 @@ class License(Base):
             'company_name': self.company_name,
             'email': self.email,
             'license_code': self.license_code,
+            'license_issued_at': self.license_issued_at.isoformat() if self.license_issued_at else None,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
 
+def license_row_to_dict(row) -> Dict[str, Any]:
+    """Convert a Core row of the licenses table to the same dictionary as License.to_dict"""
+    license_dict = dict(row._mapping)
+    for name in ('license_issued_at', 'created_at', 'updated_at'):
+        license_dict[name] = license_dict[name].isoformat() if license_dict[name] else None
+    return license_dict
+
+
+def encode_license_cursor(license_dict: Dict[str, Any]) -> str:
+    """Opaque pagination cursor pointing just after a license"""
+    key = json.dumps([license_dict['created_at'], license_dict['id']])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_license_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Return the (created_at, id) key in a cursor. Raises ValueError if it is malformed."""
+    try:
+        created_at, license_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), str(license_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+class EmailOutbox(Base):
+    """SQLAlchemy model for license emails waiting to be delivered"""
+    __tablename__ = 'email_outbox'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    email = Column(String(255), nullable=False)
+    company_name = Column(String(200), nullable=False)
+    license_code = Column(String(10), nullable=False)
+    # pending -> sending -> sent, or back to pending for a retry, or dead once retries run out
+    status = Column(String(20), nullable=False, default='pending', index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    claimed_at = Column(DateTime, nullable=True)
+    last_error = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class StripeEvent(Base):
+    """SQLAlchemy model for verified Stripe webhook events, keyed by Stripe's event id"""
+    __tablename__ = 'stripe_events'
+    
+    id = Column(String(255), primary_key=True)
+    type = Column(String(100), nullable=False, index=True)
+    payload = Column(Text, nullable=False)
+    # pending -> processing -> processed, or back to pending for a retry, or failed once retries run out.
+    # Event types without a handler are marked ignored.
+    status = Column(String(20), nullable=False, default='pending', index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    # How many times Stripe delivered this event; anything above 1 was a duplicate
+    deliveries = Column(Integer, nullable=False, default=1)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    claimed_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    last_error = Column(String(500), nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class PaymentSession(Base):
+    """SQLAlchemy model for the outcome of a completed Stripe checkout session"""
+    __tablename__ = 'payment_sessions'
+    
+    session_id = Column(String(255), primary_key=True)
+    email = Column(String(255), nullable=False)
+    license_code = Column(String(10), nullable=False)
+    status = Column(String(20), nullable=False, default='success')
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LicenseCodePool(Base):
+    """SQLAlchemy model for pre-generated license codes waiting to be assigned"""
+    __tablename__ = 'license_code_pool'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    license_code = Column(String(10), unique=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class StatsCounter(Base):
+    """SQLAlchemy model for running totals over the licenses table ('users', 'licensed_users')"""
+    __tablename__ = 'stats_counters'
+
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+class LicenseIssuanceDay(Base):
+    """SQLAlchemy model for the number of current licenses issued on each UTC day"""
+    __tablename__ = 'stats_license_issuance_daily'
+
+    day = Column(Date, primary_key=True)
+    licenses = Column(Integer, nullable=False, default=0)
+
+
+class CompanyUserCount(Base):
+    """SQLAlchemy model for the number of users registered under each company name"""
+    __tablename__ = 'stats_company_users'
+
+    company_name = Column(String(200), primary_key=True)
+    users = Column(Integer, nullable=False, default=0, index=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _count_upsert(key_column: Column, count_column: Column):
+    """Statement adding :delta to the count stored under :key. Written as text because
+    SQLAlchemy cannot cache the compiled ON CONFLICT DO UPDATE construct."""
+    table, key, count = key_column.table.name, key_column.name, count_column.name
+    return text(f"INSERT INTO {table} ({key}, {count}) VALUES (:key, :delta) "
+                f"ON CONFLICT ({key}) DO UPDATE SET {count} = {count} + excluded.{count}") \
+        .bindparams(bindparam('key', type_=key_column.type), bindparam('delta', type_=Integer))
+
+
+def _add_to_counts(connection: Connection, key_column: Column, count_column: Column, deltas: Dict[Any, int]):
+    """Add deltas to per-key counts, dropping keys whose count falls to zero"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    connection.execute(_count_upsert(key_column, count_column),
+                       [{'key': key, 'delta': delta} for key, delta in deltas.items()])
+    decreased = [key for key, delta in deltas.items() if delta < 0]
+    if decreased:
+        connection.execute(delete(key_column.table).where(key_column.in_(decreased), count_column <= 0))
+
+
+def update_stats(connection: Connection, users: int = 0, licensed_users: int = 0,
+                 licenses_per_day: Optional[Dict[date, int]] = None,
+                 users_per_company: Optional[Dict[str, int]] = None):
+    """Apply changes to the stats tables as part of the connection's transaction, so they
+    commit or roll back together with the license rows they describe"""
+    _add_to_counts(connection, StatsCounter.__table__.c.name, StatsCounter.__table__.c.value,
+                   {'users': users, 'licensed_users': licensed_users})
+    _add_to_counts(connection, LicenseIssuanceDay.__table__.c.day, LicenseIssuanceDay.__table__.c.licenses,
+                   licenses_per_day or {})
+    _add_to_counts(connection, CompanyUserCount.__table__.c.company_name, CompanyUserCount.__table__.c.users,
+                   users_per_company or {})
+
+
+def rebuild_stats(connection: Connection) -> Dict[str, int]:
+    """Recompute every stats table from the licenses table in the connection's transaction.
+    Returns the rebuilt totals."""
+    connection.execute(delete(StatsCounter))
+    connection.execute(delete(LicenseIssuanceDay))
+    connection.execute(delete(CompanyUserCount))
+    users, licensed_users = connection.execute(
+        select(func.count(), func.count(License.license_code)).select_from(License)).one()
+    connection.execute(sqlite_insert(StatsCounter), [
+        {'name': 'users', 'value': users}, {'name': 'licensed_users', 'value': licensed_users}])
+    issued_day = func.date(License.license_issued_at)
+    connection.execute(LicenseIssuanceDay.__table__.insert().from_select(
+        ['day', 'licenses'],
+        select(issued_day, func.count()).where(License.license_issued_at.isnot(None)).group_by(issued_day)))
+    connection.execute(CompanyUserCount.__table__.insert().from_select(
+        ['company_name', 'users'],
+        select(License.company_name, func.count()).group_by(License.company_name)))
+    return {'users': users, 'licensed_users': licensed_users}
+
+
 class DatabaseManager:
     """Singleton class for database connection and management"""
     
@@ -61,8 +288,11 @@ class DatabaseManager:
         if not hasattr(self, 'initialized'):
             # Get the absolute path to the backend directory
             backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            self.db_folder = os.path.join(backend_dir, 'db')
-            self.db_path = os.path.join(self.db_folder, 'visionpay_licenses.db')
+            default_db_path = os.path.join(backend_dir, 'db', 'visionpay_licenses.db')
+            self.db_path = os.getenv('VISIONPAY_DB_PATH') or default_db_path
+            self.db_folder = os.path.dirname(os.path.abspath(self.db_path))
+            self.settings = DatabaseSettings()
+            self.pragmas = self.settings.pragmas()
             self._setup_database()
             self.initialized = True
     
@@ -75,11 +305,17 @@ class DatabaseManager:
                 logger.info(f"Created database folder: {self.db_folder}")
             
             # Create SQLAlchemy engine
-            self._engine = create_engine(f'sqlite:///{self.db_path}', echo=False)
+            self._engine = self._create_engine()
             
             # Create tables if they don't exist
+            existing_tables = set(inspect(self._engine).get_table_names())
             Base.metadata.create_all(self._engine)
-            
+            # create_all skips existing tables, so add indexes introduced since a table was created
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(self._engine, checkfirst=True)
+            self._migrate_existing_tables(existing_tables)
+
             # Create session factory
             self._session_factory = sessionmaker(bind=self._engine)
             
@@ -88,11 +324,55 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Failed to setup database: {e}")
             raise
+
+    def _migrate_existing_tables(self, existing_tables: set):
+        """Bring tables created by an older version up to date"""
+        with self._engine.begin() as connection:
+            license_columns = {column['name'] for column in inspect(connection).get_columns('licenses')}
+            if 'license_issued_at' not in license_columns:
+                # Older databases did not record when a license was issued; its last update is the best guess
+                connection.exec_driver_sql("ALTER TABLE licenses ADD COLUMN license_issued_at DATETIME")
+                connection.execute(update(License).where(License.license_code.isnot(None))
+                                   .values(license_issued_at=License.updated_at, updated_at=License.updated_at))
+                logger.info("Added licenses.license_issued_at")
+            if 'licenses' in existing_tables and StatsCounter.__tablename__ not in existing_tables:
+                totals = rebuild_stats(connection)
+                logger.info(f"Built stats tables for {totals['users']} existing users")
+
+    def _create_engine(self):
+        """Create the engine with a pool suited to the database and the profile pragmas"""
+        connect_args = {'check_same_thread': False}
+        if self.db_path == ':memory:':
+            # Every connection to :memory: is a separate database, so share one
+            engine = create_engine('sqlite://', echo=False, poolclass=StaticPool, connect_args=connect_args)
+        else:
+            engine = create_engine(
+                f'sqlite:///{self.db_path}', echo=False, poolclass=QueuePool,
+                pool_size=self.settings.pool_size, max_overflow=self.settings.max_overflow,
+                connect_args=connect_args)
+        
+        pragmas = self.pragmas
+        
+        @event.listens_for(engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+        
+        instrument_engine(engine)
+        profile_engine(engine)
+        logger.info(f"SQLite profile '{self.settings.profile}' with pragmas: {pragmas}")
+        return engine
     
     def get_session(self) -> Session:
         """Get a new database session"""
         return self._session_factory()
     
+    def get_connection(self) -> Connection:
+        """Get a Core connection for lightweight queries that skip the ORM"""
+        return self._engine.connect()
+    
     def close_connection(self):
         """Close database connection"""
         if self._engine:
@@ -104,6 +384,40 @@ class LicenseRepository:
     
     def __init__(self):
         self.db_manager = DatabaseManager()
+        self.cache = get_license_cache()
+        self.code_guard = get_license_code_guard()
+        self.code_index = get_license_index()
+        self.token_signer = get_license_token_signer()
+        # Imported here because the allocator module builds on this one
+        from utils.license_code_pool import get_license_code_allocator
+        self.code_allocator = get_license_code_allocator()
+        in_memory = self.db_manager.db_path == ':memory:'
+        # No other process can write to an in-memory database, so the code guard sees every change
+        self.sole_writer = in_memory
+        if not self.sole_writer:
+            # Its rejections would each need confirming against the license snapshot, which
+            # answers on its own, so the filter would only add hashing, memory and rebuilds
+            if self.code_guard.enabled:
+                self.code_guard.disable("other processes can write to the database; "
+                                        "the license snapshot rejects unissued codes instead")
+        elif self.code_guard.enabled and not self.code_guard.ready:
+            self.code_guard.build(self._load_license_codes)
+        self.snapshot = get_license_snapshot('' if in_memory else f"{self.db_manager.db_path}.snapshot")
+        self.snapshot.start(self._iter_sorted_license_codes)
+    
+    def _load_license_codes(self) -> List[str]:
+        """Load every issued license code, used to build the code guard"""
+        with self.db_manager.get_session() as session:
+            rows = session.query(License.license_code).filter(License.license_code.isnot(None)).yield_per(10000)
+            return [row.license_code for row in rows]
+    
+    def _iter_sorted_license_codes(self) -> Iterator[str]:
+        """Yield every issued license code in byte order, used to write the license snapshot"""
+        with self.db_manager.get_connection() as connection:
+            # SQLite's default BINARY collation orders text by its bytes, and the index already is in that order
+            yield from connection.execution_options(yield_per=10000).execute(
+                select(License.license_code).where(License.license_code.isnot(None))
+                .order_by(License.license_code)).scalars()
     
     def get_api_key_by_email(self, email: str) -> Optional[str]:
         """Retrieve Mistral API key for a specific email"""
@@ -141,12 +455,57 @@ class LicenseRepository:
         """
         Check if a user with the given email already exists in the database.
         """
-        with self.db_manager.get_session() as session:
+        cached = self.cache.by_email.get(email)
+        if cached is not MISSING:
+            return cached is not None
+        with self.db_manager.get_connection() as connection:
             try:
-                return session.query(License).filter(License.email == email).first() is not None
+                found = bool(connection.execute(select(exists().where(License.email == email))).scalar())
+                if not found:
+                    self.cache.by_email.set(email, None)
+                return found
             except Exception as e:
                 logger.error(f"Error checking if user exists for {email}: {e}")
-                session.rollback()
+                return False
+    
+    def certainly_missing(self, license_code: str) -> bool:
+        """True only if license_code is certainly not issued. The code guard only runs when
+        this process is the sole writer; otherwise the shared snapshot answers."""
+        if self.code_guard.ready:
+            return not self.code_guard.might_contain(license_code)
+        return self.snapshot.lookup(license_code) is False
+    
+    def cached_license_code_exists(self, license_code: str) -> Any:
+        """Answer a license code existence check from the snapshot, code guard or cache.
+        Returns MISSING when the database has to be queried."""
+        # Checked first: it also holds codes other worker processes issued
+        issued = self.snapshot.lookup(license_code)
+        if issued is not None:
+            return issued
+        if self.code_guard.ready and not self.code_guard.might_contain(license_code):
+            return False
+        cached = self.cache.code_exists.get(license_code)
+        if cached is MISSING:
+            return MISSING
+        return cached is not None
+    
+    def license_code_exists(self, license_code: str) -> bool:
+        """Check if a license code has been issued, without loading the license"""
+        cached = self.cached_license_code_exists(license_code)
+        if cached is not MISSING:
+            return cached
+        return self.query_license_code_exists(license_code)
+    
+    def query_license_code_exists(self, license_code: str) -> bool:
+        """Check if a license code exists in the database and cache the answer"""
+        with self.db_manager.get_connection() as connection:
+            try:
+                found = bool(connection.execute(
+                    select(exists().where(License.license_code == license_code))).scalar())
+                self.cache.code_exists.set(license_code, True if found else None)
+                return found
+            except Exception as e:
+                logger.error(f"Error checking license code {license_code}: {e}")
                 return False
 
     def add_new_user(self, first_name: str, last_name: str, company_name: str, 
@@ -169,7 +528,9 @@ class LicenseRepository:
                 )
                 
                 session.add(new_license)
+                update_stats(session.connection(), users=1, users_per_company={company_name: 1})
                 session.commit()
+                self.cache.invalidate(email=email)
                 
                 logger.info(f"Successfully added new user: {email} with UUID: {new_license.id}")
                 return new_license.id
@@ -183,14 +544,132 @@ class LicenseRepository:
                 session.rollback()
                 return None
     
+    def bulk_add_users(self, users: List[Dict[str, str]], mint_license_codes: bool = False) -> List[Optional[str]]:
+        """Insert a batch of users in one transaction using executemany, optionally with license codes.
+        Returns one entry per user: None if it was inserted, otherwise why it was skipped."""
+        results: List[Optional[str]] = [None] * len(users)
+        emails = [user['email'] for user in users]
+        with self.db_manager.get_connection() as connection:
+            try:
+                registered = set()
+                for start in range(0, len(emails), SQLITE_MAX_PARAMETERS):
+                    chunk = emails[start:start + SQLITE_MAX_PARAMETERS]
+                    registered.update(connection.execute(
+                        select(License.email).where(License.email.in_(chunk))).scalars())
+                
+                now = datetime.utcnow()
+                rows = []
+                for index, user in enumerate(users):
+                    if user['email'] in registered:
+                        results[index] = "email already registered"
+                        continue
+                    rows.append((index, {
+                        'id': str(uuid.uuid4()),
+                        'first_name': user['first_name'],
+                        'last_name': user['last_name'],
+                        'company_name': user['company_name'],
+                        'email': user['email'],
+                        'license_code': None,
+                        'license_issued_at': None,
+                        'created_at': now,
+                        'updated_at': now
+                    }))
+                if not rows:
+                    return results
+                
+                if mint_license_codes:
+                    self._assign_license_codes(connection, [row for _, row in rows])
+                try:
+                    connection.execute(License.__table__.insert(), [row for _, row in rows])
+                    inserted = [row for _, row in rows]
+                except IntegrityError:
+                    # Another writer got in first; retry row by row to find the conflicts.
+                    # The rollback also returned the claimed codes to the pool.
+                    connection.rollback()
+                    if mint_license_codes:
+                        self._assign_license_codes(connection, [row for _, row in rows])
+                    inserted = []
+                    for index, row in rows:
+                        try:
+                            with connection.begin_nested():
+                                connection.execute(License.__table__.insert(), row)
+                            inserted.append(row)
+                        except IntegrityError:
+                            results[index] = "email already registered"
+                licensed = sum(1 for row in inserted if row['license_code'])
+                update_stats(connection, users=len(inserted), licensed_users=licensed,
+                             licenses_per_day={now.date(): licensed},
+                             users_per_company=Counter(row['company_name'] for row in inserted))
+                connection.commit()
+            except Exception as e:
+                logger.error(f"Error importing batch of {len(users)} users: {e}")
+                connection.rollback()
+                return [result or "database error" for result in results]
+        
+        for row in inserted:
+            self.cache.invalidate(email=row['email'], license_code=row['license_code'])
+            if row['license_code']:
+                self.code_guard.add(row['license_code'])
+        if any(row['license_code'] for row in inserted):
+            self.snapshot.changed()
+        logger.info(f"Imported {len(inserted)} of {len(users)} users")
+        return results
+    
+    def _assign_license_codes(self, connection: Connection, rows: List[Dict[str, Any]]):
+        """Give every row a license code from the pool, generating any the pool cannot supply"""
+        codes = self.code_allocator.claim_many(connection, len(rows))
+        codes += self._generate_unused_license_codes(connection, len(rows) - len(codes))
+        for row, code in zip(rows, codes):
+            row['license_code'] = code
+            row['license_issued_at'] = row['created_at']
+    
+    def _generate_unused_license_codes(self, connection: Connection, count: int) -> List[str]:
+        """Generate count distinct codes that are neither issued nor in the pool"""
+        codes: set = set()
+        while len(codes) < count:
+            candidates = {self._generate_license_code() for _ in range(min(count - len(codes), SQLITE_MAX_PARAMETERS))}
+            candidates -= codes
+            taken = set(connection.execute(
+                select(License.license_code).where(License.license_code.in_(candidates))).scalars())
+            taken.update(connection.execute(
+                select(LicenseCodePool.license_code).where(LicenseCodePool.license_code.in_(candidates))).scalars())
+            codes |= candidates - taken
+        return list(codes)
+    
     def _generate_license_code(self) -> str:
         """Generate a random 10-character alphanumeric license code"""
         characters = string.ascii_letters + string.digits  # a-z, A-Z, 0-9
         return ''.join(secrets.choice(characters) for _ in range(10))
     
-    def create_and_set_license_key(self, email: str) -> Optional[str]:
+    def _allocate_license_code(self, session: Session) -> Optional[str]:
+        """Claim a pre-generated code from the pool, or generate one and check it is unused"""
+        license_code = self.code_allocator.claim(session)
+        if license_code:
+            return license_code
+        
+        max_attempts = 10
+        for attempt in range(max_attempts):
+            license_code = self._generate_license_code()
+            
+            # Check that the code is neither issued nor waiting in the pool
+            taken = session.execute(select(
+                exists().where(License.license_code == license_code) |
+                exists().where(LicenseCodePool.license_code == license_code)
+            )).scalar()
+            if not taken:
+                return license_code
+        
+        logger.error("Failed to generate unique license code after maximum attempts")
+        return None
+    
+    def create_and_set_license_key(self, email: str, enqueue_email: bool = False,
+                                   stripe_event_id: Optional[str] = None,
+                                   payment_session_id: Optional[str] = None) -> Optional[str]:
         """Create and set license key for a user based on email, return the license key. 
-        If user already has a license key, return the existing one."""
+        If user already has a license key, return the existing one.
+        With enqueue_email, a license email is added to the outbox in the same transaction.
+        With stripe_event_id, that Stripe event is marked processed in the same transaction.
+        With payment_session_id, the checkout session outcome is recorded in the same transaction."""
         with self.db_manager.get_session() as session:
             try:
                 # Find user by email
@@ -202,27 +681,36 @@ class LicenseRepository:
                 # Check if user already has a license key
                 if user.license_code:
                     logger.info(f"User {email} already has license key: {user.license_code}")
-                    return user.license_code
+                    license_code = user.license_code
+                    if enqueue_email:
+                        self._enqueue_license_email(session, user)
+                    if stripe_event_id:
+                        self._mark_stripe_event_processed(session, stripe_event_id)
+                    if payment_session_id:
+                        self._record_payment_session(session, payment_session_id, user)
+                    if enqueue_email or stripe_event_id or payment_session_id:
+                        session.commit()
+                    return license_code
                 
-                # Generate unique license code
-                max_attempts = 10
-                for attempt in range(max_attempts):
-                    license_code = self._generate_license_code()
-                    
-                    # Check if license code already exists
-                    existing_license = session.query(License).filter(License.license_code == license_code).first()
-                    if not existing_license:
-                        break
-                    
-                    if attempt == max_attempts - 1:
-                        logger.error("Failed to generate unique license code after maximum attempts")
-                        return None
+                license_code = self._allocate_license_code(session)
+                if not license_code:
+                    return None
                 
                 # Update user with license code
                 user.license_code = license_code
-                user.updated_at = datetime.utcnow()
+                user.license_issued_at = user.updated_at = datetime.utcnow()
+                self._record_license_issued(session, user)
+                if enqueue_email:
+                    self._enqueue_license_email(session, user)
+                if stripe_event_id:
+                    self._mark_stripe_event_processed(session, stripe_event_id)
+                if payment_session_id:
+                    self._record_payment_session(session, payment_session_id, user)
                 
                 session.commit()
+                self.code_guard.add(license_code)
+                self.snapshot.changed()
+                self.cache.invalidate(email=email, license_code=license_code)
                 
                 logger.info(f"Successfully created license key for {email}: {license_code}")
                 return license_code
@@ -232,39 +720,152 @@ class LicenseRepository:
                 session.rollback()
                 return None
     
+    def _record_license_issued(self, session: Session, user: License):
+        """Count a newly issued license in the stats tables as part of the session's transaction"""
+        update_stats(session.connection(), licensed_users=1,
+                     licenses_per_day={user.license_issued_at.date(): 1})
+    
+    def _enqueue_license_email(self, session: Session, user: License):
+        """Add a license email for user to the outbox as part of the session's transaction"""
+        session.add(EmailOutbox(
+            email=user.email,
+            company_name=user.company_name,
+            license_code=user.license_code
+        ))
+        logger.info(f"Queued license email for {user.email}")
+    
+    def _mark_stripe_event_processed(self, session: Session, event_id: str):
+        """Mark a Stripe event processed as part of the session's transaction"""
+        now = datetime.utcnow()
+        session.execute(update(StripeEvent).where(StripeEvent.id == event_id)
+                        .values(status='processed', processed_at=now, last_error=None, updated_at=now))
+    
+    def _record_payment_session(self, session: Session, session_id: str, user: License):
+        """Record a completed checkout session as part of the session's transaction"""
+        session.add(PaymentSession(session_id=session_id, email=user.email, license_code=user.license_code))
+    
+    def issue_license_token(self, license_id: str, company_name: str) -> Optional[str]:
+        """Issue a signed, offline-verifiable token to hand out alongside a license code.
+        Returns None if token signing is not configured."""
+        return self.token_signer.issue(license_id, company_name)
+    
+    def cached_license_by_code(self, license_code: str) -> Any:
+        """Answer a license code lookup from the code guard or cache without touching
+        the database. Returns MISSING when the database has to be queried."""
+        if self.certainly_missing(license_code):
+            return None
+        cached = self.cache.by_code.get(license_code)
+        if cached is MISSING:
+            return MISSING
+        return dict(cached) if cached else None
+    
     def get_license_by_code(self, license_code: str) -> Optional[Dict[str, Any]]:
         """Get license information by license code"""
+        cached = self.cached_license_by_code(license_code)
+        if cached is not MISSING:
+            return cached
+        return self.query_license_by_code(license_code)
+    
+    def query_license_by_code(self, license_code: str) -> Optional[Dict[str, Any]]:
+        """Get license information by license code from the database and cache the result"""
         with self.db_manager.get_session() as session:
             try:
                 license_obj = session.query(License).filter(License.license_code == license_code).first()
-                if license_obj:
-                    return license_obj.to_dict()
-                return None
+                license_info = license_obj.to_dict() if license_obj else None
+                self.cache.by_code.set(license_code, license_info)
+                return dict(license_info) if license_info else None
             except Exception as e:
                 logger.error(f"Error retrieving license by code {license_code}: {e}")
                 return None
     
+    def get_licenses_by_codes(self, license_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get license information for many license codes at once, keyed by license code.
+        Codes that do not exist are left out of the result."""
+        candidates = [code for code in dict.fromkeys(license_codes) if not self.certainly_missing(code)]
+        licenses = {}
+        if not candidates:
+            return licenses
+        with self.db_manager.get_session() as session:
+            try:
+                for start in range(0, len(candidates), SQLITE_MAX_PARAMETERS):
+                    chunk = candidates[start:start + SQLITE_MAX_PARAMETERS]
+                    for license_obj in session.query(License).filter(License.license_code.in_(chunk)):
+                        licenses[license_obj.license_code] = license_obj.to_dict()
+                return licenses
+            except Exception as e:
+                logger.error(f"Error retrieving licenses for {len(candidates)} codes: {e}")
+                raise
+    
+    def license_codes_exist(self, license_codes: List[str]) -> Dict[str, bool]:
+        """Check whether each of many license codes has been issued. While the shared snapshot
+        covers every committed change, the license index answers in one vectorized pass;
+        whatever it cannot answer is looked up."""
+        license_codes = list(dict.fromkeys(license_codes))
+        results = dict(zip(license_codes, self.code_index.lookup_many(license_codes, self.snapshot.covering())))
+        unknown = [code for code, issued in results.items() if issued is None]
+        if unknown:
+            found = self.get_licenses_by_codes(unknown)
+            results.update((code, code in found) for code in unknown)
+        return results
+    
+    def cached_license_by_email(self, email: str) -> Any:
+        """Answer an email lookup from the cache without touching the database.
+        Returns MISSING when the database has to be queried."""
+        cached = self.cache.by_email.get(email)
+        if cached is MISSING:
+            return MISSING
+        return dict(cached) if cached else None
+    
     def get_license_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get license information by email"""
+        cached = self.cached_license_by_email(email)
+        if cached is not MISSING:
+            return cached
+        return self.query_license_by_email(email)
+    
+    def query_license_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get license information by email from the database and cache the result"""
         with self.db_manager.get_session() as session:
             try:
                 license_obj = session.query(License).filter(License.email == email).first()
-                if license_obj:
-                    return license_obj.to_dict()
-                return None
+                license_info = license_obj.to_dict() if license_obj else None
+                self.cache.by_email.set(email, license_info)
+                return dict(license_info) if license_info else None
             except Exception as e:
                 logger.error(f"Error retrieving license by email {email}: {e}")
                 return None
     
     def get_all_licenses(self) -> List[Dict[str, Any]]:
-        """Get all licenses from the database"""
-        with self.db_manager.get_session() as session:
-            try:
-                licenses = session.query(License).all()
-                return [license.to_dict() for license in licenses]
-            except Exception as e:
-                logger.error(f"Error retrieving all licenses: {e}")
-                return []
+        """Get all licenses from the database. Prefer get_licenses_page or iter_licenses for large tables."""
+        try:
+            return list(self.iter_licenses())
+        except Exception as e:
+            logger.error(f"Error retrieving all licenses: {e}")
+            return []
+    
+    def get_licenses_page(self, limit: int = 100,
+                          cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get up to limit licenses in (created_at, id) order, starting after cursor.
+        Returns the licenses and the cursor of the next page, or None on the last page.
+        Raises ValueError for a malformed cursor."""
+        query = select(License.__table__).order_by(License.created_at, License.id).limit(limit + 1)
+        if cursor:
+            query = query.where(tuple_(License.created_at, License.id) > tuple_(*decode_license_cursor(cursor)))
+        with self.db_manager.get_connection() as connection:
+            licenses = [license_row_to_dict(row) for row in connection.execute(query)]
+        if len(licenses) <= limit:
+            return licenses, None
+        licenses = licenses[:limit]
+        return licenses, encode_license_cursor(licenses[-1])
+    
+    def iter_licenses(self, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Yield every license in (created_at, id) order, fetching batch_size rows at a time
+        so memory stays flat however large the table is"""
+        query = select(License.__table__).order_by(License.created_at, License.id)
+        with self.db_manager.get_connection() as connection:
+            result = connection.execution_options(yield_per=batch_size).execute(query)
+            for row in result:
+                yield license_row_to_dict(row)
     
     def update_user_info(self, email: str, **kwargs) -> bool:
         """Update user information"""
@@ -277,12 +878,18 @@ class LicenseRepository:
                 
                 # Update allowed fields
                 allowed_fields = ['first_name', 'last_name', 'company_name']
+                previous_company = user.company_name
                 for field, value in kwargs.items():
                     if field in allowed_fields and hasattr(user, field):
                         setattr(user, field, value)
+                if user.company_name != previous_company:
+                    update_stats(session.connection(),
+                                 users_per_company={previous_company: -1, user.company_name: 1})
                 
                 user.updated_at = datetime.utcnow()
+                license_code = user.license_code
                 session.commit()
+                self.cache.invalidate(email=email, license_code=license_code)
                 
                 logger.info(f"Successfully updated user info for: {email}")
                 return True
@@ -301,8 +908,17 @@ class LicenseRepository:
                     logger.error(f"User not found for email: {email}")
                     return False
                 
+                license_code = user.license_code
                 session.delete(user)
+                update_stats(session.connection(), users=-1, users_per_company={user.company_name: -1})
+                if license_code:
+                    issued_at = user.license_issued_at or user.updated_at
+                    update_stats(session.connection(), licensed_users=-1,
+                                 licenses_per_day={issued_at.date(): -1})
                 session.commit()
+                self.code_guard.remove(license_code)
+                self.snapshot.removed(license_code)
+                self.cache.invalidate(email=email, license_code=license_code)
                 
                 logger.info(f"Successfully deleted user: {email}")
                 return True
@@ -340,25 +956,20 @@ class LicenseRepository:
                     logger.info(f"User {user_id} already has license key: {user.license_code}")
                     return user.license_code
                 
-                # Generate unique license code
-                max_attempts = 10
-                for attempt in range(max_attempts):
-                    license_code = self._generate_license_code()
-                    
-                    # Check if license code already exists
-                    existing_license = session.query(License).filter(License.license_code == license_code).first()
-                    if not existing_license:
-                        break
-                    
-                    if attempt == max_attempts - 1:
-                        logger.error("Failed to generate unique license code after maximum attempts")
-                        return None
+                license_code = self._allocate_license_code(session)
+                if not license_code:
+                    return None
                 
                 # Update user with license code
                 user.license_code = license_code
-                user.updated_at = datetime.utcnow()
+                user.license_issued_at = user.updated_at = datetime.utcnow()
+                self._record_license_issued(session, user)
+                user_email = user.email
                 
                 session.commit()
+                self.code_guard.add(license_code)
+                self.snapshot.changed()
+                self.cache.invalidate(email=user_email, license_code=license_code)
                 
                 logger.info(f"Successfully created license key for user_uuid {user_id}: {license_code}")
                 return license_code
@@ -369,6 +980,117 @@ class LicenseRepository:
                 return None
 
 
+class AsyncLicenseRepository:
+    """Awaitable facade over LicenseRepository for use inside async endpoints.
+
+    Lookups that the code guard or cache can answer are served directly on the
+    event loop. Everything that needs SQLite runs on a worker thread, so a slow
+    query or a writer holding the database lock no longer blocks other requests.
+    """
+    
+    def __init__(self, repository: Optional[LicenseRepository] = None):
+        self.repository = repository or LicenseRepository()
+        # Cap database threads so requests wait on the event loop instead of
+        # piling up on the connection pool inside worker threads
+        self.thread_limit = int(os.getenv('DB_THREAD_LIMIT', '8'))
+        self._limiter = None
+        self._limiter_loop = None
+    
+    @property
+    def limiter(self) -> anyio.CapacityLimiter:
+        # anyio limiters belong to an event loop, so one is created lazily per loop
+        loop = asyncio.get_running_loop()
+        if self._limiter is None or self._limiter_loop is not loop:
+            self._limiter = anyio.CapacityLimiter(self.thread_limit)
+            self._limiter_loop = loop
+        return self._limiter
+    
+    async def _run(self, func: Callable, *args, **kwargs):
+        return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=self.limiter)
+    
+    async def get_api_key_by_email(self, email: str) -> Optional[str]:
+        """Retrieve Mistral API key for a specific email"""
+        return await self._run(self.repository.get_api_key_by_email, email)
+    
+    async def get_api_key_by_license_key(self, license_key: str) -> Optional[str]:
+        """Retrieve Mistral API key for a specific license key"""
+        return await self._run(self.repository.get_api_key_by_license_key, license_key)
+    
+    async def user_exists(self, email: str) -> bool:
+        """Check if a user with the given email already exists in the database"""
+        return await self._run(self.repository.user_exists, email)
+    
+    async def license_code_exists(self, license_code: str) -> bool:
+        """Check if a license code has been issued, without loading the license"""
+        cached = self.repository.cached_license_code_exists(license_code)
+        if cached is not MISSING:
+            return cached
+        return await self._run(self.repository.query_license_code_exists, license_code)
+    
+    async def add_new_user(self, first_name: str, last_name: str, company_name: str,
+                           email: str) -> Optional[str]:
+        """Add a new user to the database and return the user UUID"""
+        return await self._run(self.repository.add_new_user, first_name=first_name,
+                               last_name=last_name, company_name=company_name, email=email)
+    
+    async def create_and_set_license_key(self, email: str, enqueue_email: bool = False,
+                                         payment_session_id: Optional[str] = None) -> Optional[str]:
+        """Create and set license key for a user based on email, return the license key"""
+        return await self._run(self.repository.create_and_set_license_key, email,
+                               enqueue_email=enqueue_email, payment_session_id=payment_session_id)
+    
+    def issue_license_token(self, license_id: str, company_name: str) -> Optional[str]:
+        """Issue a signed, offline-verifiable token to hand out alongside a license code"""
+        return self.repository.issue_license_token(license_id, company_name)
+    
+    async def get_license_by_code(self, license_code: str) -> Optional[Dict[str, Any]]:
+        """Get license information by license code"""
+        cached = self.repository.cached_license_by_code(license_code)
+        if cached is not MISSING:
+            return cached
+        return await self._run(self.repository.query_license_by_code, license_code)
+    
+    async def get_licenses_by_codes(self, license_codes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get license information for many license codes at once, keyed by license code"""
+        return await self._run(self.repository.get_licenses_by_codes, license_codes)
+    
+    async def license_codes_exist(self, license_codes: List[str]) -> Dict[str, bool]:
+        """Check whether each of many license codes has been issued"""
+        return await self._run(self.repository.license_codes_exist, license_codes)
+    
+    async def get_license_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        """Get license information by email"""
+        cached = self.repository.cached_license_by_email(email)
+        if cached is not MISSING:
+            return cached
+        return await self._run(self.repository.query_license_by_email, email)
+    
+    async def get_all_licenses(self) -> List[Dict[str, Any]]:
+        """Get all licenses from the database"""
+        return await self._run(self.repository.get_all_licenses)
+    
+    async def get_licenses_page(self, limit: int = 100,
+                                cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get up to limit licenses in (created_at, id) order, starting after cursor"""
+        return await self._run(self.repository.get_licenses_page, limit, cursor)
+    
+    async def update_user_info(self, email: str, **kwargs) -> bool:
+        """Update user information"""
+        return await self._run(self.repository.update_user_info, email, **kwargs)
+    
+    async def delete_user(self, email: str) -> bool:
+        """Delete a user from the database"""
+        return await self._run(self.repository.delete_user, email)
+    
+    async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get user information by user UUID"""
+        return await self._run(self.repository.get_user_by_id, user_id)
+    
+    async def create_and_set_license_key_by_user_id(self, user_id: str) -> Optional[str]:
+        """Create and set license key for a user based on user_id, return the license key"""
+        return await self._run(self.repository.create_and_set_license_key_by_user_id, user_id)
+
+
 # Convenience functions for easy access
 def get_db_manager() -> DatabaseManager:
     """Get the database manager instance"""
@@ -378,6 +1100,10 @@ def get_license_repository() -> LicenseRepository:
     """Get the license repository instance"""
     return LicenseRepository()
 
+def get_async_license_repository(repository: Optional[LicenseRepository] = None) -> AsyncLicenseRepository:
+    """Get an async license repository instance"""
+    return AsyncLicenseRepository(repository)
+
 
 # Example usage and testing
 def test_db_utils():
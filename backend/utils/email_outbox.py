@@ -0,0 +1,183 @@
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from pydantic import BaseModel
+from sqlalchemy import select, update, func, or_, and_
+from utils.db_utils import DatabaseManager, EmailOutbox
+from utils.email_sender import LicenseEmailSender
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class EmailOutboxSettings(BaseModel):
+    """Tunables for the background license email workers"""
+    workers: int = int(os.getenv('EMAIL_OUTBOX_WORKERS', '2'))
+    max_attempts: int = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+    backoff_seconds: float = float(os.getenv('EMAIL_OUTBOX_BACKOFF_SECONDS', '30'))
+    max_backoff_seconds: float = float(os.getenv('EMAIL_OUTBOX_MAX_BACKOFF_SECONDS', '3600'))
+    poll_seconds: float = float(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', '5'))
+    # A message stuck in 'sending' this long belongs to a worker that died
+    claim_timeout_seconds: float = float(os.getenv('EMAIL_OUTBOX_CLAIM_TIMEOUT_SECONDS', '300'))
+
+
+class EmailOutboxWorker:
+    """Pool of threads that drain the email outbox.
+
+    Each worker atomically claims one due message at a time, sends it with
+    LicenseEmailSender and marks it sent. Failed sends are retried with
+    exponential backoff and jitter; after max_attempts the message is moved to
+    the 'dead' status for manual follow-up. Claims are made with a single
+    UPDATE, so several processes can drain the same outbox safely.
+    """
+
+    def __init__(self, settings: Optional[EmailOutboxSettings] = None,
+                 sender_factory: Callable[[], LicenseEmailSender] = LicenseEmailSender):
+        self.settings = settings or EmailOutboxSettings()
+        self.db_manager = DatabaseManager()
+        self.sender_factory = sender_factory
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.sent = 0
+        self.failed = 0
+        self.dead_lettered = 0
+
+    def start(self):
+        """Start the worker threads"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.settings.workers):
+            thread = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.settings.workers} email outbox workers")
+
+    def stop(self, timeout: float = 10):
+        """Ask the workers to finish their current message and exit"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers because a new message was queued"""
+        self._wakeup.set()
+
+    def _run(self):
+        sender = self.sender_factory()
+        while not self._stopping.is_set():
+            try:
+                processed = self.process_one(sender)
+            except Exception as e:
+                logger.error(f"Email outbox worker error: {e}")
+                processed = False
+            if not processed:
+                self._wakeup.wait(self.settings.poll_seconds)
+                self._wakeup.clear()
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically claim the oldest due message, or return None if nothing is due"""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.settings.claim_timeout_seconds)
+        due = select(EmailOutbox.id).where(or_(
+            and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+            and_(EmailOutbox.status == 'sending', EmailOutbox.claimed_at < stale_before)
+        )).order_by(EmailOutbox.id).limit(1).scalar_subquery()
+        claim = (
+            update(EmailOutbox)
+            .where(EmailOutbox.id == due)
+            .values(status='sending', claimed_at=now, attempts=EmailOutbox.attempts + 1, updated_at=now)
+            .returning(EmailOutbox.id, EmailOutbox.email, EmailOutbox.company_name,
+                       EmailOutbox.license_code, EmailOutbox.attempts)
+        )
+        with self.db_manager.get_connection() as connection:
+            row = connection.execute(claim).first()
+            connection.commit()
+        return dict(row._mapping) if row else None
+
+    def process_one(self, sender: Optional[LicenseEmailSender] = None) -> bool:
+        """Claim and send one message. Returns False if nothing was due."""
+        message = self.claim_next()
+        if not message:
+            return False
+
+        sender = sender or self.sender_factory()
+        try:
+            success, _ = sender.send_license_email(
+                message['email'], message['company_name'], message['license_code'])
+            error = None if success else "send_license_email reported failure"
+        except Exception as e:
+            success, error = False, str(e)
+
+        if success:
+            self._finish(message['id'], status='sent')
+            self.sent += 1
+            logger.info(f"Delivered queued license email to {message['email']}")
+        elif message['attempts'] >= self.settings.max_attempts:
+            self._finish(message['id'], status='dead', error=error)
+            self.dead_lettered += 1
+            logger.error(f"Giving up on license email to {message['email']} after "
+                         f"{message['attempts']} attempts: {error}")
+        else:
+            delay = self.backoff_delay(message['attempts'])
+            self._finish(message['id'], status='pending', error=error,
+                         next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+            self.failed += 1
+            logger.warning(f"License email to {message['email']} failed (attempt {message['attempts']}), "
+                           f"retrying in {delay:.0f}s: {error}")
+        return True
+
+    def backoff_delay(self, attempts: int) -> float:
+        """Exponential backoff with +/-20% jitter"""
+        delay = min(self.settings.max_backoff_seconds, self.settings.backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _finish(self, message_id: int, status: str, error: Optional[str] = None,
+                next_attempt_at: Optional[datetime] = None):
+        values = {'status': status, 'last_error': error[:500] if error else None, 'updated_at': datetime.utcnow()}
+        if next_attempt_at:
+            values['next_attempt_at'] = next_attempt_at
+        with self.db_manager.get_connection() as connection:
+            connection.execute(update(EmailOutbox).where(EmailOutbox.id == message_id).values(**values))
+            connection.commit()
+
+    def retry_dead_letters(self) -> int:
+        """Move every dead message back to pending with a fresh attempt budget"""
+        with self.db_manager.get_connection() as connection:
+            result = connection.execute(
+                update(EmailOutbox).where(EmailOutbox.status == 'dead')
+                .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow(),
+                        updated_at=datetime.utcnow()))
+            connection.commit()
+        self.notify()
+        return result.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Return outbox depth per status and worker counters"""
+        with self.db_manager.get_connection() as connection:
+            rows = connection.execute(
+                select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status)).all()
+        return {
+            'by_status': {status: count for status, count in rows},
+            'workers': len(self._threads),
+            'sent': self.sent,
+            'failed_attempts': self.failed,
+            'dead_lettered': self.dead_lettered
+        }
+
+
+_worker: Optional[EmailOutboxWorker] = None
+
+
+def get_email_outbox_worker() -> EmailOutboxWorker:
+    """Get the process-wide email outbox worker"""
+    global _worker
+    if _worker is None:
+        _worker = EmailOutboxWorker()
+    return _worker
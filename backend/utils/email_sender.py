@@ -1,9 +1,17 @@
 import os
+import time
+import base64
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 import smtplib
 import ssl
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from email.header import Header
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from utils.metrics import get_metrics
 import uuid
 import logging
 
@@ -12,136 +20,272 @@ logger = logging.getLogger(__name__)
 
 # Define the email settings
 class EmailSettings(BaseModel):
-    email_sender: str = os.getenv('GMAIL_EMAIL')
-    app_password: str = os.getenv('GMAIL_APP_PASSWORD')
+    email_sender: Optional[str] = os.getenv('GMAIL_EMAIL')
+    app_password: Optional[str] = os.getenv('GMAIL_APP_PASSWORD')
+    smtp_host: str = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+    smtp_port: int = int(os.getenv('SMTP_PORT', '587'))
+    smtp_starttls: bool = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+    smtp_timeout_seconds: float = float(os.getenv('SMTP_TIMEOUT_SECONDS', '30'))
+    # Authenticated connections kept open and reused across messages
+    pool_size: int = int(os.getenv('SMTP_POOL_SIZE', '2'))
+    # Connections idle longer than this are closed
+    idle_timeout_seconds: float = float(os.getenv('SMTP_IDLE_TIMEOUT_SECONDS', '60'))
+    # Connections idle longer than this are checked with NOOP before reuse
+    noop_after_seconds: float = float(os.getenv('SMTP_NOOP_AFTER_SECONDS', '5'))
+
+
+class SMTPConnectionPool:
+    """Bounded pool of logged-in SMTP connections.
+
+    Connecting to Gmail costs a TCP handshake, two EHLOs, STARTTLS and a
+    login, so connections are kept open and reused. A connection that sat idle
+    for a while is probed with NOOP before reuse, one idle past
+    idle_timeout_seconds is closed by a reaper thread, and a send that fails
+    because the server dropped the connection is retried once on a fresh one.
+    """
+
+    def __init__(self, settings: EmailSettings):
+        self.settings = settings
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, settings.pool_size))
+        self._reaper: Optional[threading.Thread] = None
+        self.connects = 0
+        self.reuses = 0
+        self.reconnects = 0
+        self.idle_closed = 0
+        self.metrics = get_metrics()
+
+    def _connect(self) -> smtplib.SMTP:
+        started = time.perf_counter()
+        try:
+            server = smtplib.SMTP(self.settings.smtp_host, self.settings.smtp_port,
+                                  timeout=self.settings.smtp_timeout_seconds)
+        except Exception:
+            self.metrics.smtp_operations.labels('connect', 'error').observe(time.perf_counter() - started)
+            raise
+        try:
+            server.ehlo()
+            if self.settings.smtp_starttls:
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+            server.login(self.settings.email_sender, self.settings.app_password)
+        except Exception:
+            self._close(server)
+            self.metrics.smtp_operations.labels('connect', 'error').observe(time.perf_counter() - started)
+            raise
+        self.metrics.smtp_operations.labels('connect', 'ok').observe(time.perf_counter() - started)
+        with self._lock:
+            self.connects += 1
+        self._start_reaper()
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _checkout(self) -> smtplib.SMTP:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, last_used = self._idle.pop()
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.settings.idle_timeout_seconds:
+                self._close(server)
+                continue
+            if idle_for > self.settings.noop_after_seconds and not self._is_alive(server):
+                self._close(server)
+                continue
+            with self._lock:
+                self.reuses += 1
+            return server
+        return self._connect()
+
+    def _checkin(self, server: smtplib.SMTP):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Borrow a logged-in connection. It is discarded if the block raises."""
+        self._slots.acquire()
+        try:
+            server = self._checkout()
+            try:
+                yield server
+            except Exception:
+                self._close(server)
+                raise
+            self._checkin(server)
+        finally:
+            self._slots.release()
+
+    def sendmail(self, from_addr: str, to_addr: str, message: str):
+        """Send a message, retrying once on a new connection if the pooled one was dropped"""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            try:
+                with self.connection() as server:
+                    server.sendmail(from_addr, to_addr, message)
+                outcome = 'ok'
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                with self._lock:
+                    self.reconnects += 1
+                with self.connection() as server:
+                    server.sendmail(from_addr, to_addr, message)
+                outcome = 'retried'
+        finally:
+            self.metrics.smtp_operations.labels('send', outcome).observe(time.perf_counter() - started)
+
+    def _start_reaper(self):
+        with self._lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap, name="smtp-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(1.0, self.settings.idle_timeout_seconds / 2))
+            self.close_idle()
+
+    def close_idle(self, max_idle_seconds: Optional[float] = None):
+        """Close connections that have been idle too long"""
+        limit = self.settings.idle_timeout_seconds if max_idle_seconds is None else max_idle_seconds
+        now = time.monotonic()
+        with self._lock:
+            expired = [server for server, last_used in self._idle if now - last_used >= limit]
+            self._idle = [(server, last_used) for server, last_used in self._idle if now - last_used < limit]
+            self.idle_closed += len(expired)
+        for server in expired:
+            self._close(server)
+
+    def close_all(self):
+        """Close every idle connection"""
+        self.close_idle(max_idle_seconds=0)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'connects': self.connects,
+                'reuses': self.reuses,
+                'reconnects': self.reconnects,
+                'idle_closed': self.idle_closed
+            }
+
+
+_pools: Dict[tuple, SMTPConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(settings: EmailSettings) -> SMTPConnectionPool:
+    """Get the shared connection pool for a server and account"""
+    key = (settings.smtp_host, settings.smtp_port, settings.email_sender)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = SMTPConnectionPool(settings)
+        return _pools[key]
+
+
+TEMPLATES_DIR = Path(__file__).parent.parent / "templates" / "email"
+LICENSE_EMAIL_SUBJECT = "Your VisionPay Premium License Key 🔑"
+# SMTP limits a line to 998 characters; longer or non-ASCII bodies are base64 encoded
+SMTP_MAX_LINE_LENGTH = 998
+
+# Templates are compiled on first use and kept for the life of the process
+_template_env = Environment(
+    loader=FileSystemLoader(str(TEMPLATES_DIR)),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False
+)
+
+
+def _encode_part(content_type: str, body: str) -> str:
+    if body.isascii() and all(len(line) <= SMTP_MAX_LINE_LENGTH for line in body.splitlines()):
+        return (f'Content-Type: {content_type}; charset="us-ascii"\n'
+                f'MIME-Version: 1.0\nContent-Transfer-Encoding: 7bit\n\n{body}')
+    encoded = base64.encodebytes(body.encode('utf-8')).decode('ascii')
+    return (f'Content-Type: {content_type}; charset="utf-8"\n'
+            f'MIME-Version: 1.0\nContent-Transfer-Encoding: base64\n\n{encoded}')
+
+
+class LicenseEmailTemplate:
+    """License key email rendered into a pre-built multipart/alternative skeleton.
+
+    The HTML and plain-text templates are compiled once, and the message
+    headers, MIME boundaries and part headers are serialized once per sender
+    address. Building a message only renders the two bodies and fills in the
+    recipient.
+    """
+
+    def __init__(self, email_sender: str, subject: str = LICENSE_EMAIL_SUBJECT):
+        self.html_template = _template_env.get_template('license_key.html')
+        self.text_template = _template_env.get_template('license_key.txt')
+        self.boundary = f"===============visionpay{uuid.uuid4().hex}=="
+        self._head = (
+            f'Content-Type: multipart/alternative; boundary="{self.boundary}"\n'
+            f'MIME-Version: 1.0\n'
+            f'Subject: {Header(subject, "utf-8").encode()}\n'
+            f'From: {email_sender}\n'
+            f'To: '
+        )
+        self._separator = f'\n--{self.boundary}\n'
+        self._end = f'\n--{self.boundary}--\n'
+
+    def render_html(self, license_key: str, company_name: str) -> str:
+        return self.html_template.render(license_key=license_key, company_name=company_name)
+
+    def render_text(self, license_key: str, company_name: str) -> str:
+        return self.text_template.render(license_key=license_key, company_name=company_name)
+
+    def build_message(self, email: str, company_name: str, license_key: str) -> str:
+        """Return the complete message, ready for sendmail"""
+        if '\r' in email or '\n' in email:
+            raise ValueError("Recipient address contains a line break")
+        # Text first: mail clients show the last alternative they can display
+        return ''.join((
+            self._head, email, '\n', self._separator,
+            _encode_part('text/plain', self.render_text(license_key, company_name)),
+            self._separator,
+            _encode_part('text/html', self.render_html(license_key, company_name)),
+            self._end
+        ))
+
+
+@lru_cache(maxsize=None)
+def get_license_email_template(email_sender: str) -> LicenseEmailTemplate:
+    """Get the compiled license email template for a sender address"""
+    return LicenseEmailTemplate(email_sender)
 
 
 class LicenseEmailSender:
-    def __init__(self):
-        self.email_settings = EmailSettings()
+    def __init__(self, email_settings: Optional[EmailSettings] = None):
+        self.email_settings = email_settings or EmailSettings()
+        self.template = get_license_email_template(self.email_settings.email_sender or "")
 
     def define_email_body(self, license_key: str, company_name: str) -> str:
         """Define the email body for license key delivery."""
-        return f"""
-        <html>
-        <head>
-            <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333333;
-                    max-width: 600px;
-                    margin: 0 auto;
-                    padding: 20px;
-                }}
-                .container {{
-                    background-color: #ffffff;
-                    border-radius: 8px;
-                    padding: 30px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                }}
-                .header {{
-                    text-align: center;
-                    margin-bottom: 30px;
-                }}
-                .logo {{
-                    font-size: 28px;
-                    font-weight: bold;
-                    color: #5B67E8;
-                    margin-bottom: 10px;
-                }}
-                .license-section {{
-                    background-color: #f8fafc;
-                    border-radius: 8px;
-                    padding: 25px;
-                    margin: 30px 0;
-                    text-align: center;
-                }}
-                .license-label {{
-                    font-size: 14px;
-                    color: #718096;
-                    margin-bottom: 10px;
-                    text-transform: uppercase;
-                    letter-spacing: 1px;
-                }}
-                .license-key {{
-                    background-color: #ffffff;
-                    border: 2px solid #5B67E8;
-                    border-radius: 6px;
-                    padding: 15px;
-                    font-size: 18px;
-                    font-weight: bold;
-                    color: #2d3748;
-                    letter-spacing: 2px;
-                    word-break: break-all;
-                    font-family: 'Courier New', monospace;
-                }}
-                .instructions {{
-                    background-color: #f0f9ff;
-                    border-left: 4px solid #5B67E8;
-                    border-radius: 6px;
-                    padding: 20px;
-                    margin: 25px 0;
-                    font-size: 16px;
-                    line-height: 1.5;
-                    color: #2d3748;
-                }}
-                .instructions-title {{
-                    font-weight: bold;
-                    color: #5B67E8;
-                    margin-bottom: 8px;
-                    font-size: 14px;
-                    text-transform: uppercase;
-                    letter-spacing: 1px;
-                }}
-                .footer {{
-                    text-align: center;
-                    font-size: 14px;
-                    color: #718096;
-                    margin-top: 30px;
-                    border-top: 1px solid #e2e8f0;
-                    padding-top: 20px;
-                }}
-                .support {{
-                    color: #5B67E8;
-                    text-decoration: none;
-                }}
-                .welcome-footer {{
-                    text-align: center;
-                    font-size: 18px;
-                    color: #5B67E8;
-                    margin-top: 20px;
-                    font-weight: bold;
-                }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <div class="logo">VisionPay</div>
-                </div>
-                
-                <div class="license-section">
-                    <div class="license-label">Your License Key</div>
-                    <div class="license-key">{license_key}</div>
-                </div>
-                
-                <div class="instructions">
-                    <div class="instructions-title">Next Steps</div>
-                    Share this license key throughout your company so users can sign up using this key.
-                </div>
-                
-                <p>If you have any questions or need assistance, please don't hesitate to contact our support at <a href="mailto:support@visionpay.com" class="support">support@visionpay.com</a></p>
-                
-                <div class="instructions">
-                    <div class="instructions-title">Important Disclosure</div>
-                    This license key gives you and your internal team access to the tool. Feel free to share it with anyone on your team who needs to use it.<br><br>
-                    It's meant for internal use only and not for external distribution.
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        return self.template.render_html(license_key, company_name)
+
+    def define_text_body(self, license_key: str, company_name: str) -> str:
+        """Define the plain-text alternative of the license key email."""
+        return self.template.render_text(license_key, company_name)
 
     def send_license_email(self, email: str, company_name: str, license_key: str) -> tuple[bool, str]:
         """Send a license key email to the user."""
@@ -155,25 +299,12 @@ class LicenseEmailSender:
             print("💡 To enable actual email sending, configure GMAIL_EMAIL and GMAIL_APP_PASSWORD environment variables")
             return True, license_key  # Return success for testing
         
-        message = MIMEMultipart("alternative")
-        message["Subject"] = "Your VisionPay Premium License Key 🔑"
-        message["From"] = self.email_settings.email_sender
-        message["To"] = email
-
-        part = MIMEText(self.define_email_body(license_key, company_name), "html")
-        message.attach(part)
-        
         print(f'Sending license key email to {email}')
-        context = ssl.create_default_context()
         try:
-            with smtplib.SMTP("smtp.gmail.com", 587) as server:
-                server.ehlo()
-                server.starttls(context=context)
-                server.ehlo()
-                server.login(self.email_settings.email_sender, self.email_settings.app_password)
-                server.sendmail(
-                    self.email_settings.email_sender, email, message.as_string()
-                )
+            message = self.template.build_message(email, company_name, license_key)
+            get_smtp_pool(self.email_settings).sendmail(
+                self.email_settings.email_sender, email, message
+            )
             print(f"✅ Email sent successfully to {email}")
             return True, license_key
         except Exception as e:
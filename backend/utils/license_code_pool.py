@@ -0,0 +1,194 @@
+import os
+import time
+import string
+import secrets
+import threading
+from typing import Any, Dict, List, Optional, Set
+from pydantic import BaseModel
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from utils.db_utils import DatabaseManager, License, LicenseCodePool, SQLITE_MAX_PARAMETERS
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LICENSE_CODE_CHARACTERS = string.ascii_letters + string.digits
+
+
+class LicenseCodePoolSettings(BaseModel):
+    """Tunables for the pool of pre-generated license codes"""
+    enabled: bool = os.getenv('LICENSE_CODE_POOL_ENABLED', 'true').lower() == 'true'
+    # The refill thread wakes up when the pool drops below this many codes
+    low_watermark: int = int(os.getenv('LICENSE_CODE_POOL_LOW_WATERMARK', '200'))
+    # and tops it up to this many
+    target_size: int = int(os.getenv('LICENSE_CODE_POOL_TARGET_SIZE', '1000'))
+    batch_size: int = int(os.getenv('LICENSE_CODE_POOL_BATCH_SIZE', '500'))
+    check_seconds: float = float(os.getenv('LICENSE_CODE_POOL_CHECK_SECONDS', '60'))
+
+
+class LicenseCodeAllocator:
+    """Hands out pre-generated, unused license codes with one statement.
+
+    A background thread keeps the license_code_pool table between
+    low_watermark and target_size codes. Every pooled code is checked against
+    the licenses table when it is minted, and the table's unique constraint
+    keeps pooled codes distinct. claim() removes the oldest code with a single
+    DELETE ... RETURNING inside the caller's transaction, so two workers can
+    never receive the same code, and a rolled-back license update puts the
+    code back. When the pool is empty or disabled, claim() returns None and
+    the repository falls back to generating a code and checking it.
+    """
+
+    def __init__(self, settings: Optional[LicenseCodePoolSettings] = None):
+        self.settings = settings or LicenseCodePoolSettings()
+        self.db_manager = DatabaseManager()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Approximate depth, corrected by every refill
+        self._depth_estimate = 0
+        self.claimed = 0
+        self.empty_claims = 0
+        self.refills = 0
+        self.minted = 0
+        self.last_refill_ms = 0.0
+        oldest = select(LicenseCodePool.id).order_by(LicenseCodePool.id).limit(1).scalar_subquery()
+        self._claim_statement = delete(LicenseCodePool).where(LicenseCodePool.id == oldest) \
+            .returning(LicenseCodePool.license_code)
+
+    def start(self):
+        """Start the refill thread, which fills the pool right away"""
+        if not self.settings.enabled or self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="license-code-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the refill thread"""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refill()
+            except Exception as e:
+                logger.error(f"License code pool refill failed: {e}")
+            self._wakeup.wait(self.settings.check_seconds)
+            self._wakeup.clear()
+
+    def claim(self, session: Session) -> Optional[str]:
+        """Take a code from the pool as part of the session's transaction, or None if it is empty"""
+        if not self.settings.enabled:
+            return None
+        # Core execution on the session's connection skips ORM delete synchronization
+        license_code = session.connection().execute(self._claim_statement).scalar()
+        with self._lock:
+            if license_code is None:
+                self.empty_claims += 1
+                self._depth_estimate = 0
+            else:
+                self.claimed += 1
+                self._depth_estimate -= 1
+            low = self._depth_estimate < self.settings.low_watermark
+        if low:
+            self._wakeup.set()
+        return license_code
+
+    def claim_many(self, connection: Connection, count: int) -> List[str]:
+        """Take up to count codes from the pool as part of the connection's transaction"""
+        if not self.settings.enabled or count <= 0:
+            return []
+        oldest = select(LicenseCodePool.id).order_by(LicenseCodePool.id).limit(count)
+        license_codes = list(connection.execute(
+            delete(LicenseCodePool).where(LicenseCodePool.id.in_(oldest)).returning(LicenseCodePool.license_code)
+        ).scalars())
+        with self._lock:
+            self.claimed += len(license_codes)
+            self._depth_estimate -= len(license_codes)
+            low = self._depth_estimate < self.settings.low_watermark
+        if low:
+            self._wakeup.set()
+        return license_codes
+
+    def depth(self) -> int:
+        """Number of codes currently in the pool"""
+        with self.db_manager.get_connection() as connection:
+            return connection.execute(select(func.count()).select_from(LicenseCodePool)).scalar_one()
+
+    def refill(self) -> int:
+        """Top the pool up to target_size. Returns the number of codes added."""
+        started = time.perf_counter()
+        added = 0
+        depth = self.depth()
+        while depth < self.settings.target_size and not self._stopping.is_set():
+            wanted = min(self.settings.batch_size, self.settings.target_size - depth)
+            inserted = self._mint(self._candidates(wanted))
+            added += inserted
+            depth += inserted
+        with self._lock:
+            self._depth_estimate = depth
+            if added:
+                self.refills += 1
+                self.minted += added
+                self.last_refill_ms = round((time.perf_counter() - started) * 1000, 2)
+        if added:
+            logger.info(f"Added {added} license codes to the pool, depth is now {depth}")
+        return added
+
+    def _candidates(self, count: int) -> Set[str]:
+        return {''.join(secrets.choice(LICENSE_CODE_CHARACTERS) for _ in range(10)) for _ in range(count)}
+
+    def _mint(self, candidates: Set[str]) -> int:
+        """Add the candidates that are not issued yet to the pool"""
+        with self.db_manager.get_connection() as connection:
+            issued = set()
+            codes = list(candidates)
+            for start in range(0, len(codes), SQLITE_MAX_PARAMETERS):
+                chunk = codes[start:start + SQLITE_MAX_PARAMETERS]
+                issued.update(connection.execute(
+                    select(License.license_code).where(License.license_code.in_(chunk))).scalars())
+            fresh = [{'license_code': code} for code in candidates - issued]
+            if not fresh:
+                return 0
+            # Codes already in the pool are skipped by the unique constraint
+            result = connection.execute(sqlite_insert(LicenseCodePool).on_conflict_do_nothing(), fresh)
+            connection.commit()
+        return result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(fresh)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool depth and allocation counters"""
+        depth = self.depth()
+        with self._lock:
+            return {
+                'enabled': self.settings.enabled,
+                'depth': depth,
+                'low_watermark': self.settings.low_watermark,
+                'target_size': self.settings.target_size,
+                'claimed': self.claimed,
+                'empty_claims': self.empty_claims,
+                'refills': self.refills,
+                'minted': self.minted,
+                'last_refill_ms': self.last_refill_ms
+            }
+
+
+_allocator: Optional[LicenseCodeAllocator] = None
+_allocator_lock = threading.Lock()
+
+
+def get_license_code_allocator() -> LicenseCodeAllocator:
+    """Get the process-wide license code allocator"""
+    global _allocator
+    with _allocator_lock:
+        if _allocator is None:
+            _allocator = LicenseCodeAllocator()
+        return _allocator
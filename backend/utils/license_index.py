@@ -0,0 +1,317 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from pydantic import BaseModel
+from utils.license_snapshot import MappedSnapshot
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CODE_WIDTH = 10
+# In ASCII order, so packed keys sort the same way as the codes themselves
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(ALPHABET)
+# 62 ** 10 < 2 ** 60, so every valid code has a key below this
+INVALID_KEY = np.uint64(2 ** 64 - 1)
+
+_DIGIT_OF = {character: digit for digit, character in enumerate(ALPHABET)}
+_DIGIT_TABLE = np.full(256, 255, dtype=np.uint8)
+_DIGIT_TABLE[[ord(character) for character in ALPHABET]] = np.arange(BASE, dtype=np.uint8)
+_PLACE_VALUES = BASE ** np.arange(CODE_WIDTH - 1, -1, -1, dtype=np.uint64)
+
+
+class LicenseIndexSettings(BaseModel):
+    """Tunables for the packed in-memory license code index"""
+    enabled: bool = os.getenv('LICENSE_INDEX_ENABLED', 'true').lower() == 'true'
+    # Codes added or removed since the last merge are held in sets up to this many
+    merge_threshold: int = int(os.getenv('LICENSE_INDEX_MERGE_THRESHOLD', '4096'))
+
+
+def encode_code(license_code: str) -> Optional[int]:
+    """Pack one license code into an integer below 62 ** 10, or None if it is not a
+    CODE_WIDTH character alphanumeric code"""
+    if len(license_code) != CODE_WIDTH:
+        return None
+    key = 0
+    for character in license_code:
+        digit = _DIGIT_OF.get(character)
+        if digit is None:
+            return None
+        key = key * BASE + digit
+    return key
+
+
+def _pack(characters: np.ndarray) -> np.ndarray:
+    """Pack an (n, CODE_WIDTH) array of character ordinals, clipped to 0-255"""
+    keys = np.zeros(characters.shape[0], dtype=np.uint64)
+    valid = np.ones(characters.shape[0], dtype=bool)
+    # One column at a time, so memory stays at a few n-sized arrays
+    for column in range(CODE_WIDTH):
+        digits = _DIGIT_TABLE[characters[:, column]]
+        valid &= digits != 255
+        keys *= np.uint64(BASE)
+        keys += digits
+    keys[~valid] = INVALID_KEY
+    return keys
+
+
+def encode_codes(license_codes: Sequence[str]) -> np.ndarray:
+    """Pack many license codes at once; codes that cannot be packed get INVALID_KEY"""
+    text = np.asarray(license_codes, dtype=np.str_)
+    if text.size == 0 or text.itemsize // 4 < CODE_WIDTH:
+        return np.full(text.size, INVALID_KEY, dtype=np.uint64)
+    characters = text.view(np.uint32).reshape(text.size, -1)
+    # Shorter codes are padded with NUL and anything outside Latin-1 is clipped, both map to 255
+    keys = _pack(np.minimum(characters[:, :CODE_WIDTH], 255))
+    # numpy strips trailing NULs, so a code followed by NULs would otherwise pack like the code
+    lengths = np.fromiter(map(len, license_codes), dtype=np.intp, count=text.size)
+    keys[lengths != CODE_WIDTH] = INVALID_KEY
+    return keys
+
+
+def encode_code_bytes(buffer) -> np.ndarray:
+    """Pack a buffer of back-to-back CODE_WIDTH byte ASCII codes, such as a license snapshot's"""
+    return _pack(np.frombuffer(buffer, dtype=np.uint8).reshape(-1, CODE_WIDTH))
+
+
+def decode_key(key: int) -> str:
+    """Unpack a key made by encode_code"""
+    characters = []
+    for _ in range(CODE_WIDTH):
+        key, digit = divmod(int(key), BASE)
+        characters.append(ALPHABET[digit])
+    return ''.join(reversed(characters))
+
+
+def _members(keys: np.ndarray, sorted_keys: np.ndarray) -> np.ndarray:
+    # Searching in key order lets each search start where the last one ended
+    order = np.argsort(keys)
+    ordered = keys[order]
+    positions = np.searchsorted(sorted_keys, ordered)
+    hit = positions < sorted_keys.size
+    hit[hit] = sorted_keys[positions[hit]] == ordered[hit]
+    found = np.empty_like(hit)
+    found[order] = hit
+    return found
+
+
+class PackedCodeIndex:
+    """Set of license codes packed into a sorted uint64 array.
+
+    A 10 character [0-9A-Za-z] code fits in 60 bits, so a million codes take
+    8MB instead of the ~90MB of a set of str. Lookups binary-search the
+    array. Codes added or removed since the last merge sit in small Python
+    sets and are folded into a new array once merge_threshold of them
+    accumulate, so single inserts do not copy the whole array.
+    """
+
+    def __init__(self, keys: Optional[np.ndarray] = None, merge_threshold: int = 4096, presorted: bool = False):
+        self.merge_threshold = merge_threshold
+        if keys is None:
+            keys = np.empty(0, dtype=np.uint64)
+        keys = keys[keys != INVALID_KEY]
+        self._keys = keys if presorted else np.unique(keys)
+        self._added: set = set()
+        self._removed: set = set()
+        self._lock = threading.Lock()
+        self.merges = 0
+
+    @classmethod
+    def from_codes(cls, license_codes: Iterable[str], merge_threshold: int = 4096,
+                   chunk_size: int = 100000) -> 'PackedCodeIndex':
+        """Build an index from any number of codes, encoding chunk_size at a time"""
+        chunks, chunk = [], []
+        for code in license_codes:
+            chunk.append(code)
+            if len(chunk) == chunk_size:
+                chunks.append(encode_codes(chunk))
+                chunk = []
+        chunks.append(encode_codes(chunk))
+        return cls(np.concatenate(chunks), merge_threshold)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._keys.size + len(self._added) - len(self._removed)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._keys.nbytes
+
+    def add(self, license_code: str) -> bool:
+        """Add a code; False if it cannot be packed"""
+        key = encode_code(license_code)
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._removed:
+                self._removed.discard(key)
+            elif not _members(np.array([key], dtype=np.uint64), self._keys)[0]:
+                self._added.add(key)
+            needs_merge = len(self._added) >= self.merge_threshold
+        if needs_merge:
+            self.merge()
+        return True
+
+    def discard(self, license_code: str):
+        """Remove a code if it is present"""
+        key = encode_code(license_code)
+        if key is None:
+            return
+        with self._lock:
+            if key in self._added:
+                self._added.discard(key)
+            elif _members(np.array([key], dtype=np.uint64), self._keys)[0]:
+                self._removed.add(key)
+            needs_merge = len(self._removed) >= self.merge_threshold
+        if needs_merge:
+            self.merge()
+
+    def merge(self):
+        """Fold pending additions and removals into a new sorted array"""
+        with self._lock:
+            keys = self._keys
+            if self._removed:
+                removed = np.fromiter(self._removed, dtype=np.uint64, count=len(self._removed))
+                keys = keys[~np.isin(keys, removed, assume_unique=True)]
+            if self._added:
+                added = np.sort(np.fromiter(self._added, dtype=np.uint64, count=len(self._added)))
+                keys = np.insert(keys, np.searchsorted(keys, added), added)
+            self._keys = keys
+            self._added = set()
+            self._removed = set()
+            self.merges += 1
+
+    def __contains__(self, license_code: str) -> bool:
+        key = encode_code(license_code)
+        if key is None:
+            return False
+        with self._lock:
+            if key in self._added:
+                return True
+            if key in self._removed:
+                return False
+            keys = self._keys
+        # A Python int would promote the whole array to float64 for the comparison
+        key = np.uint64(key)
+        position = keys.searchsorted(key)
+        return bool(position < keys.size and keys[position] == key)
+
+    def contains_many(self, license_codes: Sequence[str]) -> np.ndarray:
+        """Boolean array saying which of license_codes are in the index"""
+        return self.contains_keys(encode_codes(license_codes))
+
+    def contains_keys(self, keys: np.ndarray) -> np.ndarray:
+        """Boolean array saying which of the packed keys are in the index"""
+        with self._lock:
+            sorted_keys = self._keys
+            added = np.fromiter(self._added, dtype=np.uint64, count=len(self._added))
+            removed = np.fromiter(self._removed, dtype=np.uint64, count=len(self._removed))
+        found = _members(keys, sorted_keys)
+        if removed.size:
+            found &= ~np.isin(keys, removed)
+        if added.size:
+            found |= np.isin(keys, added)
+        return found
+
+
+class LicenseCodeIndex:
+    """Singleton PackedCodeIndex of the codes in the shared license snapshot.
+
+    Used to answer batch validity checks in one vectorized pass. The index
+    is rebuilt in the background from each new snapshot generation, and it
+    only answers while it matches a snapshot that covers every committed
+    change (see LicenseSnapshot.covering). Until then, and for codes that
+    cannot be packed, callers look the codes up instead.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LicenseCodeIndex, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, 'initialized'):
+            self.settings = LicenseIndexSettings()
+            # Snapshot generation and the index built from it, swapped together
+            self._built: Optional[Tuple[int, PackedCodeIndex]] = None
+            self._building = False
+            self._lock = threading.Lock()
+            self.answered = 0
+            self.deferred = 0
+            self.builds = 0
+            self.initialized = True
+
+    @property
+    def generation(self) -> Optional[int]:
+        built = self._built
+        return built[0] if built else None
+
+    def sync(self, snapshot: MappedSnapshot):
+        """Start rebuilding from snapshot in the background unless already built from it or building"""
+        with self._lock:
+            if not self.settings.enabled or self._building or self.generation == snapshot.generation:
+                return
+            self._building = True
+        threading.Thread(target=self._build, args=(snapshot,), daemon=True).start()
+
+    def _build(self, snapshot: MappedSnapshot):
+        try:
+            started = time.perf_counter()
+            with snapshot.code_bytes() as buffer:
+                # Codes in the snapshot are already sorted and distinct, and pack in the same order
+                index = PackedCodeIndex(encode_code_bytes(buffer), self.settings.merge_threshold, presorted=True)
+            self._built = (snapshot.generation, index)
+            self.builds += 1
+            logger.info(f"License index built from snapshot generation {snapshot.generation} with "
+                        f"{len(index)} codes in {(time.perf_counter() - started) * 1000:.0f}ms")
+        except Exception as e:
+            logger.error(f"Failed to build the license index from the license snapshot: {e}")
+        finally:
+            self._building = False
+
+    def lookup_many(self, license_codes: Sequence[str],
+                    snapshot: Optional[MappedSnapshot]) -> List[Optional[bool]]:
+        """Whether each of license_codes is issued, or None where the index cannot tell.
+        snapshot is the covering snapshot, or None if there is none."""
+        built = self._built
+        if not self.settings.enabled or snapshot is None or built is None or built[0] != snapshot.generation:
+            if snapshot is not None:
+                self.sync(snapshot)
+            self.deferred += len(license_codes)
+            return [None] * len(license_codes)
+        keys = encode_codes(license_codes)
+        answers: List[Optional[bool]] = built[1].contains_keys(keys).tolist()
+        # The snapshot may hold codes outside the packed alphabet
+        for position in np.flatnonzero(keys == INVALID_KEY).tolist():
+            answers[position] = None
+        unpackable = answers.count(None)
+        self.answered += len(answers) - unpackable
+        self.deferred += unpackable
+        return answers
+
+    def stats(self) -> Dict[str, Any]:
+        built = self._built
+        if not self.settings.enabled or built is None:
+            return {'enabled': self.settings.enabled, 'ready': False, 'building': self._building}
+        generation, index = built
+        return {
+            'enabled': True,
+            'ready': True,
+            'building': self._building,
+            'generation': generation,
+            'codes': len(index),
+            'size_bytes': index.size_bytes,
+            'builds': self.builds,
+            'answered': self.answered,
+            'deferred': self.deferred
+        }
+
+
+def get_license_index() -> LicenseCodeIndex:
+    """Get the license code index instance"""
+    return LicenseCodeIndex()
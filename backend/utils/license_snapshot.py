@@ -0,0 +1,402 @@
+import os
+import mmap
+import atexit
+import time
+import bisect
+import struct
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+from pydantic import BaseModel
+from utils.metrics import get_metrics
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers in different processes are not serialized
+    fcntl = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MAGIC = b'VPLS'
+FORMAT_VERSION = 1
+CODE_WIDTH = 10
+# magic, format version, code width, code count, generation, build start (unix time)
+HEADER = struct.Struct('<4sHHQQd')
+# Contents of <path>.changes: when the latest change to the licenses table was committed (unix time)
+CHANGE_RECORD = struct.Struct('<d')
+
+
+class LicenseSnapshotSettings(BaseModel):
+    """Tunables for the memory-mapped license code snapshot"""
+    enabled: bool = os.getenv('LICENSE_SNAPSHOT_ENABLED', 'true').lower() == 'true'
+    # Defaults to <database path>.snapshot
+    path: str = os.getenv('LICENSE_SNAPSHOT_PATH', '')
+    # Changes within this window are folded into one rebuild
+    debounce_seconds: float = float(os.getenv('LICENSE_SNAPSHOT_DEBOUNCE_SECONDS', '1'))
+    # Rebuilds read every code, so they are spaced out at least this far on a busy server
+    min_interval_seconds: float = float(os.getenv('LICENSE_SNAPSHOT_MIN_INTERVAL_SECONDS', '5'))
+    # How often readers check whether another process swapped in a new file
+    reload_check_seconds: float = float(os.getenv('LICENSE_SNAPSHOT_RELOAD_CHECK_SECONDS', '0.2'))
+    # A change still missing from the snapshot this long after it was committed is rebuilt by
+    # whichever process notices, in case the process that made it died before rebuilding
+    stale_rebuild_seconds: float = float(os.getenv('LICENSE_SNAPSHOT_STALE_REBUILD_SECONDS', '30'))
+
+
+class SnapshotFormatError(Exception):
+    """Raised when a snapshot file is truncated or was written by another format version"""
+
+
+class _SortedCodes:
+    """Sequence view of the fixed-width codes in a mapped snapshot, for bisect"""
+
+    def __init__(self, buffer: mmap.mmap, count: int):
+        self._buffer = buffer
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        start = HEADER.size + index * CODE_WIDTH
+        return self._buffer[start:start + CODE_WIDTH]
+
+
+class MappedSnapshot:
+    """One snapshot file mapped read-only into this process"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.inode = (stat.st_dev, stat.st_ino)
+            if stat.st_size < HEADER.size:
+                raise SnapshotFormatError(f"{path} is too short to be a snapshot")
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, self.count, self.generation, self.built_at = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or version != FORMAT_VERSION or width != CODE_WIDTH:
+            raise SnapshotFormatError(f"{path} is not a version {FORMAT_VERSION} license snapshot")
+        if len(self._buffer) != HEADER.size + self.count * CODE_WIDTH:
+            raise SnapshotFormatError(f"{path} is truncated")
+        self.size_bytes = len(self._buffer)
+        self._codes = _SortedCodes(self._buffer, self.count)
+
+    def code_bytes(self) -> memoryview:
+        """The sorted codes, CODE_WIDTH bytes each, as a view of the mapping"""
+        return memoryview(self._buffer)[HEADER.size:]
+
+    def __contains__(self, license_code: str) -> bool:
+        try:
+            key = license_code.encode('ascii')
+        except UnicodeEncodeError:
+            return False
+        if len(key) != CODE_WIDTH:
+            return False
+        index = bisect.bisect_left(self._codes, key)
+        return index < self.count and self._codes[index] == key
+
+
+def read_generation(path: str) -> int:
+    """Generation of the snapshot at path, or 0 if there is no readable one"""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, _, _, generation, _ = HEADER.unpack(f.read(HEADER.size))
+        return generation if magic == MAGIC and version == FORMAT_VERSION else 0
+    except (OSError, struct.error):
+        return 0
+
+
+def write_snapshot(path: str, sorted_codes: Iterable[str], built_at: float) -> Dict[str, int]:
+    """Write sorted_codes to a new snapshot file and swap it in for path.
+
+    The generation is one more than the current file's. Writers hold an
+    exclusive lock on path + '.lock', so two processes never claim the same
+    generation, and os.replace makes the swap atomic for readers. Codes that
+    are not CODE_WIDTH ASCII characters cannot be stored and are skipped.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(f"{path}.lock", 'a+b') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        generation = read_generation(path) + 1
+        count = skipped = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(bytes(HEADER.size))
+                batch = []
+                for code in sorted_codes:
+                    key = code.encode('utf-8')
+                    if len(key) != CODE_WIDTH or not key.isascii():
+                        skipped += 1
+                        continue
+                    batch.append(key)
+                    if len(batch) == 10000:
+                        f.write(b''.join(batch))
+                        count += len(batch)
+                        batch = []
+                f.write(b''.join(batch))
+                count += len(batch)
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, FORMAT_VERSION, CODE_WIDTH, count, generation, built_at))
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return {'generation': generation, 'codes': count, 'skipped': skipped}
+
+
+class LicenseSnapshot:
+    """Sorted, memory-mapped array of every issued license code, shared by all workers.
+
+    Every uvicorn worker maps the same read-only file, so the page cache
+    holds one copy for all of them and a lookup is a binary search over the
+    mapping with no database access. After a change through LicenseRepository
+    the file is rebuilt from the licenses table (debounced) and atomically
+    replaced; readers notice the new file within reload_check_seconds.
+
+    Every change committed through LicenseRepository also records its time
+    in <path>.changes, which every process maps too. The snapshot answers a
+    lookup, yes or no, only while it was built after the latest change;
+    otherwise lookup returns None and callers ask the cache or database.
+    So an answer is never staler than the change record, in any process.
+    """
+
+    def __init__(self, settings: Optional[LicenseSnapshotSettings] = None, path: Optional[str] = None):
+        self.settings = settings or LicenseSnapshotSettings()
+        self.path = path or self.settings.path
+        self._loader: Optional[Callable[[], Iterable[str]]] = None
+        self._snapshot: Optional[MappedSnapshot] = None
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._schedule_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._last_build_finished = 0.0
+        # Codes deleted by this process, with when, until a snapshot built after that loads
+        self._removed: Dict[str, float] = {}
+        self._removed_lock = threading.Lock()
+        self._changes: Optional[mmap.mmap] = None
+        self._changes_fd: Optional[int] = None
+        self._changes_lock = threading.Lock()
+        self.answered = 0
+        self.deferred = 0
+        self.rebuilds = 0
+        self.reloads = 0
+        self.metrics = get_metrics()
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled and bool(self.path)
+
+    def start(self, loader: Callable[[], Iterable[str]]):
+        """Map the current snapshot and schedule a rebuild with loader, which
+        must yield every issued code in ascending byte order"""
+        if not self.enabled or self._loader is not None:
+            return
+        self._loader = loader
+        # Short-lived writers such as db/import_users.py exit before the debounce timer fires
+        atexit.register(self.flush)
+        self._reload()
+        current = self._snapshot
+        # A snapshot written moments ago by another worker starting up is fresh enough
+        if (current is None or time.time() - current.built_at > self.settings.min_interval_seconds
+                or not self._covers_changes(current)):
+            self.schedule_rebuild()
+
+    def _reload(self):
+        """Map the file at path if it is not the one already mapped"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        current = self._snapshot
+        if current is not None and current.inode == (stat.st_dev, stat.st_ino):
+            return
+        try:
+            snapshot = MappedSnapshot(self.path)
+        except (OSError, ValueError, SnapshotFormatError) as e:
+            logger.error(f"Could not map license snapshot {self.path}: {e}")
+            return
+        if current is not None and snapshot.generation <= current.generation:
+            return
+        # The old mapping is closed when the last lookup using it lets go of it
+        self._snapshot = snapshot
+        with self._removed_lock:
+            self._removed = {code: removed_at for code, removed_at in self._removed.items()
+                             if removed_at >= snapshot.built_at}
+        self.reloads += 1
+        self.metrics.license_snapshot_generation.labels().set(snapshot.generation)
+        self.metrics.license_snapshot_codes.labels().set(snapshot.count)
+
+    def _current(self) -> Optional[MappedSnapshot]:
+        now = time.monotonic()
+        if now >= self._next_check and self._check_lock.acquire(blocking=False):
+            try:
+                self._next_check = now + self.settings.reload_check_seconds
+                self._reload()
+            finally:
+                self._check_lock.release()
+        return self._snapshot
+
+    def _open_changes(self) -> Optional[mmap.mmap]:
+        if self._changes is None:
+            with self._changes_lock:
+                if self._changes is None:
+                    try:
+                        fd = os.open(f"{self.path}.changes", os.O_RDWR | os.O_CREAT, 0o644)
+                        try:
+                            # Extends a new file with zeros and leaves a written one alone
+                            if os.fstat(fd).st_size < CHANGE_RECORD.size:
+                                os.ftruncate(fd, CHANGE_RECORD.size)
+                            self._changes = mmap.mmap(fd, CHANGE_RECORD.size, access=mmap.ACCESS_READ)
+                        except (OSError, ValueError):
+                            os.close(fd)
+                            raise
+                        self._changes_fd = fd
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Could not open license change record {self.path}.changes: {e}")
+        return self._changes
+
+    def _covers_changes(self, snapshot: MappedSnapshot) -> bool:
+        changes = self._open_changes()
+        return changes is not None and CHANGE_RECORD.unpack_from(changes)[0] < snapshot.built_at
+
+    def covering(self) -> Optional[MappedSnapshot]:
+        """The mapped snapshot if it includes every committed change, otherwise None"""
+        if not self.enabled:
+            return None
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        if self._covers_changes(snapshot):
+            return snapshot
+        changes = self._changes
+        if changes is not None and time.time() - CHANGE_RECORD.unpack_from(changes)[0] > \
+                self.settings.stale_rebuild_seconds:
+            self.schedule_rebuild()
+        return None
+
+    def lookup(self, license_code: str) -> Optional[bool]:
+        """Whether license_code is issued, or None if the snapshot cannot tell because it is
+        disabled, not built yet, or older than a committed change"""
+        snapshot = self.covering()
+        if snapshot is None:
+            self.deferred += 1
+            return None
+        self.answered += 1
+        return license_code in snapshot and license_code not in self._removed
+
+    def changed(self):
+        """Record that a change to the licenses table was just committed, so no process
+        trusts an older snapshot, and schedule a rebuild that includes it"""
+        if not self.enabled:
+            return
+        if self._open_changes() is not None:
+            # The thread lock orders this process's writers; flock orders the other processes
+            with self._changes_lock:
+                try:
+                    if fcntl:
+                        fcntl.flock(self._changes_fd, fcntl.LOCK_EX)
+                    try:
+                        previous = CHANGE_RECORD.unpack(os.pread(self._changes_fd, CHANGE_RECORD.size, 0))[0]
+                        os.pwrite(self._changes_fd, CHANGE_RECORD.pack(max(previous, time.time())), 0)
+                    finally:
+                        if fcntl:
+                            fcntl.flock(self._changes_fd, fcntl.LOCK_UN)
+                except OSError as e:
+                    logger.error(f"Could not record license change in {self.path}.changes: {e}")
+        self.schedule_rebuild()
+
+    def removed(self, license_code: Optional[str]):
+        """Record that license_code was deleted"""
+        if not self.enabled or not license_code:
+            return
+        # Also kept in memory, so this process stops trusting it even if the change record cannot be written
+        with self._removed_lock:
+            self._removed[license_code] = time.time()
+        self.changed()
+
+    def schedule_rebuild(self):
+        """Rebuild after the debounce window, folding in any changes made meanwhile"""
+        if not self.enabled or self._loader is None:
+            return
+        with self._schedule_lock:
+            if self._timer is not None:
+                return
+            since_last = time.monotonic() - self._last_build_finished
+            delay = max(self.settings.debounce_seconds, self.settings.min_interval_seconds - since_last)
+            self._timer = threading.Timer(delay, self._scheduled_rebuild)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Run a scheduled rebuild now instead of waiting for its timer"""
+        with self._schedule_lock:
+            timer, self._timer = self._timer, None
+        if timer is None:
+            # A rebuild the timer already started is waited for, so exiting does not cut it short
+            with self._build_lock:
+                return
+        timer.cancel()
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.error(f"License snapshot rebuild failed: {e}")
+
+    def _scheduled_rebuild(self):
+        with self._schedule_lock:
+            self._timer = None
+        try:
+            self.rebuild()
+        except Exception as e:
+            logger.error(f"License snapshot rebuild failed: {e}")
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Write a new snapshot from the loader now and map it"""
+        if not self.enabled or self._loader is None:
+            raise RuntimeError("License snapshot is not enabled")
+        with self._build_lock:
+            started = time.perf_counter()
+            # Recorded before reading, so changes made during the read are not assumed to be in it
+            built_at = time.time()
+            result = write_snapshot(self.path, self._loader(), built_at)
+            self._last_build_finished = time.monotonic()
+            self.rebuilds += 1
+            self._reload()
+        result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        if result['skipped']:
+            logger.warning(f"License snapshot skipped {result['skipped']} codes that are not "
+                           f"{CODE_WIDTH} ASCII characters")
+        logger.info(f"License snapshot generation {result['generation']} written with "
+                    f"{result['codes']} codes in {result['elapsed_ms']}ms")
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if not self.enabled or snapshot is None:
+            return {'enabled': self.enabled, 'ready': False}
+        return {
+            'enabled': True,
+            'ready': True,
+            'path': self.path,
+            'generation': snapshot.generation,
+            'codes': snapshot.count,
+            'size_bytes': snapshot.size_bytes,
+            'built_at': snapshot.built_at,
+            'pending_removals': len(self._removed),
+            'covers_changes': self._covers_changes(snapshot),
+            'answered': self.answered,
+            'deferred': self.deferred,
+            'rebuilds': self.rebuilds,
+            'reloads': self.reloads
+        }
+
+
+_license_snapshot: Optional[LicenseSnapshot] = None
+
+
+def get_license_snapshot(default_path: str = '') -> LicenseSnapshot:
+    """Get the process-wide license snapshot; default_path is used if no path is configured"""
+    global _license_snapshot
+    if _license_snapshot is None:
+        _license_snapshot = LicenseSnapshot(path=LicenseSnapshotSettings().path or default_path)
+    return _license_snapshot
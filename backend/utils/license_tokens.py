@@ -0,0 +1,117 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+from typing import Any, Dict, Optional
+from pydantic import BaseModel
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class LicenseTokenSettings(BaseModel):
+    """Signing keys for offline license tokens.
+
+    LICENSE_TOKEN_KEYS holds comma separated ``key_id:secret`` pairs. New tokens
+    are signed with LICENSE_TOKEN_ACTIVE_KEY_ID (the first key by default);
+    tokens signed with any other listed key keep verifying, so a key can be
+    rotated by adding the new key, switching the active id, and removing the
+    old key once its tokens have expired. The secrets must never be shipped
+    to clients, since they can sign tokens as well as verify them.
+    """
+    signing_keys: str = os.getenv('LICENSE_TOKEN_KEYS', '')
+    active_key_id: str = os.getenv('LICENSE_TOKEN_ACTIVE_KEY_ID', '')
+    ttl_days: int = int(os.getenv('LICENSE_TOKEN_TTL_DAYS', '365'))
+
+
+# Claims every token must carry, with their types
+REQUIRED_CLAIMS = {'lid': str, 'cmp': str, 'iat': int, 'exp': int}
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+class LicenseTokenSigner:
+    """Issues and verifies compact HMAC-SHA256 signed license tokens.
+
+    A token looks like ``<key_id>.<payload>.<signature>`` where the payload is
+    base64url encoded JSON with the license id (``lid``), company (``cmp``),
+    issue time (``iat``) and expiry (``exp``) as unix timestamps. Verifying a
+    token needs only the signing key, never the database, so a token stays
+    valid until it expires even if the license is deleted in the meantime.
+
+    HMAC keys are symmetric: whoever can verify a token can also forge one.
+    The keys therefore stay on the server and clients verify tokens through
+    POST /verify-token; a desktop client cannot check them offline.
+    """
+
+    def __init__(self, settings: Optional[LicenseTokenSettings] = None):
+        self.settings = settings or LicenseTokenSettings()
+        self.keys: Dict[str, bytes] = {}
+        for pair in self.settings.signing_keys.split(','):
+            key_id, _, secret = pair.strip().partition(':')
+            if key_id and secret:
+                self.keys[key_id] = secret.encode('utf-8')
+        self.active_key_id = self.settings.active_key_id or next(iter(self.keys), '')
+        if self.keys and self.active_key_id not in self.keys:
+            raise ValueError(f"Active license token key id {self.active_key_id!r} is not in LICENSE_TOKEN_KEYS")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    def _sign(self, key_id: str, payload: str) -> str:
+        message = f"{key_id}.{payload}".encode('ascii')
+        return _b64encode(hmac.new(self.keys[key_id], message, hashlib.sha256).digest())
+
+    def issue(self, license_id: str, company_name: str, issued_at: Optional[int] = None) -> Optional[str]:
+        """Issue a signed token for a license, or None if no signing key is configured"""
+        if not self.enabled:
+            return None
+        issued_at = int(issued_at if issued_at is not None else time.time())
+        claims = {
+            'lid': license_id,
+            'cmp': company_name,
+            'iat': issued_at,
+            'exp': issued_at + self.settings.ttl_days * 86400
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f"{self.active_key_id}.{payload}.{self._sign(self.active_key_id, payload)}"
+
+    def verify(self, token: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Return the token claims if the signature is valid and the token has not expired"""
+        try:
+            key_id, payload, signature = token.split('.')
+        except (AttributeError, ValueError):
+            return None
+        if key_id not in self.keys:
+            logger.warning(f"License token signed with unknown key id: {key_id}")
+            return None
+        try:
+            # Compared as bytes: compare_digest raises TypeError for non-ASCII str
+            if not hmac.compare_digest(signature.encode('ascii'), self._sign(key_id, payload).encode('ascii')):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except (UnicodeError, ValueError, TypeError):
+            return None
+        if not isinstance(claims, dict) or not all(
+                isinstance(claims.get(name), kind) and not isinstance(claims.get(name), bool)
+                for name, kind in REQUIRED_CLAIMS.items()):
+            logger.warning(f"Validly signed license token with malformed claims, key id: {key_id}")
+            return None
+        if claims['exp'] <= (now if now is not None else time.time()):
+            return None
+        return claims
+
+
+def get_license_token_signer() -> LicenseTokenSigner:
+    """Get a license token signer configured from the environment"""
+    return LicenseTokenSigner()
@@ -0,0 +1,367 @@
+import os
+import time
+import bisect
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from pydantic import BaseModel
+from starlette.routing import Match
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds; DB queries are mostly sub-millisecond
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+EXTERNAL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Starlette appends "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Route label for requests that match no route, so unknown paths cannot grow the label set
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class MetricsSettings(BaseModel):
+    """Settings for the in-process Prometheus metrics"""
+    enabled: bool = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """A metric family with one child per combination of label values"""
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """The child for these label values, created on first use"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in self._children.items()]
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild(self._lock)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in self._children.items()]
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, plus their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self.buckets)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', '_buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, lock: threading.Lock, buckets: Tuple[float, ...]):
+        self._lock = lock
+        self._buckets = buckets
+        # One slot per bucket plus +Inf; made cumulative when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class MetricsRegistry:
+    """Collection of metric families rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> Any:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = HTTP_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class ServerMetrics:
+    """The metrics the license server records, in one registry.
+
+    HTTP metrics are labelled with the route template (/user/{email}, not the
+    requested path) so label cardinality stays bounded. DB, SMTP and Stripe
+    timings are recorded where those calls are made.
+    """
+
+    def __init__(self, settings: Optional[MetricsSettings] = None):
+        self.settings = settings or MetricsSettings()
+        self.registry = MetricsRegistry()
+        registry = self.registry
+        self.http_requests = registry.counter(
+            'http_requests_total', 'HTTP requests by route template and status code',
+            ('method', 'route', 'status'))
+        self.http_errors = registry.counter(
+            'http_request_errors_total', 'HTTP requests that failed with a 5xx status or an unhandled exception',
+            ('method', 'route'))
+        self.http_duration = registry.histogram(
+            'http_request_duration_seconds', 'Time from receiving a request to sending the end of its response',
+            ('method', 'route'), HTTP_BUCKETS)
+        self.http_in_progress = registry.gauge(
+            'http_requests_in_progress', 'HTTP requests currently being handled', ('method', 'route'))
+        self.db_queries = registry.histogram(
+            'db_query_duration_seconds', 'SQLite statement execution time by statement type',
+            ('operation',), DB_BUCKETS)
+        self.db_errors = registry.counter(
+            'db_query_errors_total', 'SQLite statements that raised', ('operation',))
+        self.smtp_operations = registry.histogram(
+            'smtp_operation_duration_seconds', 'SMTP connect and send time by outcome',
+            ('operation', 'outcome'), EXTERNAL_BUCKETS)
+        self.stripe_requests = registry.histogram(
+            'stripe_request_duration_seconds', 'Stripe API call time by operation and outcome',
+            ('operation', 'outcome'), EXTERNAL_BUCKETS)
+        self.stripe_rejections = registry.counter(
+            'stripe_breaker_rejections_total', 'Stripe calls refused while the circuit breaker was open',
+            ('operation',))
+        self.license_snapshot_generation = registry.gauge(
+            'license_snapshot_generation', 'Generation of the license snapshot this process has mapped')
+        self.license_snapshot_codes = registry.gauge(
+            'license_snapshot_codes', 'License codes in the mapped license snapshot')
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+def statement_operation(statement: str) -> str:
+    """Statement type used as the operation label, e.g. 'select' or 'insert'"""
+    keyword = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ''
+    if keyword in ('select', 'insert', 'update', 'delete', 'with', 'pragma', 'begin', 'commit', 'rollback'):
+        return keyword
+    return 'other'
+
+
+def instrument_engine(engine, metrics: Optional['ServerMetrics'] = None):
+    """Time every statement the engine executes"""
+    from sqlalchemy import event
+
+    metrics = metrics or get_metrics()
+    if not metrics.enabled:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        metrics.db_queries.labels(statement_operation(statement)).observe(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def count_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_started'):
+            conn.info['query_started'].pop()
+        statement = exception_context.statement or ''
+        metrics.db_errors.labels(statement_operation(statement)).inc()
+
+
+def route_template(scope) -> str:
+    """The path template of the route that will handle the request, e.g. /user/{email}.
+
+    Resolved with the same matching the router uses, before the router runs,
+    and kept in the scope so later middleware does not match again.
+    """
+    template = scope.get('route_template')
+    if template is None:
+        template = UNMATCHED_ROUTE
+        partial = None
+        for route in scope['app'].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                template = getattr(route, 'path', UNMATCHED_ROUTE)
+                break
+            if match == Match.PARTIAL and partial is None:
+                partial = getattr(route, 'path', UNMATCHED_ROUTE)
+        else:
+            template = partial or UNMATCHED_ROUTE
+        scope['route_template'] = template
+    return template
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting and timing every HTTP request per route template.
+
+    The route is resolved up front, so the in-progress gauge can be labelled
+    while the request is running.
+    """
+
+    def __init__(self, app, metrics: Optional[ServerMetrics] = None):
+        self.app = app
+        self.metrics = metrics or get_metrics()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        route = route_template(scope)
+        in_progress = self.metrics.http_in_progress.labels(method, route)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        in_progress.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            in_progress.dec()
+            self.metrics.http_duration.labels(method, route).observe(time.perf_counter() - started)
+            self.metrics.http_requests.labels(method, route, str(status)).inc()
+            if status >= 500:
+                self.metrics.http_errors.labels(method, route).inc()
+
+
+_metrics: Optional[ServerMetrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> ServerMetrics:
+    """Get the process-wide server metrics"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = ServerMetrics()
+        return _metrics
@@ -0,0 +1,73 @@
+import os
+from typing import Any, Dict, Optional
+from pydantic import BaseModel
+from sqlalchemy import select
+from utils.cache import TTLCache, SingleFlight, MISSING
+from utils.db_utils import DatabaseManager, PaymentSession
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class PaymentSessionSettings(BaseModel):
+    """Tunables for the in-memory cache of completed checkout sessions"""
+    max_size: int = int(os.getenv('PAYMENT_SESSION_CACHE_MAX_SIZE', '10000'))
+    ttl_seconds: float = float(os.getenv('PAYMENT_SESSION_CACHE_TTL', '86400'))
+
+
+class PaymentSessionStore:
+    """Outcomes of completed checkout sessions, so the success page can reload freely.
+
+    Outcomes are written to the payment_sessions table in the same transaction
+    that creates the license key and queues its email (see
+    LicenseRepository.create_and_set_license_key), and read through an LRU in
+    front of that table. Unknown sessions are not cached, since they are
+    about to be completed. `single_flight` collapses concurrent completions of
+    the same session into one Stripe call.
+    """
+
+    def __init__(self, settings: Optional[PaymentSessionSettings] = None):
+        self.settings = settings or PaymentSessionSettings()
+        self.db_manager = DatabaseManager()
+        self.cache = TTLCache(max_size=self.settings.max_size, ttl_seconds=self.settings.ttl_seconds,
+                              negative_ttl_seconds=0)
+        self.single_flight = SingleFlight()
+
+    def cached_outcome(self, session_id: str) -> Any:
+        """Return the cached outcome for a session, or MISSING"""
+        return self.cache.get(session_id)
+
+    def get_outcome(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the recorded outcome for a session, or None if it was never completed"""
+        outcome = self.cache.get(session_id)
+        if outcome is not MISSING:
+            return outcome
+        query = select(PaymentSession.email, PaymentSession.license_code, PaymentSession.status) \
+            .where(PaymentSession.session_id == session_id)
+        with self.db_manager.get_connection() as connection:
+            row = connection.execute(query).first()
+        if row is None:
+            return None
+        outcome = dict(row._mapping)
+        self.cache.set(session_id, outcome)
+        return outcome
+
+    def remember(self, session_id: str, outcome: Dict[str, Any]):
+        """Cache the outcome of a session that was just completed"""
+        self.cache.set(session_id, outcome)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache and single-flight counters"""
+        return {'cache': self.cache.stats(), 'single_flight': self.single_flight.stats()}
+
+
+_store: Optional[PaymentSessionStore] = None
+
+
+def get_payment_session_store() -> PaymentSessionStore:
+    """Get the process-wide payment session store"""
+    global _store
+    if _store is None:
+        _store = PaymentSessionStore()
+    return _store
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pydantic import BaseModel
+from starlette.datastructures import MutableHeaders
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Statements are cut to this length in logs and summaries
+STATEMENT_PREVIEW_CHARS = 200
+
+
+class QueryProfilerSettings(BaseModel):
+    """Settings for per-request SQL profiling, meant for debugging"""
+    enabled: bool = os.getenv('SQL_PROFILER_ENABLED', 'false').lower() == 'true'
+    slow_query_ms: float = float(os.getenv('SQL_PROFILER_SLOW_QUERY_MS', '50'))
+    # A statement run this many times in one request, whatever its parameters, looks like N+1
+    repeat_threshold: int = int(os.getenv('SQL_PROFILER_REPEAT_THRESHOLD', '5'))
+
+
+def _preview(statement: str) -> str:
+    statement = ' '.join(statement.split())
+    if len(statement) > STATEMENT_PREVIEW_CHARS:
+        return statement[:STATEMENT_PREVIEW_CHARS] + '...'
+    return statement
+
+
+class QueryProfile:
+    """Statements executed while handling one request.
+
+    Repository calls run in worker threads, but anyio copies the context into
+    them, so their queries are attributed to the request that made them.
+    """
+
+    def __init__(self, settings: Optional[QueryProfilerSettings] = None):
+        self.settings = settings or QueryProfilerSettings()
+        self.query_count = 0
+        self.total_seconds = 0.0
+        self.statements: Counter = Counter()
+        self.executions: Counter = Counter()
+        self.slow_queries: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, parameters: Any, elapsed: float):
+        with self._lock:
+            self.query_count += 1
+            self.total_seconds += elapsed
+            self.statements[statement] += 1
+            self.executions[(statement, repr(parameters))] += 1
+            if elapsed * 1000 >= self.settings.slow_query_ms:
+                self.slow_queries.append((statement, elapsed))
+
+    @property
+    def total_ms(self) -> float:
+        return round(self.total_seconds * 1000, 3)
+
+    def duplicates(self) -> List[Tuple[str, int]]:
+        """Statements run more than once with the same parameters; the later runs were redundant"""
+        return [(statement, count) for (statement, _), count in self.executions.items() if count > 1]
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        """Statements run at least repeat_threshold times, the usual sign of a query in a loop"""
+        return [(statement, count) for statement, count in self.statements.items()
+                if count >= self.settings.repeat_threshold]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'queries': self.query_count,
+            'total_ms': self.total_ms,
+            'duplicates': [{'statement': _preview(s), 'count': c} for s, c in self.duplicates()],
+            'repeated': [{'statement': _preview(s), 'count': c} for s, c in self.repeated()],
+            'slow': [{'statement': _preview(s), 'ms': round(e * 1000, 3)} for s, e in self.slow_queries],
+        }
+
+    def log_findings(self, label: str):
+        """Log a warning for every redundant, repeated or slow statement"""
+        for statement, count in self.duplicates():
+            logger.warning(f"{label}: ran {count} times with the same parameters: {_preview(statement)}")
+        for statement, count in self.repeated():
+            logger.warning(f"{label}: ran {count} times, possible N+1: {_preview(statement)}")
+        for statement, elapsed in self.slow_queries:
+            logger.warning(f"{label}: slow query took {elapsed * 1000:.1f}ms: {_preview(statement)}")
+
+
+_current_profile: ContextVar[Optional[QueryProfile]] = ContextVar('query_profile', default=None)
+
+
+@contextmanager
+def profile_queries(settings: Optional[QueryProfilerSettings] = None) -> Iterator[QueryProfile]:
+    """Attribute the queries run inside the block, in this context, to a new QueryProfile"""
+    profile = QueryProfile(settings)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+def profile_engine(engine):
+    """Record the engine's statements in the active QueryProfile; a no-op when none is active"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        if profile is not None:
+            profile.record(statement, parameters, time.perf_counter() - conn.info['profile_started'].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def discard_timer(exception_context):
+        conn = exception_context.connection
+        if _current_profile.get() is not None and conn is not None and conn.info.get('profile_started'):
+            conn.info['profile_started'].pop()
+
+
+class QueryProfilerMiddleware:
+    """ASGI middleware profiling the SQL of every HTTP request.
+
+    Adds X-DB-Queries and X-DB-Time (milliseconds) headers to each response
+    and logs redundant, repeated and slow statements once the response is
+    sent. Queries made by a streaming response after its headers have gone
+    out are logged but not counted in the headers.
+    """
+
+    def __init__(self, app, settings: Optional[QueryProfilerSettings] = None):
+        self.app = app
+        self.settings = settings or QueryProfilerSettings()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message['type'] == 'http.response.start':
+                headers = MutableHeaders(scope=message)
+                headers.append('X-DB-Queries', str(profile.query_count))
+                headers.append('X-DB-Time', f"{profile.total_ms:.3f}")
+            await send(message)
+
+        with profile_queries(self.settings) as profile:
+            try:
+                await self.app(scope, receive, send_with_headers)
+            finally:
+                profile.log_findings(f"{scope['method']} {scope['path']}")
@@ -0,0 +1,294 @@
+import os
+import math
+import time
+import sqlite3
+import tempfile
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+from starlette.routing import compile_path
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Unauthenticated endpoints that look licenses up by code, and so can be used to guess codes.
+# /license-token also issues a token to anyone who knows a code, without authentication.
+DEFAULT_LIMITED_ROUTES = ('/check_license/{license_code}, /check_licenses, '
+                          '/license-token/{license_code}, /api-key/by-license/{license_key}')
+
+
+class RateLimitSettings(BaseModel):
+    """Tunables for the per-client rate limit on license lookup endpoints"""
+    enabled: bool = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    # Sustained requests per second, and the burst allowed on top, per client IP and route
+    rate_per_second: float = float(os.getenv('RATE_LIMIT_PER_SECOND', '5'))
+    burst: float = float(os.getenv('RATE_LIMIT_BURST', '20'))
+    # Batch endpoints also take one token per license code, from a separate bucket per client IP
+    codes_per_second: float = float(os.getenv('RATE_LIMIT_CODES_PER_SECOND', '100'))
+    code_burst: float = float(os.getenv('RATE_LIMIT_CODE_BURST', '10000'))
+    routes: str = os.getenv('RATE_LIMIT_ROUTES', DEFAULT_LIMITED_ROUTES)
+    # 'memory' limits each worker process on its own; 'sqlite' shares buckets between the processes on a host
+    backend: str = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    sqlite_path: str = os.getenv('RATE_LIMIT_SQLITE_PATH',
+                                 os.path.join(tempfile.gettempdir(), 'visionpay_rate_limits.db'))
+    stripes: int = int(os.getenv('RATE_LIMIT_STRIPES', '64'))
+    cleanup_interval_seconds: float = float(os.getenv('RATE_LIMIT_CLEANUP_INTERVAL', '60'))
+    # Only enable behind a proxy that sets X-Forwarded-For; clients can forge it otherwise
+    trust_forwarded_for: bool = os.getenv('RATE_LIMIT_TRUST_FORWARDED_FOR', 'false').lower() == 'true'
+
+    @property
+    def route_templates(self) -> List[str]:
+        return [route.strip() for route in self.routes.split(',') if route.strip()]
+
+
+class MemoryTokenBuckets:
+    """Token buckets in this process, split across lock stripes.
+
+    A key hashes to one of ``stripes`` dicts, each with its own lock, so
+    requests from different clients rarely wait on each other. Each stripe
+    drops its idle buckets every cleanup interval: a bucket untouched for
+    burst / rate seconds has refilled completely, so forgetting it changes
+    nothing.
+    """
+
+    def __init__(self, stripes: int = 64, cleanup_interval_seconds: float = 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        # key -> [tokens, updated_at, seconds until full]
+        self._buckets: List[Dict[str, list]] = [{} for _ in range(stripes)]
+        self._swept_at = [clock()] * stripes
+        self.removed = 0
+
+    def acquire(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Take cost tokens from key's bucket. Returns 0 if they were taken,
+        otherwise the seconds until the bucket will hold enough."""
+        index = zlib.crc32(key.encode()) % len(self._locks)
+        now = self._clock()
+        with self._locks[index]:
+            buckets = self._buckets[index]
+            if now - self._swept_at[index] >= self.cleanup_interval_seconds:
+                self._sweep(index, now)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = [burst, now, burst / rate]
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                return 0.0
+            bucket[0] = tokens
+            return (cost - tokens) / rate
+
+    def _sweep(self, index: int, now: float):
+        buckets = self._buckets[index]
+        idle = [key for key, (_, updated_at, refill) in buckets.items() if now - updated_at >= refill]
+        for key in idle:
+            del buckets[key]
+        self.removed += len(idle)
+        self._swept_at[index] = now
+
+    def cleanup(self) -> int:
+        """Drop every idle bucket now and return how many were dropped"""
+        removed = self.removed
+        now = self._clock()
+        for index, lock in enumerate(self._locks):
+            with lock:
+                self._sweep(index, now)
+        return self.removed - removed
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for buckets in self._buckets)
+
+
+class SQLiteTokenBuckets:
+    """Token buckets in a SQLite file, shared by every worker process on the host.
+
+    Each acquire is one BEGIN IMMEDIATE transaction of a few microseconds, so
+    processes take turns on the file lock. It runs on the event loop, as a
+    thread hop would cost far more than the transaction; lock_timeout bounds
+    how long it can stall there, after which the request is let through. The
+    file holds nothing worth keeping across a crash, so it runs with
+    synchronous=OFF. Idle rows are deleted every cleanup interval.
+    """
+
+    def __init__(self, path: str, cleanup_interval_seconds: float = 60, lock_timeout: float = 0.05,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        # Wall clock, since monotonic clocks are not comparable between processes everywhere
+        self._clock = clock
+        self._local = threading.local()
+        self._swept_at = clock()
+        self.removed = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, refill_seconds REAL NOT NULL"
+                ") WITHOUT ROWID")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections are not safe to share
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            self._local.connection = connection
+        return connection
+
+    def acquire(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Take cost tokens from key's bucket. Returns 0 if they were taken,
+        otherwise the seconds until the bucket will hold enough."""
+        connection = self._connection()
+        now = self._clock()
+        if now - self._swept_at >= self.cleanup_interval_seconds:
+            self._swept_at = now
+            self.cleanup()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            connection.execute(
+                "INSERT INTO rate_limit_buckets(key, tokens, updated_at, refill_seconds) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now, burst / rate))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return 0.0 if allowed else (cost - tokens) / rate
+
+    def cleanup(self) -> int:
+        """Delete every idle bucket now and return how many were deleted"""
+        removed = self._connection().execute(
+            "DELETE FROM rate_limit_buckets WHERE updated_at + refill_seconds <= ?", (self._clock(),)).rowcount
+        self.removed += removed
+        return removed
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM rate_limit_buckets").fetchone()[0]
+
+
+def create_token_buckets(settings: RateLimitSettings):
+    """The bucket store selected by settings.backend"""
+    if settings.backend == 'memory':
+        return MemoryTokenBuckets(settings.stripes, settings.cleanup_interval_seconds)
+    if settings.backend == 'sqlite':
+        return SQLiteTokenBuckets(settings.sqlite_path, settings.cleanup_interval_seconds)
+    raise ValueError(f"Unknown rate limit backend: {settings.backend}")
+
+
+class RateLimiter:
+    """Per client IP and route rate limit for the configured routes"""
+
+    def __init__(self, settings: Optional[RateLimitSettings] = None, buckets=None):
+        self.settings = settings or RateLimitSettings()
+        self.buckets = buckets or create_token_buckets(self.settings)
+        self.routes: List[Tuple[Pattern, str]] = [
+            (compile_path(template)[0], template) for template in self.settings.route_templates]
+        self.allowed = 0
+        self.limited = 0
+
+    def route_for(self, path: str) -> Optional[str]:
+        """The limited route template path falls under, or None"""
+        for pattern, template in self.routes:
+            if pattern.match(path):
+                return template
+        return None
+
+    def client_ip(self, scope) -> str:
+        if self.settings.trust_forwarded_for:
+            for name, value in scope['headers']:
+                if name == b'x-forwarded-for':
+                    return value.decode('latin-1').split(',')[0].strip()
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    def check(self, scope) -> float:
+        """0 if the request may proceed, otherwise the seconds the client should wait"""
+        route = self.route_for(scope['path'])
+        if route is None:
+            return 0.0
+        return self._acquire(f"{self.client_ip(scope)} {route}", self.settings.rate_per_second,
+                             self.settings.burst)
+
+    def check_codes(self, scope, count: int) -> float:
+        """Like check, for a batch of count license codes. Charged one token per code, so
+        a batch cannot check more codes than the same client could one request at a time."""
+        if not self.settings.enabled or count == 0:
+            return 0.0
+        return self._acquire(f"{self.client_ip(scope)} license codes", self.settings.codes_per_second,
+                             self.settings.code_burst, count)
+
+    def _acquire(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        try:
+            retry_after = self.buckets.acquire(key, rate, burst, cost)
+        except sqlite3.Error as e:
+            # Fail open: a broken shared store should not take license checks down with it
+            logger.error(f"Rate limit store error, allowing request: {e}")
+            return 0.0
+        if retry_after:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'enabled': self.settings.enabled,
+            'backend': self.settings.backend,
+            'rate_per_second': self.settings.rate_per_second,
+            'burst': self.settings.burst,
+            'codes_per_second': self.settings.codes_per_second,
+            'code_burst': self.settings.code_burst,
+            'routes': self.settings.route_templates,
+            'allowed': self.allowed,
+            'limited': self.limited,
+            'buckets': len(self.buckets),
+            'idle_buckets_removed': self.buckets.removed
+        }
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with Retry-After once a client's bucket is empty.
+
+    Runs before routing, so a limited request never reaches the handler or
+    the repository. Batch endpoints read the body first, so they charge
+    their codes themselves with RateLimiter.check_codes.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None):
+        self.app = app
+        self.limiter = limiter or get_rate_limiter()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and self.limiter.settings.enabled:
+            retry_after = self.limiter.check(scope)
+            if retry_after:
+                response = JSONResponse({"detail": "Too many requests"}, status_code=429,
+                                        headers={"Retry-After": str(math.ceil(retry_after))})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -0,0 +1,256 @@
+import os
+import json
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from pydantic import BaseModel
+from sqlalchemy import select, update, func, or_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from utils.db_utils import DatabaseManager, LicenseRepository, StripeEvent, get_license_repository
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class StripeEventSettings(BaseModel):
+    """Tunables for the background Stripe event processor"""
+    workers: int = int(os.getenv('STRIPE_EVENTS_WORKERS', '1'))
+    max_attempts: int = int(os.getenv('STRIPE_EVENTS_MAX_ATTEMPTS', '8'))
+    backoff_seconds: float = float(os.getenv('STRIPE_EVENTS_BACKOFF_SECONDS', '10'))
+    max_backoff_seconds: float = float(os.getenv('STRIPE_EVENTS_MAX_BACKOFF_SECONDS', '3600'))
+    poll_seconds: float = float(os.getenv('STRIPE_EVENTS_POLL_SECONDS', '5'))
+    # An event stuck in 'processing' this long belongs to a worker that died
+    claim_timeout_seconds: float = float(os.getenv('STRIPE_EVENTS_CLAIM_TIMEOUT_SECONDS', '300'))
+
+
+class StripeEventProcessor:
+    """Ledger of verified Stripe webhook events and the threads that apply them.
+
+    The webhook only records the raw event, keyed by Stripe's event id, and
+    acknowledges it. A redelivered event hits the primary key and is counted as
+    a duplicate instead of being queued again. Worker threads claim pending
+    events one at a time with a single UPDATE and apply them; the license a
+    checkout creates is committed in the same transaction that marks the event
+    processed, so an event is applied exactly once even if a worker dies.
+    Failed events are retried with backoff and marked failed after
+    max_attempts; replay() puts any event back in the queue.
+    """
+
+    def __init__(self, settings: Optional[StripeEventSettings] = None,
+                 repository: Optional[LicenseRepository] = None,
+                 on_license_email: Optional[Callable[[], None]] = None):
+        self.settings = settings or StripeEventSettings()
+        self.db_manager = DatabaseManager()
+        self.repository = repository or get_license_repository()
+        # Called after a checkout queued a license email, to wake the outbox workers
+        self.on_license_email = on_license_email
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            'checkout.session.completed': self._handle_checkout_completed,
+            'customer.subscription.deleted': self._handle_subscription_deleted,
+        }
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+
+    def start(self):
+        """Start the worker threads"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.settings.workers):
+            thread = threading.Thread(target=self._run, name=f"stripe-events-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.settings.workers} Stripe event workers")
+
+    def stop(self, timeout: float = 10):
+        """Ask the workers to finish their current event and exit"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers because a new event was recorded"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                processed = self.process_one()
+            except Exception as e:
+                logger.error(f"Stripe event worker error: {e}")
+                processed = False
+            if not processed:
+                self._wakeup.wait(self.settings.poll_seconds)
+                self._wakeup.clear()
+
+    def record(self, event_id: str, event_type: str, payload: str) -> bool:
+        """Store a verified event. Returns False if Stripe already delivered it."""
+        statement = (
+            sqlite_insert(StripeEvent)
+            .values(id=event_id, type=event_type, payload=payload, status='pending', attempts=0,
+                    deliveries=1, next_attempt_at=datetime.utcnow(), received_at=datetime.utcnow(),
+                    updated_at=datetime.utcnow())
+            .on_conflict_do_update(index_elements=[StripeEvent.id],
+                                   set_={'deliveries': StripeEvent.deliveries + 1})
+            .returning(StripeEvent.deliveries)
+        )
+        with self.db_manager.get_connection() as connection:
+            deliveries = connection.execute(statement).scalar_one()
+            connection.commit()
+        if deliveries > 1:
+            self.duplicates += 1
+            logger.info(f"Ignoring duplicate delivery {deliveries} of Stripe event {event_id}")
+            return False
+        return True
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically claim the oldest due event, or return None if nothing is due"""
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=self.settings.claim_timeout_seconds)
+        due = select(StripeEvent.id).where(or_(
+            and_(StripeEvent.status == 'pending', StripeEvent.next_attempt_at <= now),
+            and_(StripeEvent.status == 'processing', StripeEvent.claimed_at < stale_before)
+        )).order_by(StripeEvent.received_at).limit(1).scalar_subquery()
+        claim = (
+            update(StripeEvent)
+            .where(StripeEvent.id == due)
+            .values(status='processing', claimed_at=now, attempts=StripeEvent.attempts + 1, updated_at=now)
+            .returning(StripeEvent.id, StripeEvent.type, StripeEvent.payload, StripeEvent.attempts)
+        )
+        with self.db_manager.get_connection() as connection:
+            row = connection.execute(claim).first()
+            connection.commit()
+        return dict(row._mapping) if row else None
+
+    def process_one(self) -> bool:
+        """Claim and apply one event. Returns False if nothing was due."""
+        event = self.claim_next()
+        if not event:
+            return False
+
+        handler = self.handlers.get(event['type'])
+        if handler is None:
+            self._finish(event['id'], status='ignored')
+            return True
+
+        try:
+            handler(event)
+            error = None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        if error is None:
+            self.processed += 1
+        elif event['attempts'] >= self.settings.max_attempts:
+            self._finish(event['id'], status='failed', error=error)
+            self.failed += 1
+            logger.error(f"Giving up on Stripe event {event['id']} after {event['attempts']} attempts: {error}")
+        else:
+            delay = self.backoff_delay(event['attempts'])
+            self._finish(event['id'], status='pending', error=error,
+                         next_attempt_at=datetime.utcnow() + timedelta(seconds=delay))
+            logger.warning(f"Stripe event {event['id']} failed (attempt {event['attempts']}), "
+                           f"retrying in {delay:.0f}s: {error}")
+        return True
+
+    def _handle_checkout_completed(self, event: Dict[str, Any]):
+        session = json.loads(event['payload'])['data']['object']
+        user_email = session['metadata']['user_email']
+        company_name = session['metadata'].get('company_name')
+        logger.info(f"Processing successful payment for {user_email}")
+
+        # Marks the event processed in the same transaction as the license key
+        license_key = self.repository.create_and_set_license_key(
+            user_email, enqueue_email=True, stripe_event_id=event['id'])
+        if not license_key:
+            raise RuntimeError(f"Failed to create license key for {user_email}")
+        if self.on_license_email:
+            self.on_license_email()
+        logger.info(f"License key {license_key} created for {user_email} ({company_name}), email queued")
+
+    def _handle_subscription_deleted(self, event: Dict[str, Any]):
+        subscription = json.loads(event['payload'])['data']['object']
+        logger.info(f"Subscription cancelled for customer {subscription['customer']}")
+        self._finish(event['id'], status='processed')
+
+    def backoff_delay(self, attempts: int) -> float:
+        """Exponential backoff with +/-20% jitter"""
+        delay = min(self.settings.max_backoff_seconds, self.settings.backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _finish(self, event_id: str, status: str, error: Optional[str] = None,
+                next_attempt_at: Optional[datetime] = None):
+        now = datetime.utcnow()
+        values = {'status': status, 'last_error': error[:500] if error else None, 'updated_at': now}
+        if status in ('processed', 'ignored'):
+            values['processed_at'] = now
+        if next_attempt_at:
+            values['next_attempt_at'] = next_attempt_at
+        with self.db_manager.get_connection() as connection:
+            connection.execute(update(StripeEvent).where(StripeEvent.id == event_id).values(**values))
+            connection.commit()
+
+    def replay(self, event_id: str) -> bool:
+        """Queue an event to be applied again, whatever its status. Returns False if it is unknown."""
+        with self.db_manager.get_connection() as connection:
+            result = connection.execute(
+                update(StripeEvent).where(StripeEvent.id == event_id)
+                .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow(),
+                        updated_at=datetime.utcnow()))
+            connection.commit()
+        self.notify()
+        return result.rowcount > 0
+
+    def replay_failed(self) -> int:
+        """Move every failed event back to pending with a fresh attempt budget"""
+        with self.db_manager.get_connection() as connection:
+            result = connection.execute(
+                update(StripeEvent).where(StripeEvent.status == 'failed')
+                .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow(),
+                        updated_at=datetime.utcnow()))
+            connection.commit()
+        self.notify()
+        return result.rowcount
+
+    def list_events(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recently received events, optionally filtered by status, without payloads"""
+        query = select(StripeEvent.id, StripeEvent.type, StripeEvent.status, StripeEvent.attempts,
+                       StripeEvent.deliveries, StripeEvent.last_error, StripeEvent.received_at,
+                       StripeEvent.processed_at)
+        if status:
+            query = query.where(StripeEvent.status == status)
+        query = query.order_by(StripeEvent.received_at.desc()).limit(limit)
+        with self.db_manager.get_connection() as connection:
+            return [dict(row._mapping) for row in connection.execute(query)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return event counts per status and worker counters"""
+        with self.db_manager.get_connection() as connection:
+            rows = connection.execute(
+                select(StripeEvent.status, func.count()).group_by(StripeEvent.status)).all()
+        return {
+            'by_status': {status: count for status, count in rows},
+            'workers': len(self._threads),
+            'processed': self.processed,
+            'failed': self.failed,
+            'duplicates': self.duplicates
+        }
+
+
+_processor: Optional[StripeEventProcessor] = None
+
+
+def get_stripe_event_processor() -> StripeEventProcessor:
+    """Get the process-wide Stripe event processor"""
+    global _processor
+    if _processor is None:
+        _processor = StripeEventProcessor()
+    return _processor
@@ -0,0 +1,236 @@
+import os
+import time
+import asyncio
+import threading
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+from pydantic import BaseModel
+import stripe
+from utils.metrics import get_metrics
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class StripeGatewaySettings(BaseModel):
+    """Thread pool, timeout and circuit breaker settings for Stripe API calls"""
+    threads: int = int(os.getenv('STRIPE_GATEWAY_THREADS', '8'))
+    timeout_seconds: float = float(os.getenv('STRIPE_TIMEOUT_SECONDS', '10'))
+    # Consecutive failures that open the breaker
+    failure_threshold: int = int(os.getenv('STRIPE_BREAKER_FAILURE_THRESHOLD', '5'))
+    # How long the breaker stays open before letting a trial call through
+    reset_seconds: float = float(os.getenv('STRIPE_BREAKER_RESET_SECONDS', '30'))
+    # Alternative API base, e.g. a local fake Stripe server
+    api_base: Optional[str] = os.getenv('STRIPE_API_BASE')
+
+
+class StripeUnavailableError(Exception):
+    """Raised when a Stripe call times out or the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    closed: calls go through. After failure_threshold consecutive failures it
+    opens and calls fail fast. After reset_seconds it is half-open: one trial
+    call goes through, and its outcome closes or reopens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        """Whether a call may be made now"""
+        return self.admit() is not None
+
+    def admit(self) -> Optional[str]:
+        """'call' or 'trial' if a call may be made now, None if not"""
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return 'call'
+            if state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return 'trial'
+            return None
+
+    def abandon(self, admitted: str):
+        """Forget a call that ended without an outcome, e.g. because it was cancelled.
+        An abandoned half-open trial frees the slot for the next call."""
+        if admitted == 'trial':
+            with self._lock:
+                self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = self.clock()
+                self.times_opened += 1
+                logger.warning(f"Stripe circuit breaker opened after {self.failures} consecutive failures")
+            self.trial_in_flight = False
+
+
+class LatencyStats:
+    """Call counters and latency percentiles over the most recent calls"""
+
+    def __init__(self, window: int = 1000):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, error: bool = False, timeout: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.samples.append(seconds)
+            self.errors += error
+            self.timeouts += timeout
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self.samples)
+            stats = {'calls': self.calls, 'errors': self.errors, 'timeouts': self.timeouts,
+                     'rejected': self.rejected}
+        for name, fraction in (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            stats[name] = round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2) \
+                if ordered else None
+        return stats
+
+
+def _is_outage(error: Exception) -> bool:
+    """Errors that mean Stripe is degraded, as opposed to a bad request"""
+    if isinstance(error, (stripe.error.APIConnectionError, stripe.error.RateLimitError)):
+        return True
+    if isinstance(error, stripe.error.StripeError):
+        return error.http_status is None or error.http_status >= 500
+    return True
+
+
+class StripeGateway:
+    """Runs blocking Stripe SDK calls off the event loop.
+
+    Calls go to a bounded thread pool and are awaited with a per-call timeout.
+    Timeouts and server-side errors feed a circuit breaker; while it is open,
+    calls raise StripeUnavailableError immediately instead of tying up threads
+    on a degraded API. StripeErrors caused by the request itself are raised
+    unchanged so endpoints can report them.
+    """
+
+    def __init__(self, settings: Optional[StripeGatewaySettings] = None):
+        self.settings = settings or StripeGatewaySettings()
+        self.executor = ThreadPoolExecutor(max_workers=self.settings.threads, thread_name_prefix="stripe")
+        self.breaker = CircuitBreaker(self.settings.failure_threshold, self.settings.reset_seconds)
+        self.latency: Dict[str, LatencyStats] = {}
+        self.metrics = get_metrics()
+        if self.settings.api_base:
+            stripe.api_base = self.settings.api_base
+        # Bound the HTTP request as well, so a timed-out call frees its thread
+        stripe.default_http_client = stripe.RequestsClient(timeout=self.settings.timeout_seconds)
+
+    def _stats(self, operation: str) -> LatencyStats:
+        if operation not in self.latency:
+            self.latency[operation] = LatencyStats()
+        return self.latency[operation]
+
+    async def call(self, operation: str, func: Callable, *args, **kwargs) -> Any:
+        """Run a Stripe SDK function on the gateway's threads"""
+        stats = self._stats(operation)
+        admitted = self.breaker.admit()
+        if admitted is None:
+            stats.reject()
+            self.metrics.stripe_rejections.labels(operation).inc()
+            raise StripeUnavailableError("Stripe is unavailable, please try again shortly")
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs)),
+                timeout=self.settings.timeout_seconds)
+        except asyncio.TimeoutError:
+            elapsed = time.perf_counter() - started
+            stats.observe(elapsed, error=True, timeout=True)
+            self.metrics.stripe_requests.labels(operation, 'timeout').observe(elapsed)
+            self.breaker.record_failure()
+            logger.error(f"Stripe {operation} timed out after {self.settings.timeout_seconds}s")
+            raise StripeUnavailableError(f"Stripe {operation} timed out")
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            stats.observe(elapsed, error=True)
+            self.metrics.stripe_requests.labels(operation, 'error').observe(elapsed)
+            if _is_outage(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        except BaseException:
+            # Cancelled, e.g. the client went away; Stripe's answer is unknown
+            self.breaker.abandon(admitted)
+            raise
+        elapsed = time.perf_counter() - started
+        stats.observe(elapsed)
+        self.metrics.stripe_requests.labels(operation, 'ok').observe(elapsed)
+        self.breaker.record_success()
+        return result
+
+    async def create_checkout_session(self, **params) -> Any:
+        """Create a Stripe checkout session"""
+        return await self.call('checkout_session_create', stripe.checkout.Session.create, **params)
+
+    async def retrieve_checkout_session(self, session_id: str) -> Any:
+        """Retrieve a Stripe checkout session"""
+        return await self.call('checkout_session_retrieve', stripe.checkout.Session.retrieve, session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return breaker state and per-operation latency"""
+        return {
+            'breaker': {'state': self.breaker.state, 'consecutive_failures': self.breaker.failures,
+                        'times_opened': self.breaker.times_opened},
+            'operations': {name: stats.snapshot() for name, stats in self.latency.items()}
+        }
+
+
+_gateway: Optional[StripeGateway] = None
+
+
+def get_stripe_gateway() -> StripeGateway:
+    """Get the process-wide Stripe gateway"""
+    global _gateway
+    if _gateway is None:
+        _gateway = StripeGateway()
+    return _gateway
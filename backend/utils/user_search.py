@@ -0,0 +1,183 @@
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from utils.db_utils import DatabaseManager, License, license_row_to_dict
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMNS = ('email', 'first_name', 'last_name', 'company_name')
+# Pull words out of the query the same way the unicode61 tokenizer splits indexed text
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# External-content FTS5 index over the licenses table, keyed by its rowid.
+# Prefix indexes on 2 and 3 characters keep short "starts with" queries cheap.
+CREATE_INDEX = """
+CREATE VIRTUAL TABLE licenses_fts USING fts5(
+    email, first_name, last_name, company_name,
+    content='licenses', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+)
+"""
+
+# Keep the index in step with every write to licenses, whoever makes it
+CREATE_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS licenses_fts_insert AFTER INSERT ON licenses BEGIN
+        INSERT INTO licenses_fts(rowid, email, first_name, last_name, company_name)
+        VALUES (new.rowid, new.email, new.first_name, new.last_name, new.company_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS licenses_fts_delete AFTER DELETE ON licenses BEGIN
+        INSERT INTO licenses_fts(licenses_fts, rowid, email, first_name, last_name, company_name)
+        VALUES ('delete', old.rowid, old.email, old.first_name, old.last_name, old.company_name);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS licenses_fts_update
+    AFTER UPDATE OF email, first_name, last_name, company_name ON licenses BEGIN
+        INSERT INTO licenses_fts(licenses_fts, rowid, email, first_name, last_name, company_name)
+        VALUES ('delete', old.rowid, old.email, old.first_name, old.last_name, old.company_name);
+        INSERT INTO licenses_fts(rowid, email, first_name, last_name, company_name)
+        VALUES (new.rowid, new.email, new.first_name, new.last_name, new.company_name);
+    END
+    """,
+)
+
+# bm25 has to score every match before the best can be picked, so only the newest
+# :candidates matches are ranked; FTS5 walks them in rowid order and stops early
+SEARCH_QUERY = text("""
+SELECT licenses.* FROM (
+    SELECT rowid, rank FROM licenses_fts WHERE licenses_fts MATCH :match
+    ORDER BY rowid DESC LIMIT :candidates
+) AS hits JOIN licenses ON licenses.rowid = hits.rowid
+ORDER BY hits.rank
+LIMIT :limit OFFSET :offset
+""").columns(*License.__table__.columns)
+
+
+class UserSearchSettings(BaseModel):
+    """Tunables for the admin user search index"""
+    enabled: bool = os.getenv('USER_SEARCH_ENABLED', 'true').lower() == 'true'
+    # bm25 weights for email, first_name, last_name and company_name
+    weights: str = os.getenv('USER_SEARCH_WEIGHTS', '10.0, 5.0, 5.0, 2.0')
+    max_terms: int = int(os.getenv('USER_SEARCH_MAX_TERMS', '8'))
+    # Matches ranked per query; broader queries rank their newest matches only
+    max_candidates: int = int(os.getenv('USER_SEARCH_MAX_CANDIDATES', '2000'))
+
+
+class UserSearchUnavailableError(Exception):
+    """Raised when the search index is disabled or SQLite was built without FTS5"""
+
+
+class UserSearch:
+    """Ranked prefix search over user emails, names and companies.
+
+    The licenses_fts FTS5 table indexes the licenses table as external
+    content, so it stores only the inverted index, and triggers update it in
+    the same transaction as every insert, update and delete on licenses. Each
+    word of a query matches as a prefix, so "jo acm" finds John at Acme, and
+    results are ordered by bm25 with email matches weighted highest. A query
+    matching more than max_candidates users ranks only the newest of them,
+    which keeps very common words from scoring the whole index.
+
+    The index refers to licenses by rowid, which VACUUM may renumber because
+    licenses has a text primary key; run rebuild() after a VACUUM.
+    """
+
+    def __init__(self, settings: Optional[UserSearchSettings] = None):
+        self.settings = settings or UserSearchSettings()
+        self.db_manager = DatabaseManager()
+        self.available = False
+        self.searches = 0
+        if self.settings.enabled:
+            self.ensure_index()
+        else:
+            self.drop_index()
+
+    def ensure_index(self):
+        """Create the index and its triggers if they are missing, filling it from licenses"""
+        try:
+            with self.db_manager.get_connection() as connection:
+                exists = connection.exec_driver_sql(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'licenses_fts'").first()
+                if not exists:
+                    started = time.perf_counter()
+                    connection.exec_driver_sql(CREATE_INDEX)
+                    connection.exec_driver_sql("INSERT INTO licenses_fts(licenses_fts) VALUES ('rebuild')")
+                    logger.info(f"Built user search index in {time.perf_counter() - started:.2f}s")
+                for trigger in CREATE_TRIGGERS:
+                    connection.exec_driver_sql(trigger)
+                connection.execute(text("INSERT INTO licenses_fts(licenses_fts, rank) VALUES ('rank', :rank)"),
+                                   {'rank': f"bm25({self.settings.weights})"})
+                connection.commit()
+            self.available = True
+        except OperationalError as e:
+            # e.g. "no such module: fts5"
+            logger.error(f"User search is unavailable: {e}")
+            self.available = False
+
+    def drop_index(self):
+        """Remove the index and its triggers, so writes to licenses stop paying for them"""
+        with self.db_manager.get_connection() as connection:
+            for trigger in ('licenses_fts_insert', 'licenses_fts_delete', 'licenses_fts_update'):
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            connection.exec_driver_sql("DROP TABLE IF EXISTS licenses_fts")
+            connection.commit()
+        self.available = False
+
+    def rebuild(self) -> Dict[str, Any]:
+        """Re-index every license from scratch"""
+        if not self.available:
+            raise UserSearchUnavailableError("User search is not available")
+        started = time.perf_counter()
+        with self.db_manager.get_connection() as connection:
+            connection.exec_driver_sql("INSERT INTO licenses_fts(licenses_fts) VALUES ('rebuild')")
+            connection.commit()
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(f"Rebuilt user search index in {elapsed_ms}ms")
+        return {'elapsed_ms': elapsed_ms}
+
+    def build_match(self, query: str, column: Optional[str] = None) -> Optional[str]:
+        """Turn free text into an FTS5 query matching every word as a prefix, or None if it has no words"""
+        if column is not None and column not in SEARCH_COLUMNS:
+            raise ValueError(f"column must be one of {', '.join(SEARCH_COLUMNS)}")
+        terms = TERM_PATTERN.findall(query)[:self.settings.max_terms]
+        if not terms:
+            return None
+        # Quoting makes every word a plain string, so FTS5 operators in the input have no effect
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return f"{column} : ({match})" if column else match
+
+    def search(self, query: str, column: Optional[str] = None, limit: int = 20,
+               offset: int = 0) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return up to limit users matching query, best first, and the offset of the
+        next page or None on the last page. Raises ValueError for an empty query or unknown column."""
+        if not self.available:
+            raise UserSearchUnavailableError("User search is not available")
+        match = self.build_match(query, column)
+        if match is None:
+            raise ValueError("Search query has no words")
+        with self.db_manager.get_connection() as connection:
+            rows = connection.execute(SEARCH_QUERY, {'match': match, 'candidates': self.settings.max_candidates,
+                                                     'limit': limit + 1, 'offset': offset}).all()
+        self.searches += 1
+        users = [license_row_to_dict(row) for row in rows[:limit]]
+        return users, offset + limit if len(rows) > limit else None
+
+
+_user_search: Optional[UserSearch] = None
+
+
+def get_user_search() -> UserSearch:
+    """Get the process-wide user search index"""
+    global _user_search
+    if _user_search is None:
+        _user_search = UserSearch()
+    return _user_search